@@ -40,5 +40,33 @@ Example (server):
     rpc.serve_forever()
 """
 
-from .sync import Server, XmlClient, XmlServer, JsonClient, JsonServer
-from .protocol import Fault
\ No newline at end of file
+import importlib
+
+# The classes are imported from their modules when first used, to keep the
+# startup of short-lived servers fast (see streamrpc.lazy)
+_EXPORTS = {
+    "Server": "sync", "XmlClient": "sync", "XmlServer": "sync", "JsonClient": "sync", "JsonServer": "sync",
+    "MsgPackClient": "sync", "MsgPackServer": "sync", "Peer": "sync", "XmlPeer": "sync", "JsonPeer": "sync",
+    "SocketServer": "net", "connect": "net",
+    "ClientPool": "pool",
+    "Fault": "protocol", "DEADLINE_EXCEEDED": "protocol", "SERVER_BUSY": "protocol",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        # A submodule, such as streamrpc.pool
+        try:
+            return importlib.import_module("." + name, __name__)
+        except ModuleNotFoundError as e:
+            if e.name != __name__ + "." + name:
+                raise
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
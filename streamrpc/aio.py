@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*
+#
+#   aio.py - asyncio clients and servers
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""asyncio clients and servers
+
+Example (client):
+-----------------
+
+    proc = await asyncio.create_subprocess_exec("ssh", "myserver", "python", "server.py",
+       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    rpc = streamrpc.aio.AsyncJsonClient(process=proc)
+    await rpc.my_method("Some", "Args")
+
+Example (server):
+-----------------
+
+    async def my_method(arg1, arg2):
+       ...
+
+    rpc = streamrpc.aio.AsyncServer()
+    rpc.register_function(my_method)
+    await rpc.serve_forever()
+"""
+
+import sys
+import asyncio
+import inspect
+from . import protocol
+from .sync import Method, Notify, Timed
+from .lazy import LazyModule
+traceback = LazyModule("traceback")
+
+__ALL__ = ["AsyncClient", "AsyncXmlClient", "AsyncJsonClient", "AsyncServer", "AsyncXmlServer", "AsyncJsonServer", "open_stdio"]
+
+READ_SIZE = 65536
+
+async def open_stdio():
+    """Returns a (reader, writer) stream pair connected to stdin and stdout"""
+    loop = asyncio.get_event_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, proto = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = asyncio.StreamWriter(transport, proto, reader, loop)
+    return reader, writer
+
+def _streams(reader, writer, process):
+    if process:
+        if reader or writer:
+            raise ValueError("Parameters reader, writer are mutually exclusive with process")
+        return process.stdout, process.stdin
+    return reader, writer
+
+class AsyncClient(object):
+    """Client base class. If timeout is set (seconds), calls raise
+    asyncio.TimeoutError if their result has not arrived by then, and the
+    server does not run them if they have waited for longer than that (see
+    streamrpc.Client). rpc.timeout(seconds).method(...) sets the timeout of a
+    single call."""
+    def __init__(self, protocol, reader=None, writer=None, process=None, timeout=None):
+        self.__reader, self.__writer = _streams(reader, writer, process)
+        if not self.__reader or not self.__writer:
+            raise ValueError("Both reader and writer must be set")
+        self.__protocol = protocol
+        self.__split = protocol.splitter()
+        self.__receiver = None
+        self.__timeout = timeout
+
+    def timeout(self, seconds):
+        """Makes a call with a timeout, as await rpc.timeout(seconds).method(...)"""
+        return Timed(self.__request, seconds)
+
+    async def __request(self, method, args, kwargs, timeout=None):
+        if timeout is None:
+            timeout = self.__timeout
+        future = asyncio.get_event_loop().create_future()
+
+        def on_response(response, err):
+            if future.done(): return
+            if err: future.set_exception(err)
+            else: future.set_result(response)
+
+        req = self.__protocol.initiate_request(method, args, kwargs, on_response, timeout=timeout)
+        self.__writer.write(req)
+        if self.__receiver is None:
+            self.__receiver = asyncio.ensure_future(self.__receive())
+        await self.__writer.drain()
+        if timeout is not None:
+            return await asyncio.wait_for(future, timeout)
+        return await future
+
+    @property
+    def notify(self):
+        """Sends notifications, as await rpc.notify.method(...), which returns
+        once the request is written"""
+        return Notify(self.__notify)
+
+    async def __notify(self, method, args, kwargs):
+        self.__writer.write(self.__protocol.initiate_notification(method, args, kwargs))
+        await self.__writer.drain()
+
+    async def __receive(self):
+        try:
+            while True:
+                data = await self.__reader.read(READ_SIZE)
+                if not data:
+                    raise EOFError("Connection closed")
+                for s in self.__split.feed(data):
+                    self.__protocol.handle_response(s)
+        except Exception:
+            self.__protocol.abort_requests(sys.exc_info()[1])
+        finally:
+            self.__receiver = None
+
+    async def close(self):
+        self.__writer.close()
+        if self.__receiver is not None:
+            self.__receiver.cancel()
+
+    def __getattr__(self, name):
+        return Method(self.__request, name)
+
+class AsyncXmlClient(AsyncClient):
+    def __init__(self, reader=None, writer=None, process=None, encoding=None, allow_none=True, use_datetime=0, timeout=None):
+        AsyncClient.__init__(self, protocol.XmlRpc(encoding, allow_none, use_datetime), reader, writer, process, timeout)
+
+class AsyncJsonClient(AsyncClient):
+    def __init__(self, reader=None, writer=None, process=None, version=2, codec=None, timeout=None):
+        AsyncClient.__init__(self, protocol.JsonRpc(version, codec), reader, writer, process, timeout)
+
+class AsyncServer(object):
+    """Server that can respond to both JSON-RPC and XML-RPC requests and will respond
+    with the protocol of the request. Requests are handled concurrently, and handlers
+    may be coroutine functions. If no streams are given, stdin/stdout are used.
+
+    Requests that have waited for longer than the timeout sent by the client
+    are not run (see streamrpc.Server). If max_queue is set, at most that many
+    requests are handled at a time, and further requests are answered at once
+    with a Fault with code SERVER_BUSY."""
+    def __init__(self, reader=None, writer=None, process=None, close=True, protocol=None, max_queue=None):
+        self.reader, self.writer = _streams(reader, writer, process)
+        self.__regs = []
+        self.__shouldclose = close
+        self.__protocol = protocol
+        self.__tasks = set()
+        self.__last = None
+        self.__max_queue = max_queue
+        self.__queued = 0
+
+    async def serve_forever(self):
+        if not self.reader or not self.writer:
+            self.reader, self.writer = await open_stdio()
+        try:
+            s = b""
+            while not self.__protocol:
+                s = await self.reader.read(1)
+                if not s:
+                    return
+                if s == b'<':
+                    self.__protocol = protocol.XmlRpc()
+                elif s in b'{[':
+                    self.__protocol = protocol.JsonRpc()
+            for method,a,kw in self.__regs:
+                getattr(self.__protocol, method)(*a, **kw)
+            self.__regs = []
+
+            split = self.__protocol.splitter(1024*1024*120)
+            while True:
+                for reqstr in split.feed(s):
+                    self.__start(self.__protocol.decode_request(reqstr))
+                s = await self.reader.read(READ_SIZE)
+                if not s:
+                    break
+            if self.__tasks:
+                await asyncio.wait(list(self.__tasks))
+        finally:
+            if self.__shouldclose:
+                self.writer.close()
+
+    def __start(self, call):
+        previous = self.__last if self.__protocol.ordered_responses else None
+        busy = self.__max_queue is not None and self.__queued >= self.__max_queue
+        if not busy:
+            self.__queued += 1
+        task = asyncio.ensure_future(self.__handle(call, previous, busy))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+        self.__last = task
+
+    async def __invoke(self, call):
+        ret = call.invoke()
+        if inspect.isawaitable(ret):
+            ret = await ret
+        return ret
+
+    async def __handle(self, call, previous, busy):
+        if busy:
+            response = call.respond(exc=protocol.Fault(protocol.SERVER_BUSY, "Server busy"))
+        else:
+            try:
+                if isinstance(call, protocol.BatchCall):
+                    ret = await asyncio.gather(*[self.__invoke(c) for c in call.calls], return_exceptions=True)
+                else:
+                    ret = await self.__invoke(call)
+                response = call.respond(ret)
+            except Exception:
+                response = call.respond(exc=sys.exc_info()[1])
+            finally:
+                self.__queued -= 1
+        if previous is not None:
+            await asyncio.wait([previous]) # Keep responses in request order
+        try:
+            for data in protocol.messages(response):
+                for part in (data if isinstance(data, protocol.Parts) else (data,)):
+                    self.writer.write(part)
+                    await self.writer.drain()
+        except (IOError, OSError):
+            raise
+        except Exception:
+            # Part of the response may be written, so it cannot be replaced
+            # by an error response (see streamrpc.chunked)
+            traceback.print_exc()
+            self.writer.close()
+
+    def register_function(self, *a, **kw):
+        if self.__protocol:
+            self.__protocol.register_function(*a, **kw)
+        else:
+            self.__regs.append(("register_function", a, kw))
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        if self.__protocol:
+            self.__protocol.register_instance(instance, name, namespaces)
+        else:
+            self.__regs.append(("register_instance", (instance, name, namespaces), {}))
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes cached responses (see streamrpc.Server.invalidate)"""
+        if self.__protocol:
+            self.__protocol.invalidate(name, *args, **kwargs)
+
+class AsyncXmlServer(AsyncServer):
+    """XML-RPC server"""
+    def __init__(self, reader=None, writer=None, process=None, close=True, encoding=None, allow_none=True, use_datetime=0, max_queue=None):
+        AsyncServer.__init__(self, reader, writer, process, close,
+            protocol=protocol.XmlRpc(encoding, allow_none, use_datetime), max_queue=max_queue)
+
+class AsyncJsonServer(AsyncServer):
+    """JSON-RPC server"""
+    def __init__(self, reader=None, writer=None, process=None, close=True, version=2, codec=None, max_queue=None):
+        AsyncServer.__init__(self, reader, writer, process, close,
+            protocol=protocol.JsonRpc(version, codec), max_queue=max_queue)
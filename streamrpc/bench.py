@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*
+#
+#   bench.py - Benchmarks
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Benchmarks
+
+Usage:
+------
+
+    python -m streamrpc.bench [--quick] [--output results.json] [--compare baseline.json]
+    python -m streamrpc.bench codec [--output results.json] [--compare baseline.json]
+
+Every combination of client (xml, json, msgpack) and transport is measured.
+The transports are pipe (a server process on stdin/stdout), socket (a
+SocketServer process on a TCP port on localhost) and, where fork is
+available, zygote (a server forked by a streamrpc.zygote for each relay
+process). These are measured:
+
+    import      time to import streamrpc and its Server class in a new
+                process, once for all clients and transports
+    startup     time from starting the server process to the first response,
+                kept apart from all other measurements
+    latency     sequential calls with a small argument (calls/sec, p50/p99)
+    pipelined   calls sent without waiting for the responses (calls/sec)
+    payload     echo of a string of each size, from a scalar up to 100 MB by
+                default (MB/s, counting the bytes in both directions, p50/p99)
+
+The codec benchmark instead measures the per-message encode and decode cost
+of each codec (see streamrpc.codec), without any transport.
+
+Results are printed and, with --output, saved as JSON along with the Python
+version and platform. With --compare, the calls/sec and MB/s of every result are compared
+with an earlier run, and the exit status is 1 if any of them got slower by
+more than --tolerance.
+"""
+
+import os, sys
+import json
+import time
+import timeit
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+
+__ALL__ = ["run", "bench_codec", "compare", "main"]
+
+CLIENTS = ("xml", "json", "msgpack")
+TRANSPORTS = ("pipe", "socket", "zygote") if hasattr(os, "fork") else ("pipe", "socket")
+SIZES = (8, 1024, 65536, 1024*1024, 16*1024*1024, 100*1024*1024)
+QUICK_SIZES = (8, 1024, 65536, 1024*1024)
+PAYLOAD_BYTES = 256*1024*1024 # Per payload size, at most this much is echoed...
+PAYLOAD_CALLS = 3             # ...but at least this many times
+
+def ping():
+    return True
+
+def echo(value):
+    return value
+
+def _setup(rpc):
+    rpc.register_function(ping)
+    rpc.register_function(echo)
+
+def _serve(transport):
+    import streamrpc
+    if transport == "socket":
+        rpc = streamrpc.SocketServer(("127.0.0.1", 0))
+    else:
+        rpc = streamrpc.Server()
+    _setup(rpc)
+    if transport == "socket":
+        sys.stdout.write("%d\n" % rpc.address[1])
+        sys.stdout.flush()
+    rpc.serve_forever()
+
+def _zygote(address):
+    import streamrpc.zygote
+    def ready():
+        sys.stdout.write("ready\n")
+        sys.stdout.flush()
+    streamrpc.zygote.serve(address, _setup, ready=ready)
+
+def _client_class(client):
+    import streamrpc
+    return {"xml": streamrpc.XmlClient, "json": streamrpc.JsonClient, "msgpack": streamrpc.MsgPackClient}[client]
+
+def _env():
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([root] + [p for p in [env.get("PYTHONPATH")] if p])
+    return env
+
+class _Zygote(object):
+    """A zygote process (see streamrpc.zygote) serving the benchmark functions"""
+    def __init__(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tempdir, "bench.sock")
+        self.process = subprocess.Popen([sys.executable, "-m", "streamrpc.bench", "zygote", self.address],
+            stdout=subprocess.PIPE, env=_env())
+        self.process.stdout.readline() # Ready
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+class _Endpoint(object):
+    """A server process (or, with a zygote, a relay to a forked server) and a
+    client connected to it"""
+    def __init__(self, client, transport, zygote=None):
+        import streamrpc
+        if transport == "zygote":
+            args = [sys.executable, "-m", "streamrpc.zygote", zygote.address]
+        else:
+            args = [sys.executable, "-m", "streamrpc.bench", "serve", transport]
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=_env())
+        if transport == "socket":
+            port = int(self.process.stdout.readline())
+            self.client = _client_class(client)(socket=streamrpc.connect(("127.0.0.1", port)))
+        else:
+            self.client = _client_class(client)(process=self.process)
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+        for f in (self.process.stdin, self.process.stdout):
+            try:
+                f.close()
+            except Exception:
+                pass
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def _timed(call, n):
+    times = []
+    start = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - t)
+    return time.perf_counter() - start, times
+
+def _result(client, transport, benchmark, calls, elapsed, times=None, payload=None):
+    r = {"client": client, "transport": transport, "benchmark": benchmark, "calls": calls,
+         "seconds": elapsed, "calls_per_sec": calls / elapsed if elapsed else None}
+    if times:
+        r["p50_ms"] = _percentile(times, 0.5) * 1000
+        r["p99_ms"] = _percentile(times, 0.99) * 1000
+    if payload is not None:
+        r["payload"] = payload
+        r["mb_per_sec"] = 2 * payload * calls / elapsed / 1e6 if elapsed else None
+    return r
+
+_IMPORT = "import time; t = time.perf_counter(); import streamrpc; streamrpc.Server; print(time.perf_counter() - t)"
+
+def _import(runs):
+    times = []
+    for i in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", _IMPORT], env=_env())
+        times.append(float(out))
+    return _result("-", "-", "import", runs, sum(times), times)
+
+def _startup(client, transport, runs, zygote=None):
+    times = []
+    for i in range(runs):
+        t = time.perf_counter()
+        ep = _Endpoint(client, transport, zygote)
+        try:
+            ep.client.ping()
+            times.append(time.perf_counter() - t)
+        finally:
+            ep.close()
+    return _result(client, transport, "startup", runs, sum(times), times)
+
+def _measure(client, transport, sizes, calls, zygote, add):
+    ep = _Endpoint(client, transport, zygote)
+    try:
+        rpc = ep.client
+        for i in range(min(calls, 100)): # Warm up
+            rpc.ping()
+        elapsed, times = _timed(lambda: rpc.echo(1), calls)
+        add(_result(client, transport, "latency", calls, elapsed, times))
+        start = time.perf_counter()
+        futures = [rpc.call_async("echo", i) for i in range(calls)]
+        for f in futures:
+            f.result()
+        add(_result(client, transport, "pipelined", calls, time.perf_counter() - start))
+        for size in sizes:
+            value = 1 if size <= 8 else "x" * size
+            n = max(PAYLOAD_CALLS, min(calls, PAYLOAD_BYTES // size))
+            elapsed, times = _timed(lambda: rpc.echo(value), n)
+            add(_result(client, transport, "payload", n, elapsed, times, size))
+    finally:
+        ep.close()
+
+def run(clients=CLIENTS, transports=TRANSPORTS, sizes=SIZES, calls=10000, startup_runs=5, log=None):
+    """Runs the benchmarks and returns the results as a list of dicts"""
+    results = []
+    def add(r):
+        results.append(r)
+        if log:
+            log(r)
+    add(_import(startup_runs))
+    for transport in transports:
+        zygote = _Zygote() if transport == "zygote" else None
+        try:
+            for client in clients:
+                add(_startup(client, transport, startup_runs, zygote))
+                _measure(client, transport, sizes, calls, zygote, add)
+        finally:
+            if zygote:
+                zygote.close()
+    return results
+
+class _LegacyJsonCodec(object):
+    """The str round trip used before codecs were pluggable, for comparison"""
+    def dumps(self, obj):
+        return bytes(json.dumps(obj), "utf8")
+
+    def loads(self, data):
+        return json.loads(str(data, "utf8"))
+
+def _codecs():
+    from . import codec
+    codecs = [("legacy", _LegacyJsonCodec()), ("json", codec.JsonCodec())]
+    try:
+        codecs.append(("orjson", codec.OrjsonCodec()))
+    except ImportError:
+        pass
+    codecs.append(("msgpack", codec.MsgPackCodec()))
+    return codecs
+
+def _messages():
+    return [
+        ("small", {"jsonrpc": "2.0", "method": "echo", "params": [1, "two", 3.0], "id": 1}),
+        ("medium", {"jsonrpc": "2.0", "result": [{"id": i, "name": "item %d" % i, "value": i * 0.5} for i in range(100)], "id": 1}),
+        ("large", {"jsonrpc": "2.0", "result": list(range(100000)), "id": 1}),
+    ]
+
+def _time(func, min_time=0.2):
+    """Returns the time per call in seconds"""
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(3, number)) / number
+
+def bench_codec(out=None, min_time=0.2):
+    """Measures the per-message encode and decode cost of the codecs"""
+    out = out or sys.stdout
+    results = []
+    out.write("%-8s %-8s %12s %12s %10s\n" % ("message", "codec", "encode (us)", "decode (us)", "bytes"))
+    for mname, msg in _messages():
+        for cname, c in _codecs():
+            data = c.dumps(msg)
+            enc = _time(lambda: c.dumps(msg), min_time)
+            dec = _time(lambda: c.loads(data), min_time)
+            results.append({"benchmark": "codec", "message": mname, "codec": cname, "encode": enc, "decode": dec, "size": len(data)})
+            out.write("%-8s %-8s %12.2f %12.2f %10d\n" % (mname, cname, enc * 1e6, dec * 1e6, len(data)))
+    return results
+
+def _key(r):
+    if r["benchmark"] == "codec":
+        return (r["codec"], r["message"], r["benchmark"], None)
+    return (r["client"], r["transport"], r["benchmark"], r.get("payload"))
+
+def _speed(r):
+    if r["benchmark"] == "codec":
+        return 1 / (r["encode"] + r["decode"]) if r["encode"] + r["decode"] else None
+    return r.get("mb_per_sec") or r.get("calls_per_sec")
+
+def compare(results, baseline, tolerance=0.2):
+    """Compares results with those of an earlier run. Returns a list of
+    (result, baseline result, ratio) for the results that got slower by
+    more than tolerance (a fraction)."""
+    base = dict((_key(r), r) for r in baseline)
+    slower = []
+    for r in results:
+        b = base.get(_key(r))
+        if b is None or not _speed(b) or not _speed(r):
+            continue
+        ratio = _speed(r) / _speed(b)
+        if ratio < 1 - tolerance:
+            slower.append((r, b, ratio))
+    return slower
+
+def _format(r):
+    if r["benchmark"] == "codec":
+        return "%-8s %-8s codec  encode %9.2f us   decode %9.2f us" % (r["message"], r["codec"], r["encode"] * 1e6, r["decode"] * 1e6)
+    what = "%-8s %-6s %-9s" % (r["client"], r["transport"], r["benchmark"])
+    if "payload" in r:
+        what += " %10d B" % r["payload"]
+    else:
+        what += " " * 13
+    if r["benchmark"] == "startup":
+        s = what + " " * 20
+    else:
+        s = "%s %12.1f calls/s" % (what, r["calls_per_sec"] or 0)
+    if "mb_per_sec" in r:
+        s += " %10.1f MB/s" % (r["mb_per_sec"] or 0)
+    if "p50_ms" in r:
+        s += "   p50 %9.3f ms   p99 %9.3f ms" % (r["p50_ms"], r["p99_ms"])
+    return s
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m streamrpc.bench", description="Benchmarks streamrpc clients and transports")
+    parser.add_argument("benchmark", nargs="?", choices=("transport", "codec"), default="transport",
+        help="Clients over transports, or the codecs alone (default: %(default)s)")
+    parser.add_argument("--clients", default=",".join(CLIENTS), help="Comma separated (default: %(default)s)")
+    parser.add_argument("--transports", default=",".join(TRANSPORTS), help="Comma separated (default: %(default)s)")
+    parser.add_argument("--sizes", help="Comma separated payload sizes in bytes (default: 8 bytes to 100 MB)")
+    parser.add_argument("--calls", type=int, default=10000, help="Calls per latency benchmark (default: %(default)s)")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Server starts to time (default: %(default)s)")
+    parser.add_argument("--quick", action="store_true", help="Fewer calls and payloads up to 1 MB")
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown when comparing (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    sizes = SIZES
+    calls = args.calls
+    if args.quick:
+        sizes = QUICK_SIZES
+        calls = min(calls, 1000)
+    if args.sizes:
+        sizes = [int(s) for s in args.sizes.split(",")]
+    if args.benchmark == "codec":
+        results = bench_codec(min_time=0.05 if args.quick else 0.2)
+    else:
+        results = run(args.clients.split(","), args.transports.split(","), sizes, calls, args.startup_runs,
+            log=lambda r: print(_format(r)))
+    doc = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(doc, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.tolerance)
+        for r, b, ratio in slower:
+            print("Slower: %s (%.0f%% of baseline)" % (_format(r), ratio * 100))
+        if slower:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "serve":
+        _serve(sys.argv[2])
+    elif len(sys.argv) > 2 and sys.argv[1] == "zygote":
+        _zygote(sys.argv[2])
+    else:
+        sys.exit(main())
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*
+#
+#   cache.py - Server-side result cache
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Server-side result cache
+
+Functions registered with cacheable=True are assumed to always return the
+same result for the same parameters. The encoded response of a successful
+call is kept, keyed by the parameters, and sent again for later requests with
+equal parameters without calling the function or encoding the result. For
+JSON-RPC, the encoded result is kept and put in the envelope of each request
+(its id and JSON-RPC version).
+
+Example:
+--------
+
+    rpc = streamrpc.Server()
+    rpc.register_function(lookup, cacheable=True, maxsize=1000, ttl=60)
+    ...
+    rpc.invalidate("lookup", "key")     # One entry
+    rpc.invalidate("lookup")            # All entries of the method
+
+Errors, streamed results and calls within batch requests are not cached.
+Parameters that cannot be used as a key (like binary values received through
+shared memory, or NumPy arrays) bypass the cache.
+"""
+
+import time
+import threading
+import collections
+
+__ALL__ = ["ResultCache", "make_key"]
+
+DEFAULT_MAXSIZE = 128
+
+def _freeze(obj):
+    t = type(obj)
+    if t is list or t is tuple:
+        return (list, tuple([_freeze(o) for o in obj]))
+    if t is dict:
+        return (dict, frozenset([(k, _freeze(v)) for k, v in obj.items()]))
+    hash(obj) # Raises TypeError if obj cannot be part of a key
+    return (t, obj)
+
+def make_key(args, kwargs):
+    """Returns a hashable key for call parameters, or None if they cannot be
+    used as one. Equal parameters give equal keys regardless of the order of
+    keyword arguments, and values of different types (like 1 and True) give
+    different keys."""
+    try:
+        return (_freeze(args), _freeze(kwargs or {}))
+    except TypeError:
+        return None
+
+class ResultCache(object):
+    """Least recently used cache of at most maxsize entries (None for no
+    limit). If ttl is set, entries expire that many seconds after they were
+    stored. The cache is thread-safe. hits and misses count the lookups."""
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to worker processes empty, without the lock
+        return {"maxsize": self.maxsize, "ttl": self.ttl}
+
+    def __setstate__(self, state):
+        self.__init__(state["maxsize"], state["ttl"])
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        """Returns the value stored for key, or None"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self.__entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.__lock:
+            self.__entries[key] = (value, expires)
+            self.__entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self.__entries) > self.maxsize:
+                    self.__entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def info(self):
+        """Returns the counters and size as a dict"""
+        with self.__lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.__entries), "maxsize": self.maxsize}
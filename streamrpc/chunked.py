@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*
+#
+#   chunked.py - Chunked encoding of large responses
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Chunked encoding of large responses
+
+A response is normally encoded into one bytes object before it is written,
+so that the result, its encoding and the bytes of the encoding are all held
+at the same time. Results that would encode to more than CHUNK_SIZE bytes are
+instead encoded while they are written: containers item by item (small items
+in batches, by the encoder of the codec), long strings in slices. The pieces
+are coalesced into parts of about CHUNK_SIZE bytes, so that there are neither
+many small writes nor any large buffers.
+
+Such a response is a Parts: one message, as an iterator over its parts (see
+protocol.messages). Outputs that send messages as length-prefixed frames need
+the whole message, and join the parts.
+
+The first part is encoded when the Parts is created, so an error in it (such
+as a value that cannot be encoded) is raised where the response is encoded,
+and answered like that of any other response. A later error is raised by the
+iterator. Once part of a response is written, it can no longer be replaced by
+an error response, so the connection is closed instead.
+"""
+
+import base64
+import itertools
+from .lazy import LazyModule
+xmlrpclib = LazyModule("xmlrpc.client")
+
+__ALL__ = ["Parts", "CHUNK_SIZE", "estimate", "is_large", "coalesce", "iterencode_json", "iterencode_xml"]
+
+CHUNK_SIZE = 65536
+_BASE64_CHUNK = 57 * 1150 # encodebytes() ends a line every 57 bytes, so slices encode like the whole
+
+_SCALARS = frozenset((int, float, bool, type(None)))
+
+class Parts(object):
+    """One message, as an iterator over its parts (bytes). It can be iterated
+    once. size is the number of bytes produced so far. The first part is
+    produced right away, so that an error in it is raised here."""
+    def __init__(self, parts):
+        parts = iter(parts)
+        first = next(parts, None)
+        self.__parts = parts if first is None else itertools.chain((first,), parts)
+        self.size = 0
+
+    def __iter__(self):
+        for part in self.__parts:
+            self.size += len(part)
+            yield part
+
+    def join(self):
+        return b"".join(self)
+
+def estimate(value, limit=CHUNK_SIZE):
+    """Estimates the encoded size of value in bytes, giving up as soon as it
+    exceeds limit. Only the first items of large containers are looked at."""
+    size = 0
+    stack = [value]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        v = pop()
+        t = type(v)
+        if t is str or t is bytes or t is bytearray:
+            size += len(v) + 2
+        elif t is list or t is tuple:
+            size += len(v) + 2
+            if size > limit:
+                break
+            extend(v)
+        elif t is dict:
+            size += len(v) + 2
+            if size > limit:
+                break
+            extend(v.keys())
+            extend(v.values())
+        else:
+            size += 8
+        if size > limit:
+            break
+    return size
+
+def is_large(value):
+    """Whether value is encoded in chunks"""
+    t = type(value)
+    if t in _SCALARS:
+        return False
+    return estimate(value) > CHUNK_SIZE
+
+def coalesce(pieces, encode=None, size=CHUNK_SIZE):
+    """Joins pieces into parts of at least size (except the last). If encode
+    is set, the pieces are strings that are encoded by it."""
+    buf = []
+    n = 0
+    for piece in pieces:
+        buf.append(piece)
+        n += len(piece)
+        if n >= size:
+            yield encode("".join(buf)) if encode else b"".join(buf)
+            buf = []
+            n = 0
+    if buf:
+        yield encode("".join(buf)) if encode else b"".join(buf)
+
+def _enter(value, markers):
+    i = id(value)
+    if i in markers:
+        raise ValueError("Circular reference detected")
+    markers.add(i)
+    return i
+
+_MAX_BATCH = 65536
+
+def _batches(items):
+    """Splits the sequence items into batches (slices) of items estimated to
+    encode to at most CHUNK_SIZE bytes together, and single items that are
+    larger than that. Generates (batch, False) and (item, True). The batch
+    size adapts to the items, so that most of them are looked at only once."""
+    i = 0
+    k = 64
+    n = len(items)
+    while i < n:
+        batch = items[i:i + k]
+        if _SCALARS.issuperset(map(type, batch)):
+            w = 8 * len(batch)
+        else:
+            w = estimate(batch)
+        if w <= CHUNK_SIZE:
+            yield batch, False
+            i += len(batch)
+            if w < CHUNK_SIZE // 2 and k < _MAX_BATCH:
+                k *= 2
+        elif k > 1:
+            k //= 2
+        else:
+            yield items[i], True
+            i += 1
+
+def _large(value):
+    t = type(value)
+    return (t is list or t is tuple or t is dict) and estimate(value) > CHUNK_SIZE
+
+def iterencode_json(value, dumps, markers=None):
+    """Generates the JSON encoding of value in pieces (bytes). Everything that
+    is not large is encoded by dumps (which returns bytes)."""
+    t = type(value)
+    if t is str and len(value) > CHUNK_SIZE:
+        yield b'"'
+        for i in range(0, len(value), CHUNK_SIZE):
+            yield dumps(value[i:i + CHUNK_SIZE])[1:-1]
+        yield b'"'
+        return
+    if not _large(value):
+        yield dumps(value)
+        return
+    if markers is None:
+        markers = set()
+    marker = _enter(value, markers)
+    sep = b""
+    if t is dict:
+        yield b"{"
+        for batch, large in _batches(list(value.items())):
+            if large:
+                key, v = batch
+                yield sep + dumps({key: 0})[1:-2] # The encoded key and separator
+                for piece in iterencode_json(v, dumps, markers):
+                    yield piece
+            else:
+                yield sep + dumps(dict(batch))[1:-1]
+            sep = b","
+        yield b"}"
+    else:
+        yield b"["
+        for batch, large in _batches(value):
+            if large:
+                yield sep
+                for piece in iterencode_json(batch, dumps, markers):
+                    yield piece
+            else:
+                yield sep + dumps(batch)[1:-1]
+            sep = b","
+        yield b"]"
+    markers.discard(marker)
+
+def iterencode_xml(value, marshaller, markers=None):
+    """Generates the XML-RPC <value> element of value in pieces (str), using
+    marshaller (an xmlrpc Marshaller) for everything that is not large"""
+    t = type(value)
+    if t is str and len(value) > CHUNK_SIZE:
+        yield "<value><string>"
+        for i in range(0, len(value), CHUNK_SIZE):
+            yield xmlrpclib.escape(value[i:i + CHUNK_SIZE])
+        yield "</string></value>\n"
+        return
+    if (t is bytes or t is bytearray) and len(value) > CHUNK_SIZE:
+        yield "<value><base64>\n"
+        for i in range(0, len(value), _BASE64_CHUNK):
+            yield base64.encodebytes(value[i:i + _BASE64_CHUNK]).decode("ascii")
+        yield "</base64></value>\n"
+        return
+    dump = marshaller._Marshaller__dump
+    if not _large(value):
+        out = []
+        dump(value, out.append)
+        yield "".join(out)
+        return
+    if markers is None:
+        markers = set()
+    marker = _enter(value, markers)
+    if t is dict:
+        yield "<value><struct>\n"
+        for batch, large in _batches(list(value.items())):
+            out = []
+            for k, v in ([batch] if large else batch):
+                if not isinstance(k, str):
+                    raise TypeError("dictionary key must be string")
+                out.append("<member>\n<name>%s</name>\n" % xmlrpclib.escape(k))
+                if large:
+                    yield "".join(out)
+                    out = []
+                    for piece in iterencode_xml(v, marshaller, markers):
+                        yield piece
+                else:
+                    dump(v, out.append)
+                out.append("</member>\n")
+            yield "".join(out)
+        yield "</struct></value>\n"
+    else:
+        yield "<value><array><data>\n"
+        for batch, large in _batches(value):
+            if large:
+                for piece in iterencode_xml(batch, marshaller, markers):
+                    yield piece
+            else:
+                out = []
+                for v in batch:
+                    dump(v, out.append)
+                yield "".join(out)
+        yield "</data></array></value>\n"
+    markers.discard(marker)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*
+#
+#   codec.py - Message codecs
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Message codecs
+
+A codec is any object with a dumps(obj) method returning bytes and a
+loads(data) method accepting bytes (or a bytearray). JsonRpc takes a codec
+argument; by default the standard library is used. OrjsonCodec is faster but
+encodes NaN and infinities as null, so it has to be asked for:
+
+    rpc = streamrpc.JsonServer(codec=streamrpc.codec.json_codec("orjson"))
+"""
+
+import json
+from .lazy import LazyModule
+packer = LazyModule(".packer", __package__)
+
+__ALL__ = ["JsonCodec", "OrjsonCodec", "MsgPackCodec", "json_codec"]
+
+class JsonCodec(object):
+    """JSON codec based on the standard library. The encoder is created once
+    and uses compact separators."""
+    binary = False # Whether binary strings can be encoded
+    
+    def __init__(self):
+        self.__encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def dumps(self, obj):
+        return self.__encoder.encode(obj).encode("utf8")
+
+    def loads(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+class OrjsonCodec(object):
+    """JSON codec based on orjson, which encodes straight to bytes and decodes
+    from bytes without intermediate strings. Values orjson does not support
+    or would encode differently (integers beyond 64 bits, datetimes,
+    dataclasses, subclasses of str, int, dict and list) are encoded by the
+    standard library, and messages orjson cannot decode (such as those with
+    NaN or Infinity) are decoded by it. Unlike the standard library, orjson
+    encodes NaN and infinities as null."""
+    binary = False
+    
+    def __init__(self):
+        import orjson
+        self.__orjson = orjson
+        self.__option = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS)
+        self.__fallback = JsonCodec()
+
+    def dumps(self, obj):
+        try:
+            return self.__orjson.dumps(obj, option=self.__option)
+        except TypeError:
+            return self.__fallback.dumps(obj)
+
+    def loads(self, data):
+        try:
+            return self.__orjson.loads(data)
+        except self.__orjson.JSONDecodeError:
+            return self.__fallback.loads(data)
+
+    def __reduce__(self):
+        return (OrjsonCodec, ())
+
+class MsgPackCodec(object):
+    """MessagePack codec (see streamrpc.packer)"""
+    binary = True
+    
+    def dumps(self, obj):
+        return packer.packb(obj)
+
+    def loads(self, data):
+        return packer.unpackb(data)
+
+_JSON_CODECS = {"json": JsonCodec, "orjson": OrjsonCodec}
+
+def json_codec(name="json"):
+    """Returns a JSON codec by name: "json" (the standard library, the
+    default) or "orjson" (raises ImportError if orjson is not installed)"""
+    return _JSON_CODECS[name]()
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*
+#
+#   dispatch.py - Method dispatch for servers
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Method dispatch for servers
+
+All method names are resolved when functions and instances are registered,
+into one flat table from (possibly dotted) names to handlers. Dispatching a
+request is a single dictionary lookup, followed by a check of the
+parameters against the signature of the handler, so that calls with the
+wrong number or names of parameters are rejected without calling it.
+
+Example:
+--------
+
+    class Math(object):
+        def add(self, a, b):
+            return a + b
+
+    rpc.register_instance(Math(), "math")   # Called as rpc.math.add(1, 2)
+
+Only the methods of the instance itself are registered, unless attributes
+to expose as nested namespaces are listed:
+
+    rpc.register_instance(Api(), namespaces=["users", "users.groups"])
+"""
+
+import inspect
+
+__ALL__ = ["Dispatcher", "Handler"]
+
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+
+class Handler(object):
+    """A registered function, with what its signature accepts"""
+    __slots__ = ("func", "minargs", "maxargs", "names", "keywords", "required", "varkw", "checked")
+
+    def __init__(self, func):
+        self.func = func
+        self.minargs = 0      # Required positional parameters
+        self.maxargs = 0      # Positional parameters (None for *args)
+        self.names = []       # Positional parameter names, in order
+        self.keywords = set() # Parameters that can be given by name
+        self.required = set() # Parameters that must be given
+        self.varkw = False
+        try:
+            params = inspect.signature(func).parameters.values()
+            self.checked = True
+        except (TypeError, ValueError): # No signature (some builtins), let the call check
+            params = ()
+            self.checked = False
+        for p in params:
+            if p.kind in _POSITIONAL:
+                self.names.append(p.name)
+                if p.kind != p.POSITIONAL_ONLY:
+                    self.keywords.add(p.name)
+                self.maxargs += 1
+                if p.default is p.empty:
+                    self.minargs += 1
+                    self.required.add(p.name)
+            elif p.kind == p.VAR_POSITIONAL:
+                self.maxargs = None
+            elif p.kind == p.KEYWORD_ONLY:
+                self.keywords.add(p.name)
+                if p.default is p.empty:
+                    self.required.add(p.name)
+            elif p.kind == p.VAR_KEYWORD:
+                self.varkw = True
+        self.names = tuple(self.names)
+
+    def check(self, args, kwargs):
+        """Returns why func cannot be called with args and kwargs, or None if
+        it can"""
+        if not self.checked:
+            return None
+        n = len(args)
+        if self.maxargs is not None and n > self.maxargs:
+            return "expected at most %d arguments, got %d" % (self.maxargs, n)
+        if not kwargs:
+            if n >= self.minargs and len(self.required) <= self.minargs:
+                return None
+            missing = [name for name in self.names[n:] if name in self.required]
+            missing += sorted(self.required.difference(self.names))
+            return "missing required argument '%s'" % missing[0]
+        given = set(self.names[:n])
+        for name in kwargs:
+            if name in given:
+                return "got multiple values for argument '%s'" % name
+            if not self.varkw and name not in self.keywords:
+                return "unexpected argument '%s'" % name
+        for name in self.names[n:]:
+            if name in self.required and name not in kwargs:
+                return "missing required argument '%s'" % name
+        for name in self.required.difference(self.names):
+            if name not in kwargs:
+                return "missing required argument '%s'" % name
+        return None
+
+class Dispatcher(object):
+    """Table of registered functions, shared by the protocols"""
+    def __init__(self):
+        self.handlers = {}
+
+    def register_function(self, func, name=None):
+        name = name or func.__name__
+        self.handlers[name] = Handler(func)
+        return name
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        """Registers the public methods of instance, as name.method if name is
+        given. Other attributes are not followed, so helpers kept on instance
+        (a logger, a connection) are not reachable. Attributes listed in
+        namespaces (dotted for deeper levels, like "db.tables") have their
+        public methods registered as name.attribute.method. Methods are
+        resolved at this point; later changes to instance are not seen."""
+        self.__register_methods(instance, name)
+        for path in namespaces:
+            value = instance
+            for attr in path.split("."):
+                if not attr or attr.startswith("_"):
+                    raise ValueError("Invalid namespace %r" % path)
+                value = getattr(value, attr)
+            if not _is_namespace(value):
+                raise ValueError("Not a namespace: %r" % path)
+            self.__register_methods(value, "%s.%s" % (name, path) if name else path)
+
+    def __register_methods(self, instance, name):
+        for attr in dir(instance):
+            if attr.startswith("_"):
+                continue
+            value = getattr(instance, attr, None)
+            if inspect.ismethod(value) or inspect.isfunction(value) or inspect.isbuiltin(value):
+                self.register_function(value, "%s.%s" % (name, attr) if name else attr)
+
+    def get(self, method):
+        """Returns the Handler for method, or None"""
+        return self.handlers.get(method)
+
+    def methods(self):
+        return sorted(self.handlers)
+
+def _is_namespace(value):
+    if value is None or inspect.isclass(value) or inspect.ismodule(value) or callable(value):
+        return False
+    if isinstance(value, (str, bytes, int, float, list, tuple, dict, set)):
+        return False
+    return hasattr(value, "__dict__")
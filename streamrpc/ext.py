@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*
+#
+#   ext.py - Extension types
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Extension types
+
+Values that the protocols cannot carry natively are sent as a struct (JSON
+object, XML-RPC struct or MessagePack map) with a single marker member. Both
+ends must enable the same extensions.
+
+NumPy arrays (ndarray=True) are sent as dtype, shape and the raw
+little-endian bytes of the array:
+
+    {"__ndarray__": [dtype, shape, data]}
+
+where dtype is in the format of numpy.lib.format.dtype_to_descr. The data is
+binary in XML-RPC and MessagePack, base64 in JSON, or a shared memory handle
+(see streamrpc.shm) if that is enabled and the array is large enough.
+Received arrays are created with numpy.frombuffer, without per-element
+Python objects, and are read-only. NumPy scalars are sent as Python numbers.
+
+NumPy is only imported if it is installed. Without it, received arrays are
+left as the marker struct.
+"""
+
+import base64
+from .lazy import LazyModule
+_shm = LazyModule(".shm", __package__)
+
+xmlrpclib = LazyModule("xmlrpc.client")
+
+__ALL__ = ["Extensions", "extensions"]
+
+_NDARRAY = "__ndarray__"
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+class Extensions(object):
+    """Converts extension types to and from their wire form. binary tells
+    whether the encoding carries binary strings (otherwise base64 is used)."""
+    def __init__(self, shm=None, ndarray=False, binary=True):
+        self.shm = _shm.channel(shm)
+        self.ndarray = ndarray
+        self.binary = binary
+        self.__np = _numpy() if ndarray else None
+
+    def __binary(self, data, names):
+        if self.shm and len(data) >= self.shm.threshold:
+            return self.shm.export(data, names)
+        if not self.binary:
+            return base64.b64encode(data).decode("ascii")
+        return bytes(data)
+
+    def __load_binary(self, data):
+        if isinstance(data, dict):
+            return self.shm.load(data) if self.shm else data
+        if isinstance(data, str):
+            return base64.b64decode(data)
+        if isinstance(data, xmlrpclib.Binary):
+            return data.data
+        return data
+
+    def export(self, obj, names=None):
+        """Returns obj in its wire form. The names of any created shared memory
+        segments are appended to names."""
+        t = type(obj)
+        if t is list or t is tuple:
+            return [self.export(o, names) for o in obj]
+        if t is dict:
+            return dict((k, self.export(v, names)) for k, v in obj.items())
+        if t is bytes or t is bytearray or t is memoryview:
+            return self.shm.export(obj, names) if self.shm else obj
+        np = self.__np
+        if np is not None:
+            if t is np.ndarray:
+                return {_NDARRAY: self.__export_array(obj, names)}
+            if isinstance(obj, np.generic):
+                return obj.item()
+        return obj
+
+    def __export_array(self, a, names):
+        np = self.__np
+        if a.dtype.hasobject:
+            raise TypeError("Cannot send arrays of Python objects")
+        a = np.ascontiguousarray(a, dtype=a.dtype.newbyteorder("<"))
+        data = memoryview(a.reshape(-1).view(np.uint8))
+        return [np.lib.format.dtype_to_descr(a.dtype), list(a.shape), self.__binary(data, names)]
+
+    def load(self, obj):
+        """Returns obj with wire forms replaced by the values"""
+        t = type(obj)
+        if t is list or t is tuple:
+            return [self.load(o) for o in obj]
+        if t is dict:
+            if len(obj) == 1:
+                if _NDARRAY in obj and self.ndarray:
+                    return self.__load_array(obj)
+                if self.shm and _shm.is_handle(obj):
+                    return self.shm.load(obj)
+            return dict((k, self.load(v)) for k, v in obj.items())
+        return obj
+
+    def __load_array(self, obj):
+        np = self.__np
+        try:
+            descr, shape, data = obj[_NDARRAY]
+        except (TypeError, ValueError):
+            raise ValueError("Invalid array")
+        data = self.__load_binary(data)
+        if np is None:
+            return {_NDARRAY: [descr, shape, data]}
+        if isinstance(descr, list):
+            descr = [tuple(f) for f in descr]
+        dtype = np.lib.format.descr_to_dtype(descr)
+        return np.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def remove(self, names):
+        if self.shm:
+            self.shm.remove(names)
+
+def extensions(shm=None, ndarray=False, binary=True):
+    """Returns the Extensions for the given options, or None if none are
+    enabled"""
+    if not (shm or ndarray):
+        return None
+    return Extensions(shm, ndarray, binary)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*
+#
+#   framing.py - Length-prefixed message framing
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Length-prefixed framing
+
+Instead of finding document boundaries by scanning the stream, every message
+can be sent as a frame:
+
+    +--------+----------------------+------------------------+
+    | 0x00   | length (4 bytes, BE) | payload (length bytes) |
+    +--------+----------------------+------------------------+
+
+The leading zero byte can never start an XML or JSON document, so a server
+detects framing from the first byte of the stream, just like it detects the
+protocol. The payload is a complete XML-RPC or JSON-RPC document.
+
+Compression
+-----------
+
+A sender that accepts compressed frames starts its stream with the single
+byte 0x02 (COMPRESS_HELLO), followed by frames. Frames with the marker 0x01
+instead of 0x00 carry a zlib-compressed payload. A server only compresses
+responses to a client that sent the hello byte, and both ends only compress
+payloads of at least a threshold size (smaller ones are sent as they are,
+as are payloads that do not get smaller). Receivers always accept
+compressed frames and skip hello bytes between frames.
+"""
+
+import struct
+import zlib
+
+__ALL__ = ["FRAME_MARKER", "COMPRESSED_MARKER", "COMPRESS_HELLO", "COMPRESS_THRESHOLD", "compress_threshold", "read_frames", "frame", "FrameSplitter", "FramedWriter"]
+
+FRAME_MARKER = b"\x00"
+COMPRESSED_MARKER = b"\x01"
+COMPRESS_HELLO = b"\x02"
+COMPRESS_THRESHOLD = 1024 # Default size below which payloads are not compressed
+MAX_PAYLOAD = 1024*1024*120
+
+_HEADER = struct.Struct(">cI")
+_COALESCE_SIZE = 65536 # Payloads below this size are sent in one write
+
+def compress_threshold(compress):
+    """Returns the compression threshold for the compress argument of clients
+    and servers: False/None (off), True (default threshold) or a size"""
+    if compress is True:
+        return COMPRESS_THRESHOLD
+    if not compress:
+        return None
+    return int(compress)
+
+def _read_exact(f, n, prefix=b"", eof=False):
+    """Reads exactly n bytes into a new buffer. If eof is set, returns None on
+    EOF before any data was read."""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = len(prefix)
+    view[:pos] = prefix
+    readinto = getattr(f, "readinto", None)
+    while pos < n:
+        if readinto:
+            k = readinto(view[pos:])
+        else:
+            d = f.read(n - pos)
+            k = len(d)
+            view[pos:pos + k] = d
+        if not k:
+            if pos == 0 and eof:
+                return None
+            raise EOFError("Stream ended in the middle of a frame")
+        pos += k
+    return buf
+
+def _decompress(data):
+    d = zlib.decompressobj()
+    out = d.decompress(data, MAX_PAYLOAD)
+    if d.unconsumed_tail:
+        raise ValueError("Compressed frame too large")
+    if not d.eof:
+        raise ValueError("Truncated compressed frame")
+    return out
+
+def read_frames(f, preamble=b""):
+    """Generates the payloads of the frames read from f. preamble is prepended
+    to the stream, for use when the first byte has already been read."""
+    while True:
+        marker = _read_exact(f, 1, preamble[:1], eof=True)
+        if marker is None:
+            return
+        preamble = preamble[1:]
+        if marker == COMPRESS_HELLO:
+            continue
+        header = _read_exact(f, _HEADER.size, bytes(marker) + preamble)
+        preamble = b""
+        marker, length = _HEADER.unpack(header)
+        if length > MAX_PAYLOAD:
+            raise ValueError("Frame too large")
+        if marker == FRAME_MARKER:
+            yield _read_exact(f, length) if length else bytearray()
+        elif marker == COMPRESSED_MARKER:
+            yield _decompress(_read_exact(f, length))
+        else:
+            raise ValueError("Invalid frame header")
+
+def frame(data, threshold=None, level=6):
+    """Returns data as one frame. If threshold is set, data of at least that
+    size is compressed."""
+    if threshold is not None and len(data) >= threshold:
+        z = zlib.compress(data, level)
+        if len(z) < len(data):
+            return _HEADER.pack(COMPRESSED_MARKER, len(z)) + z
+    return _HEADER.pack(FRAME_MARKER, len(data)) + data
+
+class FrameSplitter(object):
+    """Push-style counterpart of read_frames, with the same interface as
+    splitter.Splitter"""
+    def __init__(self):
+        self.__buf = bytearray()
+
+    def feed(self, data):
+        buf = self.__buf
+        buf += data
+        payloads = []
+        pos = 0
+        while pos < len(buf):
+            if buf[pos:pos + 1] == COMPRESS_HELLO:
+                pos += 1
+                continue
+            if len(buf) - pos < _HEADER.size:
+                break
+            marker, length = _HEADER.unpack_from(buf, pos)
+            if marker != FRAME_MARKER and marker != COMPRESSED_MARKER:
+                raise ValueError("Invalid frame header")
+            if length > MAX_PAYLOAD:
+                raise ValueError("Frame too large")
+            end = pos + _HEADER.size + length
+            if end > len(buf):
+                break
+            payload = bytes(buf[pos + _HEADER.size:end])
+            payloads.append(_decompress(payload) if marker == COMPRESSED_MARKER else payload)
+            pos = end
+        del buf[:pos]
+        return payloads
+
+class FramedWriter(object):
+    """Output wrapper that sends the data of every write() as one frame. If
+    compress_threshold is set, the stream starts with COMPRESS_HELLO and
+    payloads of at least that size are compressed."""
+    def __init__(self, f, compress_threshold=None, level=6):
+        self.__f = f
+        self.__threshold = compress_threshold
+        self.__level = level
+        self.__hello = compress_threshold is not None
+
+    def write(self, data):
+        if self.__hello:
+            self.__hello = False
+            self.__f.write(COMPRESS_HELLO)
+        if self.__threshold is not None and len(data) >= self.__threshold:
+            self.__f.write(frame(data, self.__threshold, self.__level))
+            return
+        header = _HEADER.pack(FRAME_MARKER, len(data))
+        if len(data) < _COALESCE_SIZE:
+            self.__f.write(header + data)
+        else:
+            self.__f.write(header)
+            self.__f.write(data)
+
+    def flush(self):
+        if hasattr(self.__f, "flush"):
+            self.__f.flush()
+
+    def close(self):
+        if hasattr(self.__f, "close"):
+            self.__f.close()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*
+#
+#   lazy.py - Modules imported on first use
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Modules imported on first use
+
+Servers are often started for a single job (over SSH, or as a subprocess),
+so the time to import streamrpc adds to the time of every job. Modules that
+only some protocols or options need (xmlrpc.client pulls in http.client,
+email and ssl, concurrent.futures.process pulls in multiprocessing) are bound
+to a LazyModule, which imports the module when an attribute is first looked
+up:
+
+    xmlrpclib = LazyModule("xmlrpc.client")
+    ...
+    xmlrpclib.Marshaller(...)   # Imports xmlrpc.client
+
+Looked up attributes are kept on the LazyModule, so later lookups cost no
+more than those of a module. PRELOAD lists all modules imported this way, for
+processes that want to pay for them up front (see streamrpc.zygote).
+"""
+
+import importlib
+
+__ALL__ = ["LazyModule", "PRELOAD", "preload"]
+
+PRELOAD = ["xmlrpc.client", "concurrent.futures", "concurrent.futures.thread", "concurrent.futures.process",
+    "traceback", "inspect", "socket", "tempfile", "mmap",
+    "streamrpc.dispatch", "streamrpc.xmlstream", "streamrpc.packer", "streamrpc.shm", "streamrpc.net",
+    "streamrpc.chunked", "streamrpc.sync", "streamrpc.pool"]
+
+class LazyModule(object):
+    """Stands in for the module name (relative to package, as for
+    importlib.import_module), which is imported on first attribute lookup"""
+    def __init__(self, name, package=None):
+        self.__name = name
+        self.__package = package
+
+    def __getattr__(self, attr):
+        if attr.startswith("_LazyModule__"):
+            raise AttributeError(attr)
+        value = getattr(importlib.import_module(self.__name, self.__package), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return "<lazy module %r>" % self.__name
+
+def preload(names=PRELOAD):
+    """Imports the given modules (by default all that streamrpc imports on
+    first use) and returns the names of those that could not be imported"""
+    missing = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            missing.append(name)
+    return missing
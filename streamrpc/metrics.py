@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*
+#
+#   metrics.py - Call metrics
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Call metrics
+
+Servers and clients created with metrics=Metrics() (or metrics=True) record,
+per method, the number of calls and errors, a latency histogram and the
+bytes received and sent. They also record the total time spent in each
+phase of handling a message:
+
+    read      waiting for the next request (server)
+    decode    parsing requests (server) or responses (client)
+    call      running the registered function (server)
+    encode    encoding responses (server) or requests (client)
+    write     writing and flushing messages
+
+Without metrics, none of this is measured. Methods that do not exist, and
+requests with invalid parameters, are recorded under the method name
+"(invalid)", so that clients cannot create any number of methods.
+
+Example:
+--------
+
+    rpc = streamrpc.Server(metrics=True)
+    rpc.register_function(rpc.metrics.snapshot, "system.stats")
+    ...
+    print(rpc.metrics.prometheus())
+
+A sink, if given, is called with a dict for every call recorded (method,
+latency, error, bytes_in, bytes_out and, on servers, the phases of the call).
+"""
+
+import sys
+import time
+import bisect
+import threading
+
+__ALL__ = ["Metrics", "metrics"]
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("read", "decode", "call", "encode", "write")
+INVALID = "(invalid)"
+
+_now = time.perf_counter
+
+class _Method(object):
+    __slots__ = ("calls", "errors", "bytes_in", "bytes_out", "latency", "counts")
+
+    def __init__(self, nbuckets):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = 0.0
+        self.counts = [0] * (nbuckets + 1) # The last one counts calls slower than all buckets
+
+class Metrics(object):
+    """Thread-safe collection of call metrics. buckets are the upper bounds,
+    in seconds, of the latency histogram."""
+    def __init__(self, buckets=LATENCY_BUCKETS, sink=None):
+        self.buckets = tuple(buckets)
+        self.sink = sink
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__methods = {}
+            self.__phases = dict((p, [0.0, 0]) for p in PHASES)
+            self.__bytes_in = 0
+            self.__bytes_out = 0
+
+    def record_call(self, method, latency, error=False, bytes_in=0, bytes_out=0, phases=None):
+        """Records a call that took latency seconds in total. phases maps phase
+        names to the seconds spent in them."""
+        with self.__lock:
+            m = self.__methods.get(method)
+            if m is None:
+                m = self.__methods[method] = _Method(len(self.buckets))
+            m.calls += 1
+            if error:
+                m.errors += 1
+            m.bytes_in += bytes_in
+            m.bytes_out += bytes_out
+            m.latency += latency
+            m.counts[bisect.bisect_left(self.buckets, latency)] += 1
+            self.__bytes_in += bytes_in
+            self.__bytes_out += bytes_out
+            if phases:
+                for phase, seconds in phases.items():
+                    p = self.__phases[phase]
+                    p[0] += seconds
+                    p[1] += 1
+        if self.sink is not None:
+            self.sink({"method": method, "latency": latency, "error": error, "bytes_in": bytes_in,
+                       "bytes_out": bytes_out, "phases": phases or {}})
+
+    def record_phase(self, phase, seconds):
+        """Records time spent in a phase, outside of any single call"""
+        with self.__lock:
+            p = self.__phases[phase]
+            p[0] += seconds
+            p[1] += 1
+
+    def record_bytes(self, bytes_in=0, bytes_out=0):
+        """Records bytes that are not attributed to a method"""
+        with self.__lock:
+            self.__bytes_in += bytes_in
+            self.__bytes_out += bytes_out
+
+    def snapshot(self):
+        """Returns the metrics as a dict of plain values (which can be returned
+        by an RPC method, like system.stats)"""
+        with self.__lock:
+            methods = {}
+            for name, m in self.__methods.items():
+                methods[name] = {"calls": m.calls, "errors": m.errors, "bytes_in": m.bytes_in, "bytes_out": m.bytes_out,
+                    "latency": {"sum": m.latency, "buckets": list(self.buckets), "counts": list(m.counts)}}
+            return {"methods": methods, "bytes_in": self.__bytes_in, "bytes_out": self.__bytes_out,
+                "phases": dict((p, {"seconds": v[0], "count": v[1]}) for p, v in self.__phases.items())}
+
+    def prometheus(self, prefix="streamrpc"):
+        """Returns the metrics in the Prometheus text exposition format"""
+        s = self.snapshot()
+        lines = []
+        def metric(name, kind, help, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for suffix, labels, value in samples:
+                label = ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+                lines.append("%s_%s%s%s %s" % (prefix, name, suffix, "{%s}" % label if label else "", _number(value)))
+        methods = sorted(s["methods"].items())
+        metric("calls_total", "counter", "Calls by method", [("", [("method", n)], m["calls"]) for n, m in methods])
+        metric("errors_total", "counter", "Failed calls by method", [("", [("method", n)], m["errors"]) for n, m in methods])
+        samples = []
+        for n, m in methods:
+            h = m["latency"]
+            total = 0
+            for le, count in zip(h["buckets"] + ["+Inf"], h["counts"]):
+                total += count
+                samples.append(("_bucket", [("method", n), ("le", le)], total))
+            samples.append(("_sum", [("method", n)], h["sum"]))
+            samples.append(("_count", [("method", n)], m["calls"]))
+        metric("call_duration_seconds", "histogram", "Call latency by method", samples)
+        metric("received_bytes_total", "counter", "Bytes received by method", [("", [("method", n)], m["bytes_in"]) for n, m in methods])
+        metric("sent_bytes_total", "counter", "Bytes sent by method", [("", [("method", n)], m["bytes_out"]) for n, m in methods])
+        metric("stream_received_bytes_total", "counter", "All bytes received", [("", [], s["bytes_in"])])
+        metric("stream_sent_bytes_total", "counter", "All bytes sent", [("", [], s["bytes_out"])])
+        phases = sorted(s["phases"].items())
+        metric("phase_seconds_total", "counter", "Time spent by phase", [("", [("phase", p)], v["seconds"]) for p, v in phases])
+        metric("phase_count_total", "counter", "Times measured by phase", [("", [("phase", p)], v["count"]) for p, v in phases])
+        return "\n".join(lines) + "\n"
+
+    def run(self, protocol, reqstr, read=None, call=None, received=None):
+        """Decodes and runs a request like protocol.dispatch_request, measuring
+        each phase (call is the request if it has already been decoded, and
+        received is when it was read). Returns the response and a function to
+        call with the number of bytes written (and the time taken), which
+        records the call."""
+        start = _now()
+        if call is None:
+            call = protocol.decode_request(reqstr, received)
+        t1 = _now()
+        try:
+            ret, exc = call.invoke(), None
+        except Exception:
+            ret, exc = None, sys.exc_info()[1]
+        t2 = _now()
+        response = call.respond(ret, exc)
+        t3 = _now()
+        phases = {"decode": t1 - start, "call": t2 - t1, "encode": t3 - t2}
+        if read is not None:
+            phases["read"] = read
+        if getattr(call, "fault", None) is not None:
+            method, error = INVALID, True
+        elif hasattr(call, "calls"): # Batch
+            method, error = "(batch)", exc is not None or any(isinstance(r, Exception) for r in ret)
+        else:
+            method, error = call.method, exc is not None
+        def done(bytes_out, write=None):
+            if write is not None:
+                phases["write"] = write
+            self.record_call(method, _now() - start, error, len(reqstr), bytes_out, phases)
+        return response, done
+
+def metrics(metrics):
+    """Returns the Metrics for the metrics argument of clients and servers:
+    None/False (disabled), True (a new Metrics) or a Metrics"""
+    if metrics is True:
+        return Metrics()
+    return metrics or None
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(v):
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*
+#
+#   net.py - Socket transport and multi-connection server
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Socket transport and multi-connection server
+
+Example (server):
+-----------------
+
+    rpc = streamrpc.SocketServer(("0.0.0.0", 7000))   # or a Unix socket path
+    rpc.register_function(my_method)
+    rpc.serve_forever()
+
+Example (client):
+-----------------
+
+    rpc = streamrpc.JsonClient(socket=streamrpc.connect(("myserver", 7000)))
+    rpc.my_method("Some", "Args")
+"""
+
+import os
+import errno
+import collections
+import socket as _socket
+import selectors
+from . import protocol
+from .lazy import LazyModule
+traceback = LazyModule("traceback")
+from .cache import DEFAULT_MAXSIZE
+from .framing import FRAME_MARKER, COMPRESS_HELLO, FrameSplitter, compress_threshold, frame
+
+__ALL__ = ["SocketReader", "SocketWriter", "SocketServer", "connect"]
+
+BUFSIZE = 65536
+MAXDOCSIZE = 1024*1024*120
+
+def _nodelay(sock):
+    if sock.family in (_socket.AF_INET, getattr(_socket, "AF_INET6", None)) and sock.type == _socket.SOCK_STREAM:
+        sock.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, 1)
+
+def connect(address, timeout=None):
+    """Connects to a SocketServer. address is a (host, port) tuple for TCP or
+    a path for a Unix domain socket."""
+    if isinstance(address, (str, bytes)):
+        sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.settimeout(None)
+    else:
+        sock = _socket.create_connection(address, timeout)
+        sock.settimeout(None)
+    _nodelay(sock)
+    return sock
+
+class SocketReader(object):
+    """Buffered reader for a connected socket. Small reads (like the protocol
+    detection and frame headers) are served from a buffer filled with
+    recv_into, large ones go straight to the socket."""
+    def __init__(self, sock, bufsize=BUFSIZE):
+        _nodelay(sock)
+        self.__sock = sock
+        self.__buf = bytearray(bufsize)
+        self.__view = memoryview(self.__buf)
+        self.__pos = 0
+        self.__end = 0
+
+    def read(self, n):
+        if self.__pos == self.__end:
+            if n >= len(self.__buf):
+                return self.__sock.recv(n)
+            self.__pos = 0
+            self.__end = self.__sock.recv_into(self.__buf)
+        k = min(n, self.__end - self.__pos)
+        d = bytes(self.__view[self.__pos:self.__pos + k])
+        self.__pos += k
+        return d
+
+    def readinto(self, b):
+        if self.__pos == self.__end:
+            return self.__sock.recv_into(b)
+        k = min(len(b), self.__end - self.__pos)
+        b[:k] = self.__view[self.__pos:self.__pos + k]
+        self.__pos += k
+        return k
+
+class SocketWriter(object):
+    """Writer for a connected socket"""
+    def __init__(self, sock):
+        _nodelay(sock)
+        self.__sock = sock
+
+    def write(self, data):
+        self.__sock.sendall(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.__sock.close()
+
+class _Connection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.protocol = None
+        self.split = None
+        self.framed = False
+        self.threshold = None # Compression threshold of responses
+        self.outbuf = bytearray()
+        self.streams = collections.deque() # Messages waiting for room in outbuf
+        self.eof = False
+
+    def fill(self, maxbuffer):
+        """Moves messages of streamed responses, and the parts of chunked
+        messages, to outbuf while there is room"""
+        while self.streams and len(self.outbuf) < maxbuffer:
+            data = next(self.streams[0], None)
+            if data is None:
+                self.streams.popleft()
+            elif isinstance(data, protocol.Parts):
+                if self.framed:
+                    self.outbuf += frame(data.join(), self.threshold)
+                else:
+                    self.streams.appendleft(iter(data)) # Before the rest of its response
+            else:
+                self.outbuf += frame(data, self.threshold) if self.framed else data
+
+class SocketServer(object):
+    """Server that accepts any number of connections on a TCP or Unix domain
+    socket and serves all of them from one thread, using the selectors module
+    (epoll/kqueue where available). Each connection may use any protocol (it
+    is detected from the first request, as with Server), and all connections
+    share the same registered functions.
+
+    address is a (host, port) tuple for TCP or a path for a Unix domain socket.
+    Alternatively, an already bound and listening socket can be given. If ndarray
+    is set, NumPy arrays are sent in binary form (see streamrpc.ext). Responses
+    to clients that send compressed frames are compressed from the size given by
+    compress (True for the default), unless compress is False. The path of a
+    Unix domain socket bound here is removed when the server is closed."""
+    def __init__(self, address=None, sock=None, backlog=128, maxbuffer=1024*1024, ndarray=False, compress=True):
+        self.__path = None
+        if sock is None:
+            if isinstance(address, (str, bytes)):
+                sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+                if address[:1] not in ("\0", b"\0"): # Not in the abstract namespace
+                    self.__path = address
+            else:
+                sock = _socket.socket(_socket.AF_INET6 if ":" in address[0] else _socket.AF_INET, _socket.SOCK_STREAM)
+                sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, 1)
+            sock.bind(address)
+            sock.listen(backlog)
+        sock.setblocking(False)
+        self.socket = sock
+        self.__maxbuffer = maxbuffer
+        self.__ndarray = ndarray
+        self.__compress = compress_threshold(compress)
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(sock, selectors.EVENT_READ, None)
+        self.__buf = bytearray(BUFSIZE)
+        self.__view = memoryview(self.__buf)
+        self.__protocols = {}
+        self.__regs = []
+        self.__shutdown = False
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def register_function(self, func, name=None, cacheable=False, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        """Registers func under name (by default its own name). If cacheable is
+        set, responses are cached (see streamrpc.cache), separately for each
+        protocol."""
+        self.__register("register_function", func, name, cacheable, maxsize, ttl)
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        """Registers the public methods of instance, as name.method if name is
+        given, and those of the attributes listed in namespaces (see
+        streamrpc.dispatch)"""
+        self.__register("register_instance", instance, name, namespaces)
+
+    def __register(self, method, *args):
+        self.__regs.append((method, args))
+        for p in self.__protocols.values():
+            getattr(p, method)(*args)
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes cached responses (see Server.invalidate)"""
+        for p in self.__protocols.values():
+            p.invalidate(name, *args, **kwargs)
+
+    def cache_info(self, name):
+        """Returns the hits, misses and size of the caches of a function, summed
+        over the protocols in use, or None if it is not cached"""
+        info = None
+        for p in self.__protocols.values():
+            cache = p.cache(name)
+            if cache is None:
+                continue
+            i = cache.info()
+            if info is None:
+                info = i
+            else:
+                for k in ("hits", "misses", "size"):
+                    info[k] += i[k]
+        return info
+
+    def __protocol(self, proto):
+        p = self.__protocols.get(proto)
+        if p is None:
+            p = self.__protocols[proto] = proto(ndarray=self.__ndarray)
+            for method, args in self.__regs:
+                getattr(p, method)(*args)
+        return p
+
+    def serve_forever(self, poll_interval=0.5):
+        self.__shutdown = False
+        try:
+            while not self.__shutdown:
+                for key, events in self.__selector.select(poll_interval):
+                    if key.data is None:
+                        self.__accept()
+                        continue
+                    conn = key.data
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            self.__send(conn)
+                        if events & selectors.EVENT_READ:
+                            self.__receive(conn)
+                    except Exception as e: # Drop the connection, but keep serving others
+                        if not (isinstance(e, (IOError, OSError)) and e.errno in (errno.EPIPE, errno.ECONNRESET)):
+                            traceback.print_exc()
+                        self.__close(conn)
+        finally:
+            self.close()
+
+    def shutdown(self):
+        """Makes serve_forever return (from another thread)"""
+        self.__shutdown = True
+
+    def close(self):
+        for key in list(self.__selector.get_map().values()):
+            if key.data is not None:
+                key.data.sock.close()
+        self.__selector.close()
+        self.socket.close()
+        if self.__path is not None:
+            try:
+                os.unlink(self.__path)
+            except OSError:
+                pass
+            self.__path = None
+
+    def __accept(self):
+        try:
+            sock, addr = self.socket.accept()
+        except (IOError, OSError):
+            return
+        sock.setblocking(False)
+        _nodelay(sock)
+        self.__selector.register(sock, selectors.EVENT_READ, _Connection(sock))
+
+    def __receive(self, conn):
+        n = conn.sock.recv_into(self.__buf)
+        if not n:
+            conn.eof = True
+            if not conn.outbuf:
+                self.__close(conn)
+            else:
+                self.__update(conn)
+            return
+        data = self.__view[:n]
+        if conn.split is None:
+            data = bytes(data).lstrip()
+            if not data:
+                return
+            conn.framed = data[:1] in (FRAME_MARKER, COMPRESS_HELLO)
+            if conn.framed:
+                if data[:1] == COMPRESS_HELLO:
+                    conn.threshold = self.__compress
+                conn.split = FrameSplitter()
+            else:
+                proto = protocol.detect(data)
+                conn.protocol = proto and self.__protocol(proto)
+                if not conn.protocol or not conn.protocol.splitfmt():
+                    raise ValueError("Unknown protocol")
+                conn.split = conn.protocol.splitter(MAXDOCSIZE)
+        for reqstr in conn.split.feed(data):
+            if conn.protocol is None:
+                proto = protocol.detect(reqstr)
+                if not proto:
+                    raise ValueError("Unknown protocol")
+                conn.protocol = self.__protocol(proto)
+            response = conn.protocol.dispatch_request(reqstr)
+            if response is None: # Notification
+                continue
+            if conn.streams or not isinstance(response, (bytes, bytearray)):
+                conn.streams.append(iter(protocol.messages(response)))
+            else:
+                conn.outbuf += frame(response, conn.threshold) if conn.framed else response
+        conn.fill(self.__maxbuffer)
+        if conn.outbuf:
+            self.__send(conn)
+
+    def __send(self, conn):
+        if conn.outbuf:
+            try:
+                n = conn.sock.send(conn.outbuf)
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+                n = 0
+            del conn.outbuf[:n]
+            conn.fill(self.__maxbuffer)
+        if conn.eof and not conn.outbuf:
+            self.__close(conn)
+        else:
+            self.__update(conn)
+
+    def __update(self, conn):
+        events = 0
+        if not conn.eof and len(conn.outbuf) < self.__maxbuffer and not conn.streams:
+            events |= selectors.EVENT_READ # Stop reading from clients that do not read responses
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+        if events != self.__selector.get_key(conn.sock).events:
+            self.__selector.modify(conn.sock, events, conn)
+
+    def __close(self, conn):
+        try:
+            self.__selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
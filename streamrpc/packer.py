@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*
+#
+#   packer.py - MessagePack encoding
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""MessagePack encoding (https://msgpack.org)
+
+Pure-Python implementation of the types used by RPC messages: nil, booleans,
+integers, floats, strings, binary, arrays and maps. If the msgpack package is
+installed, it is used instead.
+"""
+
+import struct
+
+__ALL__ = ["packb", "unpackb"]
+
+_B = struct.Struct(">B")
+_H = struct.Struct(">H")
+_I = struct.Struct(">I")
+_Q = struct.Struct(">Q")
+_b = struct.Struct(">b")
+_h = struct.Struct(">h")
+_i = struct.Struct(">i")
+_q = struct.Struct(">q")
+_d = struct.Struct(">d")
+
+def _pack_int(obj, write):
+    if 0 <= obj < 0x80:
+        write(_B.pack(obj))
+    elif -0x20 <= obj < 0:
+        write(_b.pack(obj))
+    elif obj > 0:
+        if obj <= 0xff:
+            write(b"\xcc" + _B.pack(obj))
+        elif obj <= 0xffff:
+            write(b"\xcd" + _H.pack(obj))
+        elif obj <= 0xffffffff:
+            write(b"\xce" + _I.pack(obj))
+        elif obj <= 0xffffffffffffffff:
+            write(b"\xcf" + _Q.pack(obj))
+        else:
+            raise OverflowError("Integer too large for MessagePack")
+    else:
+        if obj >= -0x80:
+            write(b"\xd0" + _b.pack(obj))
+        elif obj >= -0x8000:
+            write(b"\xd1" + _h.pack(obj))
+        elif obj >= -0x80000000:
+            write(b"\xd2" + _i.pack(obj))
+        elif obj >= -0x8000000000000000:
+            write(b"\xd3" + _q.pack(obj))
+        else:
+            raise OverflowError("Integer too large for MessagePack")
+
+def _pack_header(n, fix, fixmax, c16, c32, write):
+    if n < fixmax:
+        write(_B.pack(fix | n))
+    elif n <= 0xffff:
+        write(c16 + _H.pack(n))
+    else:
+        write(c32 + _I.pack(n))
+
+def _pack_str(obj, write):
+    data = obj.encode("utf8")
+    n = len(data)
+    if n < 32:
+        write(_B.pack(0xa0 | n))
+    elif n <= 0xff:
+        write(b"\xd9" + _B.pack(n))
+    else:
+        _pack_header(n, 0, 0, b"\xda", b"\xdb", write)
+    write(data)
+
+def _pack_bin(obj, write):
+    n = len(obj)
+    if n <= 0xff:
+        write(b"\xc4" + _B.pack(n))
+    elif n <= 0xffff:
+        write(b"\xc5" + _H.pack(n))
+    else:
+        write(b"\xc6" + _I.pack(n))
+    write(obj)
+
+def _pack(obj, write):
+    t = type(obj)
+    if obj is None:
+        write(b"\xc0")
+    elif obj is True:
+        write(b"\xc3")
+    elif obj is False:
+        write(b"\xc2")
+    elif t is int:
+        _pack_int(obj, write)
+    elif t is float:
+        write(b"\xcb" + _d.pack(obj))
+    elif t is str:
+        _pack_str(obj, write)
+    elif t is list or t is tuple:
+        _pack_header(len(obj), 0x90, 16, b"\xdc", b"\xdd", write)
+        for o in obj:
+            _pack(o, write)
+    elif t is dict:
+        _pack_header(len(obj), 0x80, 16, b"\xde", b"\xdf", write)
+        for k, v in obj.items():
+            _pack(k, write)
+            _pack(v, write)
+    elif t is bytes or t is bytearray or t is memoryview:
+        _pack_bin(obj, write)
+    elif isinstance(obj, int):
+        _pack_int(int(obj), write)
+    elif isinstance(obj, float):
+        write(b"\xcb" + _d.pack(obj))
+    elif isinstance(obj, str):
+        _pack_str(str(obj), write)
+    elif isinstance(obj, (list, tuple)):
+        _pack(list(obj), write)
+    elif isinstance(obj, dict):
+        _pack(dict(obj), write)
+    else:
+        raise TypeError("Cannot serialize %r" % (obj,))
+
+def _packb(obj):
+    out = []
+    _pack(obj, out.append)
+    return b"".join(out)
+
+def _unpackb(data):
+    data = memoryview(data)
+    unpack_from = struct.unpack_from
+
+    def unpack(pos):
+        c = data[pos]
+        pos += 1
+        if c < 0x80:
+            return c, pos
+        if c >= 0xe0:
+            return c - 0x100, pos
+        if c < 0x90:
+            return unpack_map(c & 0x0f, pos)
+        if c < 0xa0:
+            return unpack_array(c & 0x0f, pos)
+        if c < 0xc0:
+            n = c & 0x1f
+            return str(data[pos:pos + n], "utf8"), pos + n
+        if c == 0xc0:
+            return None, pos
+        if c == 0xc2:
+            return False, pos
+        if c == 0xc3:
+            return True, pos
+        if 0xc4 <= c <= 0xc6:
+            fmt = ("B", ">H", ">I")[c - 0xc4]
+            n, = unpack_from(fmt, data, pos)
+            pos += struct.calcsize(fmt)
+            if pos + n > len(data):
+                raise ValueError("Truncated MessagePack data")
+            return bytes(data[pos:pos + n]), pos + n
+        if c == 0xca:
+            return unpack_from(">f", data, pos)[0], pos + 4
+        if c == 0xcb:
+            return unpack_from(">d", data, pos)[0], pos + 8
+        if 0xcc <= c <= 0xd3:
+            fmt = (">B", ">H", ">I", ">Q", ">b", ">h", ">i", ">q")[c - 0xcc]
+            return unpack_from(fmt, data, pos)[0], pos + struct.calcsize(fmt)
+        if 0xd9 <= c <= 0xdb:
+            fmt = ("B", ">H", ">I")[c - 0xd9]
+            n, = unpack_from(fmt, data, pos)
+            pos += struct.calcsize(fmt)
+            if pos + n > len(data):
+                raise ValueError("Truncated MessagePack data")
+            return str(data[pos:pos + n], "utf8"), pos + n
+        if c == 0xdc or c == 0xdd:
+            fmt = ">H" if c == 0xdc else ">I"
+            n, = unpack_from(fmt, data, pos)
+            return unpack_array(n, pos + struct.calcsize(fmt))
+        if c == 0xde or c == 0xdf:
+            fmt = ">H" if c == 0xde else ">I"
+            n, = unpack_from(fmt, data, pos)
+            return unpack_map(n, pos + struct.calcsize(fmt))
+        raise ValueError("Unsupported MessagePack type 0x%02x" % c)
+
+    def unpack_array(n, pos):
+        out = []
+        for i in range(n):
+            o, pos = unpack(pos)
+            out.append(o)
+        return out, pos
+
+    def unpack_map(n, pos):
+        out = {}
+        for i in range(n):
+            k, pos = unpack(pos)
+            v, pos = unpack(pos)
+            out[k] = v
+        return out, pos
+
+    try:
+        obj, pos = unpack(0)
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ValueError("Invalid MessagePack data")
+    if pos != len(data):
+        raise ValueError("Extra data after MessagePack object")
+    return obj
+
+try:
+    import msgpack as _msgpack
+    packb = lambda obj:_msgpack.packb(obj, use_bin_type=True)
+    unpackb = lambda data:_msgpack.unpackb(data, raw=False, strict_map_key=False)
+except ImportError:
+    packb = _packb
+    unpackb = _unpackb
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*
+#
+#   pool.py - Load-balancing client pool
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Load-balancing client pool
+
+Example:
+--------
+
+    rpc = streamrpc.ClientPool(streamrpc.pool.spawn(["python", "server.py"]), size=8)
+    futures = [rpc.call_async("my_method", i) for i in range(1000)]
+    rpc.my_method("Some", "Args")
+"""
+
+import os, sys
+import errno
+import subprocess
+import threading
+import traceback
+from concurrent.futures import Future
+from .sync import Method, JsonClient
+
+__ALL__ = ["ClientPool", "spawn"]
+
+def spawn(args, client=JsonClient, **kwargs):
+    """Returns a ClientPool factory that starts args as a subprocess serving
+    requests on its stdin/stdout, and connects a client of the given class
+    to it. Extra arguments are passed to the client."""
+    def factory():
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return client(process=process, **kwargs)
+    return factory
+
+def _is_dead(e):
+    """Returns true if e means that the endpoint is gone (as opposed to a
+    Fault or other error returned by the server)"""
+    if isinstance(e, EOFError):
+        return True
+    return isinstance(e, (IOError, OSError)) and e.errno in (errno.EPIPE, errno.ECONNRESET)
+
+def _close(client):
+    try:
+        if hasattr(client, "close"):
+            client.close()
+    except Exception:
+        pass
+
+class _Endpoint(object):
+    def __init__(self, client):
+        self.client = client
+        self.inflight = 0
+        self.dead = False
+
+class ClientPool(object):
+    """Spreads calls over several clients, each connected to its own server
+    process or connection. Every call goes to the endpoint with the fewest
+    calls in flight (an idle one if there is any).
+
+    Endpoints are created by calling factory() (see spawn()), size times.
+    Alternatively, a list of already connected clients can be given, in which
+    case dead endpoints are dropped rather than replaced.
+
+    An endpoint whose stream ends or breaks (EOF, EPIPE) is closed and
+    replaced: by one of the spares, which are started up front so that they
+    are warm when needed, or else by a new one from factory(). Calls that
+    were in flight on the dead endpoint fail, unless retries is set, in which
+    case they are sent to another endpoint up to that many times. Only set
+    retries for calls that are safe to run twice."""
+    def __init__(self, factory=None, size=None, spares=0, clients=None, retries=0):
+        if clients is None:
+            if factory is None:
+                raise ValueError("Either factory or clients must be given")
+            clients = [factory() for i in range(size or os.cpu_count() or 1)]
+        elif spares and factory is None:
+            raise ValueError("Spares require a factory")
+        self.__factory = factory
+        self.__size = len(clients)
+        self.__nspares = spares
+        self.__retries = retries
+        self.__endpoints = [_Endpoint(c) for c in clients]
+        self.__spares = [factory() for i in range(spares)]
+        self.__cond = threading.Condition()
+        self.__pending = 0
+        self.__next = 0
+        self.__closed = False
+
+    def __len__(self):
+        """Number of endpoints in use (not counting spares)"""
+        return len(self.__endpoints)
+
+    def __pick(self):
+        with self.__cond:
+            while not self.__endpoints:
+                if self.__closed or not self.__pending:
+                    raise EOFError("No endpoints left in the pool")
+                self.__cond.wait()
+            # Start after the endpoint picked last, so that ties are spread evenly
+            endpoints = self.__endpoints
+            n = len(endpoints)
+            best = None
+            for i in range(n):
+                ep = endpoints[(self.__next + i) % n]
+                if best is None or ep.inflight < best.inflight:
+                    best = ep
+                    if not ep.inflight:
+                        break
+            self.__next = (endpoints.index(best) + 1) % n
+            best.inflight += 1
+            return best
+
+    def __done(self, ep):
+        with self.__cond:
+            ep.inflight -= 1
+
+    def __replace(self, ep):
+        with self.__cond:
+            if ep.dead:
+                return
+            ep.dead = True
+            self.__endpoints.remove(ep)
+            if self.__spares:
+                self.__endpoints.append(_Endpoint(self.__spares.pop()))
+            if self.__factory is not None and not self.__closed:
+                self.__pending += 1
+        # Do not block the caller (often a receiver thread) on process startup
+        t = threading.Thread(target=self.__restart, args=(ep,), name="streamrpc-pool")
+        t.daemon = True
+        t.start()
+
+    def __restart(self, ep):
+        _close(ep.client)
+        with self.__cond:
+            if self.__factory is None or self.__closed:
+                return
+        client = None
+        try:
+            client = self.__factory()
+        except Exception:
+            traceback.print_exc()
+        with self.__cond:
+            self.__pending -= 1
+            if client is not None and not self.__closed:
+                if len(self.__endpoints) < self.__size:
+                    self.__endpoints.append(_Endpoint(client))
+                else:
+                    self.__spares.append(client)
+                client = None
+            self.__cond.notify_all()
+        if client is not None:
+            _close(client)
+
+    def call_async(self, method, *args, **kwargs):
+        """Sends a request to the least loaded endpoint and returns a Future
+        for the result"""
+        future = Future()
+        self.__submit(future, method, args, kwargs, self.__retries)
+        return future
+
+    def __submit(self, future, method, args, kwargs, retries):
+        while True:
+            try:
+                ep = self.__pick()
+            except Exception:
+                future.set_exception(sys.exc_info()[1])
+                return
+            try:
+                f = ep.client.call_async(method, *args, **kwargs)
+                break
+            except Exception:
+                e = sys.exc_info()[1]
+                self.__done(ep)
+                if not _is_dead(e):
+                    future.set_exception(e)
+                    return
+                self.__replace(ep)
+                if retries <= 0:
+                    future.set_exception(e)
+                    return
+                retries -= 1
+
+        def on_done(f):
+            self.__done(ep)
+            e = f.exception()
+            if e is not None and _is_dead(e):
+                self.__replace(ep)
+                if retries > 0:
+                    self.__submit(future, method, args, kwargs, retries - 1)
+                    return
+            if e is not None:
+                future.set_exception(e)
+            else:
+                future.set_result(f.result())
+
+        f.add_done_callback(on_done)
+
+    def __request(self, method, args, kwargs):
+        return self.call_async(method, *args, **kwargs).result()
+
+    def close(self):
+        """Closes all endpoints, including spares"""
+        with self.__cond:
+            self.__closed = True
+            clients = [ep.client for ep in self.__endpoints] + self.__spares
+            self.__endpoints = []
+            self.__spares = []
+            self.__cond.notify_all()
+        for client in clients:
+            _close(client)
+
+    def __getattr__(self, name):
+        return Method(self.__request, name)
@@ -19,82 +19,413 @@
 #
 
 import sys
-try:
-    import xmlrpclib
-    __OLDSTYLE_XMLRPC_PACKAGES = True
-except ImportError:
-    __OLDSTYLE_XMLRPC_PACKAGES = False
-    
-if __OLDSTYLE_XMLRPC_PACKAGES:
-    from xmlrpclib import Fault
-    from SimpleXMLRPCServer import SimpleXMLRPCDispatcher
-else:
-    from xmlrpc.client import Fault
-    import xmlrpc.client as xmlrpclib
-    from xmlrpc.server import SimpleXMLRPCDispatcher
-import json
-
-json_dumps = json.dumps
-json_loads = json.loads
-xmlrpc_dumps = xmlrpclib.dumps
-xmlrpc_loads = xmlrpclib.loads
-if str != bytes:
-    json_dumps = lambda x:bytes(json.dumps(x), "utf8")
-    json_loads = lambda x:json.loads(str(x, "utf8"))
-    xmlrpc_dumps = lambda x,*a,**kw:bytes(xmlrpclib.dumps(x,*a,**kw), "utf8")
-    xmlrpc_loads = lambda x,*a,**kw:xmlrpclib.loads(str(x, "utf8"),*a,**kw)
-    
-__ALL__ = ["JsonRpc", "XmlRpc", "Fault"]
+import time
+from .lazy import LazyModule
+xmlrpclib = LazyModule("xmlrpc.client")
+from .codec import json_codec, MsgPackCodec
+from . import ext
+from .cache import ResultCache, make_key, DEFAULT_MAXSIZE
+from .splitter import Splitter
+from . import chunked
+from .chunked import Parts
+
+# Only needed once a protocol is used (see streamrpc.lazy)
+dispatch = LazyModule(".dispatch", __package__)
+xmlstream = LazyModule(".xmlstream", __package__)
+
+xmlrpc_dumps = lambda x,*a,**kw:bytes(xmlrpclib.dumps(x,*a,**kw), "utf8")
+xmlrpc_loads = lambda x,*a,**kw:xmlrpclib.loads(str(x, "utf8"),*a,**kw)
+
+__ALL__ = ["JsonRpc", "XmlRpc", "MsgPackRpc", "Fault", "Call", "BatchCall", "Parts", "detect", "messages", "DEADLINE_EXCEEDED", "SERVER_BUSY"]
+
+CHUNK_ITEMS = 100 # Items per chunk message of a streamed result
+_RESULT = "__streamrpc_result__" # Placeholder for the result in chunked and cached JSON-RPC responses
+
+# Fault codes, from the range that JSON-RPC leaves to servers
+DEADLINE_EXCEEDED = -32001 # The request timed out before it was run
+SERVER_BUSY = -32002 # The request was rejected, as too many are waiting
+
+_now = time.monotonic
+
+def __getattr__(name):
+    # Fault is xmlrpc.client.Fault, which is imported when first needed
+    if name == "Fault":
+        return xmlrpclib.Fault
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+def _deadline(timeout, received):
+    """Returns when a request with the given timeout (from the client) expires,
+    or None. received is when the request was read, by default now."""
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        return None
+    return (_now() if received is None else received) + timeout
+
+def _is_iterator(result):
+    return hasattr(result, "__next__") and not isinstance(result, (str, bytes, bytearray))
+
+def _chain(head, pieces, tail):
+    yield head
+    for piece in pieces:
+        yield piece
+    yield tail
+
+def _utf8(s):
+    return s.encode("utf8")
+
+def messages(response):
+    """Returns the messages to write for a response returned by respond() or
+    dispatch_request(): either one message or, for streamed results, an
+    iterator over the chunk messages followed by the final response. There
+    are no messages for notifications (None). A message is bytes or, for large
+    results, Parts (see streamrpc.chunked)."""
+    if response is None:
+        return ()
+    if isinstance(response, (bytes, bytearray, Parts)):
+        return (response,)
+    return response
+
+class Call(object):
+    """A decoded request. Invoking the handler and encoding the response are
+    separate steps, so that the handler may run outside of the reader (e.g.
+    on an event loop).
+
+    If the client asked for a streamed result (stream) and the handler returns
+    an iterator, respond() returns an iterator over messages instead of one
+    message (see messages()). Otherwise iterators are sent as lists.
+
+    If the function is cacheable, cache and key tell where the encoded response
+    is stored (see streamrpc.cache).
+
+    Notifications (notify) are invoked like other calls, but respond() returns
+    None, as nothing is sent back.
+
+    If the client set a timeout, deadline is when it expires (as _now()).
+    Invoking an expired call raises a Fault (DEADLINE_EXCEEDED) instead of
+    calling the handler, as the client has given up on it."""
+    def __init__(self, protocol, method, func, args=(), kwargs=None, reqid=None, version=None, fault=None, stream=False, cache=None, key=None, notify=False, deadline=None):
+        self.protocol = protocol
+        self.method = method
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.reqid = reqid
+        self.version = version
+        self.fault = fault
+        self.stream = stream
+        self.cache = cache
+        self.key = key
+        self.notify = notify
+        self.deadline = deadline
+
+    def invoke(self):
+        if self.fault is not None:
+            raise self.fault
+        if self.deadline is not None and _now() > self.deadline:
+            raise xmlrpclib.Fault(DEADLINE_EXCEEDED, "Deadline exceeded")
+        return self.func(*self.args, **self.kwargs)
+
+    def respond(self, result=None, exc=None):
+        if self.notify:
+            if exc is None:
+                _materialize(result) # Run a generator for its effects
+            return None
+        if exc is None and _is_iterator(result):
+            if self.stream:
+                return self.__stream(result)
+            try:
+                result = list(result)
+            except Exception:
+                result, exc = None, sys.exc_info()[1]
+        return self.protocol.encode_response(self, result, exc)
+
+    def __stream(self, items):
+        # The final response carries the number of items
+        n = 0
+        exc = None
+        chunk = []
+        try:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == CHUNK_ITEMS:
+                    n += len(chunk)
+                    yield self.protocol.encode_chunk(self, chunk)
+                    chunk = []
+        except Exception:
+            exc = sys.exc_info()[1]
+        if chunk: # Items produced before an error are still sent
+            n += len(chunk)
+            yield self.protocol.encode_chunk(self, chunk)
+        if exc is not None:
+            yield self.protocol.encode_response(self, exc=exc)
+        else:
+            yield self.protocol.encode_response(self, n)
+
+    def run(self):
+        try:
+            ret = self.invoke()
+        except Exception:
+            return self.respond(exc=sys.exc_info()[1])
+        return self.respond(ret)
+
+class _CachedCall(Call):
+    """A request answered from the result cache"""
+    def __init__(self, protocol, method, response, reqid=None, version=None):
+        Call.__init__(self, protocol, method, None, reqid=reqid, version=version)
+        self.response = response
+
+    def invoke(self):
+        return None
+
+    def respond(self, result=None, exc=None):
+        if exc is not None:
+            return Call.respond(self, exc=exc)
+        return self.response
+
+def _lookup(caches, method, args, kwargs, stream):
+    """Returns the cache and key for a request, and the cached response if
+    there is one"""
+    cache = caches.get(method)
+    if cache is None or stream:
+        return None, None, None
+    key = make_key(args, kwargs)
+    if key is None:
+        return None, None, None
+    return cache, key, cache.get(key)
+
+def _register_cache(caches, name, cacheable, maxsize, ttl):
+    if cacheable:
+        caches[name] = ResultCache(maxsize, ttl)
+    else:
+        caches.pop(name, None)
+
+def _invalidate(caches, name, args, kwargs):
+    if name is None:
+        for cache in caches.values():
+            cache.clear()
+        return
+    cache = caches.get(name)
+    if cache is None:
+        return
+    if args or kwargs:
+        cache.invalidate(make_key(args, kwargs))
+    else:
+        cache.clear()
+
+def _stream_end(result, on_chunk):
+    """Returns the completion arguments for the final response of a request,
+    given the on_chunk callback if a stream was requested. A server that does
+    not stream returns the whole list, which is then delivered as one chunk."""
+    if on_chunk is None:
+        return result, None
+    if isinstance(result, list):
+        on_chunk(result)
+        return len(result), None
+    if not isinstance(result, int):
+        return None, TypeError("Result of a streamed call is not a sequence")
+    return result, None
+
+def _export_request(ext, args, kwargs, completion):
+    """Converts arguments to their wire form. If shared memory segments were
+    created, the returned completion removes them when the request is done, in
+    case the server did not."""
+    names = []
+    args, kwargs = ext.export(args, names), ext.export(kwargs, names)
+    if not names:
+        return args, kwargs, completion
+    def on_response(response, err):
+        ext.remove(names)
+        completion(response, err)
+    return args, kwargs, on_response
+
+def _materialize(result):
+    if not _is_iterator(result):
+        return result
+    try:
+        return list(result)
+    except Exception:
+        return sys.exc_info()[1]
+
+class BatchCall(object):
+    """A decoded JSON-RPC batch request. invoke() returns one result per call,
+    with the exception in place of the result for calls that failed."""
+    def __init__(self, protocol, calls):
+        self.protocol = protocol
+        self.calls = calls
+
+    def invoke(self):
+        results = []
+        for call in self.calls:
+            try:
+                results.append(call.invoke())
+            except Exception:
+                results.append(sys.exc_info()[1])
+        return results
+
+    def respond(self, result=None, exc=None):
+        if result is not None:
+            result = [_materialize(r) for r in result]
+        return self.protocol.encode_batch_response(self, result, exc)
+
+    def run(self):
+        return self.respond(self.invoke())
 
 class JsonRpc(object):
-    def __init__(self, version=2):
+    """JSON-RPC 1.0/2.0. codec is used for encoding and decoding messages (see
+    streamrpc.codec); by default the standard library JSON codec is used. If
+    shm is set, large binary values are passed through shared memory (see
+    streamrpc.shm). If ndarray is set, NumPy arrays are sent in binary form
+    (see streamrpc.ext)."""
+    ordered_responses = False
+
+    def __init__(self, version=2, codec=None, shm=None, ndarray=False):
+        codec = codec or json_codec()
+        self._ext = ext.extensions(shm, ndarray, getattr(codec, "binary", False))
+        self._dumps = codec.dumps
+        self._loads = codec.loads
         self.__id = 1
-        self.__version = 2
+        self.__version = version
         self.__reqs = {}
-        self.__dispatcher = {}
+        self.__chunks = {}
+        self.__dispatcher = dispatch.Dispatcher()
+        self.__caches = {}
         
     def splitfmt(self):
         return "json"
 
-    def initiate_request(self, method, args, kwargs, completion):
-        reqid = self.__id
-        self.__id += 1
+    def splitter(self, maxdocsize=None):
+        """Returns a push-style splitter for incoming messages"""
+        return Splitter(self.splitfmt(), maxdocsize)
+
+    def initiate_request(self, method, args, kwargs, completion, on_chunk=None, timeout=None):
+        """Encodes a request. If on_chunk is given, the result is requested as a
+        stream: on_chunk is called with each list of items as it arrives, and
+        completion with the number of items at the end. A timeout (seconds) is
+        sent as a "timeout" member, and the server does not run the request if
+        it has waited for longer than that."""
+        req = self._request(method, args, kwargs, completion)
+        if timeout is not None:
+            req["timeout"] = timeout
+        if on_chunk is not None:
+            req["stream"] = True
+            self.__chunks[req["id"]] = on_chunk
+        return self._dumps(req)
+
+    def initiate_notification(self, method, args, kwargs):
+        """Encodes a notification: a request that is not answered"""
+        return self._dumps(self._request(method, args, kwargs, None))
+
+    def initiate_batch(self, requests):
+        """Encodes a list of (method, args, kwargs, completion) as one batch
+        request. Requests without a completion are sent as notifications."""
+        if self.__version == 1:
+            raise NotImplementedError("Batch requests not supported in JSON-RPC 1.0 mode")
+        return self._dumps([self._request(*r) for r in requests])
+
+    def _request(self, method, args, kwargs, completion):
+        if completion is None: # Notification
+            reqid = None
+            if self._ext:
+                args, kwargs = self._ext.export(args), self._ext.export(kwargs)
+        else:
+            reqid = self.__id
+            self.__id += 1
+            if self._ext:
+                args, kwargs, completion = _export_request(self._ext, args, kwargs, completion)
         if self.__version == 1:
             if kwargs:
-                raise NotImplemented("Keyword arguments not supported in JSON-RPC 1.0 mode")
-            req = json_dumps({ "method" : method, "params" : list(args), "id" : reqid })
+                raise NotImplementedError("Keyword arguments not supported in JSON-RPC 1.0 mode")
+            req = { "method" : method, "params" : list(args), "id" : reqid }
         else:
             if kwargs:
                 if args:
-                    raise NotImplemented("Keyword arguments cannot be combined with positional arguments in JSON-RPC mode")
-                req = json_dumps({ "jsonrpc" : "2.0", "method" : method, "params" : kwargs, "id" : reqid })
+                    raise NotImplementedError("Keyword arguments cannot be combined with positional arguments in JSON-RPC mode")
+                req = { "jsonrpc" : "2.0", "method" : method, "params" : kwargs, "id" : reqid }
             else:
-                req = json_dumps({ "jsonrpc" : "2.0", "method" : method, "params" : list(args), "id" : reqid })
+                req = { "jsonrpc" : "2.0", "method" : method, "params" : list(args), "id" : reqid }
+            if completion is None:
+                del req["id"]
         
-        self.__reqs[reqid] = completion
+        if completion is not None:
+            self.__reqs[reqid] = completion
         return req
         
     def handle_response(self, rstr):
-        response = json_loads(rstr)
+        response = self._loads(rstr)
+        if isinstance(response, list):
+            for r in response:
+                self._handle_response(r)
+        else:
+            self._handle_response(response)
+
+    def _handle_response(self, response):
         reqid = response.get("id")
+        if "chunk" in response:
+            on_chunk = self.__chunks.get(reqid)
+            if on_chunk: on_chunk(self._ext.load(response["chunk"]) if self._ext else response["chunk"])
+            return
         completion = self.__reqs.get(reqid)
         if not completion: return # Invalid ID response
         del self.__reqs[reqid]
+        on_chunk = self.__chunks.pop(reqid, None)
         e = response.get("error")
         if e is not None:
             ec = e.get("code", -32000)
-            completion(None, Fault(ec, e.get("message", "#%s" % ec)))
+            completion(None, xmlrpclib.Fault(ec, e.get("message", "#%s" % ec)))
         else:
-            completion(response["result"], None)
+            result = response["result"]
+            if self._ext:
+                try:
+                    result = self._ext.load(result)
+                except (OSError, ValueError):
+                    completion(None, sys.exc_info()[1])
+                    return
+            completion(*_stream_end(result, on_chunk))
+
+    def abort_requests(self, err):
+        self.__chunks = {}
+        reqs, self.__reqs = self.__reqs, {}
+        for reqid in sorted(reqs):
+            reqs[reqid](None, err)
          
     def dispatch_request(self, reqstr):
-        return json_dumps(self._dispatch_request(reqstr))
+        return self.decode_request(reqstr).run()
             
-    def _dispatch_request(self, reqstr):
+    def decode_request(self, reqstr, received=None):
+        """Decodes a request into a Call (or BatchCall). received is when the
+        request was read (as _now()), from which its timeout counts."""
+        try:
+            obj = self._loads(reqstr)
+        except (TypeError, ValueError):
+            return Call(self, None, None, version=2, fault=xmlrpclib.Fault(-32700, "Parse error"))
+        return self._decode_request(obj, received)
+
+    def handle_message(self, s):
+        """Handles a response and returns None, or decodes a request and returns
+        it. Used when both ends make calls over the same stream."""
         try:
-            obj = json_loads(reqstr)
+            obj = self._loads(s)
         except (TypeError, ValueError):
-            return {"jsonrpc": "2.0", "error": {"code": -32700, "message": "Parse error"}, "id": null}
+            return Call(self, None, None, version=2, fault=xmlrpclib.Fault(-32700, "Parse error"))
+        first = obj[0] if isinstance(obj, list) and obj else obj
+        if isinstance(first, dict) and not "method" in first and ("result" in first or "error" in first or "chunk" in first):
+            if isinstance(obj, list):
+                for r in obj:
+                    self._handle_response(r)
+            else:
+                self._handle_response(obj)
+            return None
+        return self._decode_request(obj)
+
+    def _decode_request(self, obj, received=None):
+        if isinstance(obj, list):
+            if not obj:
+                return Call(self, None, None, version=2, fault=xmlrpclib.Fault(-32600, "Invalid Request"))
+            return BatchCall(self, [self._decode(o, False, received) for o in obj])
+        return self._decode(obj, True, received)
+
+    def _decode(self, obj, cached=True, received=None):
+        if not isinstance(obj, dict):
+            return Call(self, None, None, version=2, fault=xmlrpclib.Fault(-32600, "Invalid Request"))
         v = None
         if "jsonrpc" in obj:
             if obj["jsonrpc"] == "2.0":
@@ -103,12 +434,10 @@ class JsonRpc(object):
             v = 1
         method = obj.get("method")
         reqid = obj.get("id")
-        notify = not "id" in obj
         if v is None or method is None:
-            if v == 1:
-                return {"error": {"code": -32600, "message": "Invalid Request"}, "id": reqid}
-            else:
-                return {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request"}, "id": reqid}
+            return Call(self, method, None, reqid=reqid, version=v, fault=xmlrpclib.Fault(-32600, "Invalid Request"))
+        # Notifications have no id in JSON-RPC 2.0, and a null id in 1.0
+        notify = reqid is None and (v == 1 or not "id" in obj)
         prm = obj.get("params")
         aprm = ()
         kwprm = {}
@@ -117,69 +446,319 @@ class JsonRpc(object):
         elif isinstance(prm, dict) and v == 2:
             kwprm = prm
         else:
-            if v == 1:
-                return {"error": {"code": -32602, "message": "Invalid params"}, "id": reqid}
-            else:
-                return {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params"}, "id": reqid}
-        mi = self.__dispatcher.get(method)
-        if not mi:
-            if v == 1:
-                return {"error": {"code": -32601, "message": "Method not found"}, "id": reqid}
-            else:
-                return {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": reqid}
-        try:
-            ret = mi(*aprm, **kwprm)
-        except Fault as f:
-            return {"jsonrpc": "2.0", "error": {"code": f.faultCode, "message": f.faultString or ("#%s" % f.faultCode)}, "id": reqid}
-        except:
-            return {"jsonrpc": "2.0", "error": {"code": -32000, "message": str(sys.exc_info()[1])}, "id": reqid}
-        
-        if v == 1:
-            return {"result":ret, "id": reqid}
+            return Call(self, method, None, reqid=reqid, version=v, notify=notify, fault=xmlrpclib.Fault(-32602, "Invalid params"))
+        handler = self.__dispatcher.get(method)
+        if handler is None:
+            return Call(self, method, None, reqid=reqid, version=v, notify=notify, fault=xmlrpclib.Fault(-32601, "Method not found"))
+        err = handler.check(aprm, kwprm)
+        if err is not None:
+            return Call(self, method, None, reqid=reqid, version=v, notify=notify, fault=xmlrpclib.Fault(-32602, "Invalid params: %s" % err))
+        if self._ext:
+            try:
+                aprm, kwprm = self._ext.load(aprm), self._ext.load(kwprm)
+            except (OSError, ValueError):
+                return Call(self, method, None, reqid=reqid, version=v, notify=notify, fault=xmlrpclib.Fault(-32602, "Invalid params: %s" % sys.exc_info()[1]))
+        stream = obj.get("stream") is True
+        cache = key = None
+        if cached and self.__caches and not notify:
+            cache, key, hit = _lookup(self.__caches, method, aprm, kwprm, stream)
+            if hit is not None:
+                call = _CachedCall(self, method, None, reqid=reqid, version=v)
+                call.response = self.__envelope(call, hit)
+                return call
+        deadline = _deadline(obj.get("timeout"), received)
+        return Call(self, method, handler.func, aprm, kwprm, reqid=reqid, version=v, stream=stream, cache=cache, key=key, notify=notify, deadline=deadline)
+
+    def encode_response(self, call, result=None, exc=None):
+        if call.cache is not None and exc is None and not isinstance(result, Exception) and not (self._ext and self._ext.shm):
+            return self.__cache_response(call, result)
+        if exc is None and self.splitfmt() and chunked.is_large(result):
+            return self.__chunked_response(call, result)
+        return self._dumps(self._response(call, result, exc))
+
+    def __chunked_response(self, call, result):
+        # Encode with a placeholder result, and stream the result between
+        # what surrounds it. The result comes before the id.
+        if self._ext:
+            result = self._ext.export(result)
+        rsp = self._response(call, _RESULT)
+        data = self._dumps(rsp)
+        placeholder = self._dumps(_RESULT)
+        i = data.find(placeholder)
+        pieces = chunked.iterencode_json(result, self._dumps)
+        return Parts(chunked.coalesce(_chain(data[:i], pieces, data[i + len(placeholder):])))
+
+    def __cache_response(self, call, result):
+        # Only the encoded result is cached, as the envelope depends on the
+        # request (its id and JSON-RPC version)
+        data = self._dumps(self._ext.export(result) if self._ext else result)
+        call.cache.put(call.key, data)
+        return self.__envelope(call, data)
+
+    def __envelope(self, call, result):
+        # Encode with a placeholder result, which comes before the id
+        data = self._dumps(self._response(call, _RESULT))
+        placeholder = self._dumps(_RESULT)
+        i = data.find(placeholder)
+        return data[:i] + result + data[i + len(placeholder):]
+
+    def encode_chunk(self, call, items):
+        if self._ext:
+            items = self._ext.export(items)
+        if call.version == 1:
+            rsp = {"chunk": items, "id": call.reqid}
         else:
-            return {"jsonrpc": "2.0", "result":ret, "id": reqid}
+            rsp = {"jsonrpc": "2.0", "chunk": items, "id": call.reqid}
+        return self._dumps(rsp)
+
+    def encode_batch_response(self, batch, results=None, exc=None):
+        if exc is not None:
+            results = [exc] * len(batch.calls)
+        rsps = [self._response(c, r) for c, r in zip(batch.calls, results) if not c.notify]
+        return self._dumps(rsps) if rsps else None # Nothing is sent for a batch of notifications
+
+    def _response(self, call, result=None, exc=None):
+        if isinstance(result, Exception):
+            result, exc = None, result
+        if call.version == 1:
+            rsp = {}
+        else:
+            rsp = {"jsonrpc": "2.0"}
+        if exc is None:
+            rsp["result"] = self._ext.export(result) if self._ext else result
+        elif isinstance(exc, xmlrpclib.Fault):
+            rsp["error"] = {"code": exc.faultCode, "message": exc.faultString or ("#%s" % exc.faultCode)}
+        else:
+            rsp["error"] = {"code": -32000, "message": str(exc)}
+        rsp["id"] = call.reqid
+        return rsp
     
-    def register_function(self, func, name=None):
-        self.__dispatcher[name or func.__name__] = func
+    def register_function(self, func, name=None, cacheable=False, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        """Registers func under name (by default its own name). If cacheable is
+        set, responses are cached (see streamrpc.cache)."""
+        name = self.__dispatcher.register_function(func, name)
+        _register_cache(self.__caches, name, cacheable, maxsize, ttl)
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        """Registers the public methods of instance, as name.method if name is
+        given, and those of the attributes listed in namespaces (see
+        streamrpc.dispatch)"""
+        self.__dispatcher.register_instance(instance, name, namespaces)
+
+    def cache(self, name):
+        """Returns the ResultCache of a cacheable function, or None"""
+        return self.__caches.get(name)
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes the cached response for the given parameters, all cached
+        responses of a function if no parameters are given, or all cached
+        responses if no name is given"""
+        _invalidate(self.__caches, name, args, kwargs)
             
+_STREAM_PI = b"<?streamrpc stream?>"
+_STREAM = ("streamrpc", "stream") # The same, as decoded
+_TIMEOUT_PI = b"<?streamrpc timeout %r?>"
+
+def _timeout(pis):
+    """Returns the timeout in the processing instructions of a request, or None"""
+    for target, data in pis:
+        if target == "streamrpc" and data.startswith("timeout "):
+            try:
+                return float(data[8:])
+            except ValueError:
+                return None
+    return None
+_CHUNK_TAG = b"<streamChunk>"
+
 class XmlRpc(object):
-    def __init__(self, encoding=None, allow_none=True, use_datetime=0):
+    """XML-RPC. If shm is set, large binary values are passed through shared
+    memory (see streamrpc.shm). If ndarray is set, NumPy arrays are sent in
+    binary form (see streamrpc.ext)."""
+    ordered_responses = True
+
+    def __init__(self, encoding=None, allow_none=True, use_datetime=0, shm=None, ndarray=False):
+        self._ext = ext.extensions(shm, ndarray)
         self.__queue = []
         self.__encoding = encoding
         self.__allow_none = allow_none
         self.__use_datetime = use_datetime
-        self.__dispatcher = SimpleXMLRPCDispatcher(allow_none=allow_none, encoding=encoding)
+        self.__dispatcher = dispatch.Dispatcher()
+        self.__caches = {}
         
     def splitfmt(self):
         return "xml"
+
+    def splitter(self, maxdocsize=None):
+        """Returns a push-style splitter that also decodes the messages (see
+        streamrpc.xmlstream). Its messages are accepted wherever the raw
+        message is."""
+        return xmlstream.XmlDecoder(self.__use_datetime, maxdocsize=maxdocsize)
+
+    def __message(self, s):
+        if isinstance(s, xmlstream.XmlMessage):
+            return s
+        return xmlstream.loads(s, self.__use_datetime)
         
-    def initiate_request(self, method, args, kwargs, completion):
-        if kwargs: raise NotImplemented("Keyword arguments not supported in XML-RPC mode")
-        self.__queue.append(completion)
-        return xmlrpc_dumps(args, method, encoding=self.__encoding, allow_none=self.__allow_none)
+    def initiate_request(self, method, args, kwargs, completion, on_chunk=None, timeout=None):
+        """Encodes a request. If on_chunk is given, the result is requested as a
+        stream (marked by a processing instruction in the methodCall element):
+        on_chunk is called with each list of items as it arrives, and
+        completion with the number of items at the end. A timeout (seconds) is
+        sent likewise, as <?streamrpc timeout 1.5?>."""
+        if kwargs: raise NotImplementedError("Keyword arguments not supported in XML-RPC mode")
+        if self._ext:
+            args, kwargs, completion = _export_request(self._ext, args, kwargs, completion)
+            args = tuple(args)
+        req = xmlrpc_dumps(args, method, encoding=self.__encoding, allow_none=self.__allow_none)
+        pis = b""
+        if on_chunk is not None:
+            pis += _STREAM_PI
+        if timeout is not None:
+            pis += _TIMEOUT_PI % float(timeout)
+        if pis:
+            req = req.replace(b"<methodCall>", b"<methodCall>" + pis, 1)
+        self.__queue.append((completion, on_chunk))
+        return req
         
     def handle_response(self, rstr):
-        completion = self.__queue.pop(0)
+        completion, on_chunk = self.__queue[0]
+        msg = self.__message(rstr)
+        if msg.root == "streamChunk":
+            # Chunk of a streamed result, the request is still outstanding
+            on_chunk(self.__load(msg.loads()[0][0]))
+            return
+        self.__queue.pop(0)
         try:
-            response = xmlrpc_loads(rstr, self.__use_datetime)
-            completion(response[0][0], None)
-        except Fault as f:
+            result = self.__load(msg.loads()[0][0])
+        except xmlrpclib.Fault as f:
             completion(None, f)
+        except (OSError, ValueError):
+            completion(None, sys.exc_info()[1])
+        else:
+            completion(*_stream_end(result, on_chunk))
+
+    def __load(self, obj):
+        return self._ext.load(obj) if self._ext else obj
+
+    def initiate_notification(self, method, args, kwargs):
+        raise NotImplementedError("Notifications not supported in XML-RPC mode")
+
+    def initiate_batch(self, requests):
+        raise NotImplementedError("Batch requests not supported in XML-RPC mode")
+
+    def abort_requests(self, err):
+        queue, self.__queue = self.__queue, []
+        for completion, on_chunk in queue:
+            completion(None, err)
     
     def dispatch_request(self, reqstr):
-        p,m = xmlrpc_loads(reqstr, self.__use_datetime)
+        return self.decode_request(reqstr).run()
+
+    def handle_message(self, s):
+        """Handles a response and returns None, or decodes a request and returns
+        it. Used when both ends make calls over the same stream."""
+        msg = self.__message(s)
+        if msg.root == "methodCall":
+            return self.decode_request(msg)
+        self.handle_response(msg)
+
+    def decode_request(self, reqstr, received=None):
+        """Decodes a request into a Call (see JsonRpc.decode_request)"""
+        msg = self.__message(reqstr)
+        p,m = msg.loads()
+        stream = _STREAM in msg.pis
+        handler = self.__dispatcher.get(m)
+        if handler is None:
+            return Call(self, m, None, stream=stream, fault=Exception('method "%s" is not supported' % m))
+        err = handler.check(p, None)
+        if err is not None:
+            return Call(self, m, None, stream=stream, fault=TypeError("%s() %s" % (m, err)))
+        if self._ext:
+            try:
+                p = tuple(self._ext.load(p))
+            except (OSError, ValueError):
+                return Call(self, m, None, stream=stream, fault=xmlrpclib.Fault(-32602, "Invalid params: %s" % sys.exc_info()[1]))
+        cache = key = None
+        if self.__caches:
+            cache, key, hit = _lookup(self.__caches, m, p, None, stream)
+            if hit is not None:
+                return _CachedCall(self, m, hit)
+        return Call(self, m, handler.func, p, stream=stream, cache=cache, key=key, deadline=_deadline(_timeout(msg.pis), received))
+
+    def encode_chunk(self, call, items):
+        if self._ext:
+            items = self._ext.export(items)
+        return _CHUNK_TAG + xmlrpc_dumps((items,), allow_none=self.__allow_none, encoding=self.__encoding) + b"</streamChunk>"
+
+    def encode_response(self, call, result=None, exc=None):
         try:
-            rsp = self.__dispatcher._dispatch(m, p)
-            response = xmlrpc_dumps((rsp,), allow_none=self.__allow_none, encoding=self.__encoding)
-        except Fault as fault:
-            response = xmlrpc_dumps(fault, allow_none=self.__allow_none, encoding=self.__encoding)
+            if exc is None:
+                if self._ext:
+                    result = self._ext.export(result)
+                if call.cache is None and chunked.is_large(result):
+                    marshaller = xmlrpclib.Marshaller(self.__encoding, self.__allow_none)
+                    pieces = chunked.iterencode_xml(result, marshaller)
+                    return Parts(chunked.coalesce(_chain("<params>\n<param>\n", pieces, "</param>\n</params>\n"), _utf8))
+                data = xmlrpc_dumps((result,), allow_none=self.__allow_none, encoding=self.__encoding)
+                if call.cache is not None and not (self._ext and self._ext.shm):
+                    call.cache.put(call.key, data)
+                return data
+            if isinstance(exc, xmlrpclib.Fault):
+                return xmlrpc_dumps(exc, allow_none=self.__allow_none, encoding=self.__encoding)
+            raise exc
+        except xmlrpclib.Fault as fault:
+            return xmlrpc_dumps(fault, allow_none=self.__allow_none, encoding=self.__encoding)
         except:
             exc_type, exc_value, exc_tb = sys.exc_info()
-            response = xmlrpc_dumps(
-                Fault(1, "%s:%s" % (exc_type, exc_value)),
+            return xmlrpc_dumps(
+                xmlrpclib.Fault(1, "%s:%s" % (exc_type, exc_value)),
                 encoding=self.__encoding, allow_none=self.__allow_none)
-        return response
         
-    def register_function(self, func, name=None):
-        self.__dispatcher.register_function(func, name)
-        
\ No newline at end of file
+    def register_function(self, func, name=None, cacheable=False, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        """Registers func under name (by default its own name). If cacheable is
+        set, responses are cached (see streamrpc.cache)."""
+        name = self.__dispatcher.register_function(func, name)
+        _register_cache(self.__caches, name, cacheable, maxsize, ttl)
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        """Registers the public methods of instance (see JsonRpc.register_instance)"""
+        self.__dispatcher.register_instance(instance, name, namespaces)
+
+    def cache(self, name):
+        """Returns the ResultCache of a cacheable function, or None"""
+        return self.__caches.get(name)
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes cached responses (see JsonRpc.invalidate)"""
+        _invalidate(self.__caches, name, args, kwargs)
+
+class MsgPackRpc(JsonRpc):
+    """JSON-RPC 2.0 messages encoded as MessagePack. Binary strings are sent as
+    they are, and numbers are sent in binary form. MessagePack documents cannot
+    be split by scanning the stream, so messages are always sent as
+    length-prefixed frames."""
+    def __init__(self, shm=None, ndarray=False):
+        JsonRpc.__init__(self, 2, MsgPackCodec(), shm, ndarray)
+
+    def splitfmt(self):
+        return None
+
+    @staticmethod
+    def detect(s):
+        """True if a message starting with the byte s is MessagePack (a map or,
+        for batches, an array)"""
+        c = ord(s)
+        return 0x80 <= c <= 0x9f or 0xdc <= c <= 0xdf
+
+def detect(data):
+    """Returns the protocol class for a message, given (at least) its first
+    bytes, or None if it is not recognized"""
+    s = bytes(data[:1])
+    if s and MsgPackRpc.detect(s):
+        return MsgPackRpc
+    s = bytes(data.lstrip()[:1])
+    if s == b'<':
+        return XmlRpc
+    if s and s in b'{[':
+        return JsonRpc
+    return None
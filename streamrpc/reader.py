@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*
+#
+#   reader.py - Event-driven stream input
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Event-driven stream input
+
+Pipes and sockets are read in non-blocking mode. When no data is available,
+the reader sleeps in the selectors module (epoll/kqueue where available)
+until the descriptor becomes readable, instead of polling.
+
+Example (waiting on many streams):
+----------------------------------
+
+    sel = StreamSelector()
+    for proc in processes:
+        sel.register(StreamReader(proc.stdout.fileno()), proc)
+    for reader, proc in sel.select(timeout=1):
+        data = reader.read(65536)
+"""
+
+import os
+import time
+import selectors
+
+__ALL__ = ["StreamReader", "StreamSelector"]
+
+BUFSIZE = 65536
+
+class StreamReader(object):
+    """Reader for a non-blocking file descriptor. Reads smaller than the
+    buffer size are served from one reusable buffer, larger ones go straight
+    to the descriptor. read() and readinto() return as soon as any data is
+    available and return no data at EOF.
+
+    timeout is the default read timeout in seconds (None waits forever); each
+    call may override it. A read that times out raises TimeoutError.
+
+    owner is the object the descriptor belongs to (such as a file object), if
+    any. It is kept referenced, so that it does not close the descriptor when
+    it is collected while the reader is still in use."""
+    def __init__(self, fd, bufsize=BUFSIZE, timeout=None, prefix=b"", owner=None):
+        self.timeout = timeout
+        self.__fd = fd
+        self.__owner = owner
+        self.__buf = bytearray(max(bufsize, len(prefix)))
+        self.__view = memoryview(self.__buf)
+        self.__pos = 0
+        self.__end = len(prefix)
+        self.__view[:self.__end] = prefix
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(fd, selectors.EVENT_READ)
+
+    @property
+    def fd(self):
+        # Not fileno(): consumers like splitstream would bypass the buffer
+        return self.__fd
+
+    def pending(self):
+        """Number of bytes that can be read without touching the descriptor"""
+        return self.__end - self.__pos
+
+    def __readv(self, buf, timeout):
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return os.readv(self.__fd, [buf])
+            except BlockingIOError:
+                pass
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not self.__selector.select(remaining) and remaining is not None:
+                raise TimeoutError("Timed out waiting for data")
+
+    def read(self, n, timeout=None):
+        if self.__pos == self.__end:
+            if n >= len(self.__buf):
+                buf = bytearray(n)
+                return bytes(buf[:self.__readv(buf, timeout)])
+            self.__pos = 0
+            self.__end = self.__readv(self.__buf, timeout)
+        k = min(n, self.__end - self.__pos)
+        d = bytes(self.__view[self.__pos:self.__pos + k])
+        self.__pos += k
+        return d
+
+    def readinto(self, b, timeout=None):
+        if self.__pos == self.__end:
+            if len(b) >= len(self.__buf):
+                return self.__readv(b, timeout)
+            self.__pos = 0
+            self.__end = self.__readv(self.__buf, timeout)
+        k = min(len(b), self.__end - self.__pos)
+        b[:k] = self.__view[self.__pos:self.__pos + k]
+        self.__pos += k
+        return k
+
+    def close(self):
+        """Releases the selector (the descriptor is owned by the caller)"""
+        self.__selector.close()
+
+class StreamSelector(object):
+    """Lets one thread wait for input on any number of StreamReaders"""
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+
+    def register(self, reader, data=None):
+        self.__selector.register(reader.fd, selectors.EVENT_READ, (reader, data))
+
+    def unregister(self, reader):
+        self.__selector.unregister(reader.fd)
+
+    def select(self, timeout=None):
+        """Returns (reader, data) for every reader that can be read without
+        blocking (it has buffered data, data on its descriptor or is at EOF).
+        Returns an empty list on timeout."""
+        buffered = [key.data for key in self.__selector.get_map().values() if key.data[0].pending()]
+        ready = [key.data for key, events in self.__selector.select(0 if buffered else timeout)]
+        return buffered + [r for r in ready if not r[0].pending()]
+
+    def close(self):
+        self.__selector.close()
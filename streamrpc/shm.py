@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*
+#
+#   shm.py - Shared memory side channel for large binary values
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Shared memory side channel for large binary values
+
+For processes on the same host, binary values (bytes, bytearray, memoryview)
+of at least threshold bytes are not sent in the message. Instead they are
+copied into a shared memory segment (a file in /dev/shm), and the message
+only carries a handle:
+
+    {"__shm__": "streamrpc-<pid>-<random>"}
+
+Both ends must enable the channel (the shm argument of the clients and
+servers). Received values are read-only memoryviews that map the segment
+directly, without copying.
+
+Lifetime: the receiver removes the segment as soon as it has mapped it, and
+the mapping is released when the memoryview is no longer referenced. A
+client also removes the segments of a request when the request completes or
+fails, in case the server never got to them. Segments of responses that the
+client never reads are left behind; their names start with "streamrpc-" and
+the pid of the sender.
+"""
+
+import os
+import re
+import mmap
+import tempfile
+
+__ALL__ = ["ShmChannel", "channel", "is_handle"]
+
+DEFAULT_THRESHOLD = 1024*1024
+
+_KEY = "__shm__"
+_NAME = re.compile(r"^streamrpc-\d+-[0-9a-f]+$")
+
+def _directory():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+class ShmChannel(object):
+    """Moves binary values of at least threshold bytes through shared memory
+    segments in directory (by default /dev/shm, where available)"""
+    def __init__(self, threshold=DEFAULT_THRESHOLD, directory=None):
+        self.threshold = threshold
+        self.directory = directory or _directory()
+
+    def export(self, obj, names=None):
+        """Returns obj with large binary values replaced by handles. The names
+        of the created segments are appended to names."""
+        t = type(obj)
+        if t is bytes or t is bytearray or t is memoryview:
+            if len(obj) < max(self.threshold, 1):
+                return obj
+            name = self.__create(obj)
+            if names is not None:
+                names.append(name)
+            return {_KEY: name}
+        if t is list or t is tuple:
+            return [self.export(o, names) for o in obj]
+        if t is dict:
+            return dict((k, self.export(v, names)) for k, v in obj.items())
+        return obj
+
+    def load(self, obj):
+        """Returns obj with handles replaced by memoryviews of the segments"""
+        t = type(obj)
+        if t is dict:
+            if is_handle(obj):
+                return self.__open(obj[_KEY])
+            return dict((k, self.load(v)) for k, v in obj.items())
+        if t is list or t is tuple:
+            return [self.load(o) for o in obj]
+        return obj
+
+    def remove(self, names):
+        """Removes segments, if they still exist"""
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def __create(self, data):
+        name = "streamrpc-%d-%s" % (os.getpid(), os.urandom(8).hex())
+        fd = os.open(os.path.join(self.directory, name), os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            n = len(memoryview(data).cast("B"))
+            os.ftruncate(fd, n)
+            m = mmap.mmap(fd, n)
+            try:
+                m[:] = memoryview(data).cast("B")
+            finally:
+                m.close()
+        except Exception:
+            self.remove([name])
+            raise
+        finally:
+            os.close(fd)
+        return name
+
+    def __open(self, name):
+        if not isinstance(name, str) or not _NAME.match(name):
+            raise ValueError("Invalid shared memory handle")
+        path = os.path.join(self.directory, name)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.unlink(path)
+            n = os.fstat(fd).st_size
+            if not n:
+                return memoryview(b"")
+            return memoryview(mmap.mmap(fd, n, access=mmap.ACCESS_READ))
+        finally:
+            os.close(fd)
+
+def channel(shm):
+    """Returns the ShmChannel for the shm argument of clients and servers:
+    None/False (disabled), True (default settings) or a ShmChannel"""
+    if shm is True:
+        return ShmChannel()
+    return shm or None
+
+def is_handle(obj):
+    return type(obj) is dict and len(obj) == 1 and _KEY in obj
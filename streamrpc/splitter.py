@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*
+#
+#   splitter.py - Incremental document splitter
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import re
+
+__ALL__ = ["Splitter", "splitfile"]
+
+BUFSIZE = 65536
+
+_JSON_START = re.compile(br'[{\[]')
+_JSON_TOKEN = re.compile(br'[{}\[\]"]')
+_JSON_STRING = re.compile(br'["\\]')
+_XML_START = re.compile(br'<')
+
+class Splitter(object):
+    """Push-style counterpart of splitstream.splitfile. Data is fed in chunks
+    as it arrives, and every call returns the documents completed so far. This
+    is used where a blocking read() is not available (e.g. asyncio streams)."""
+    def __init__(self, format, maxdocsize=None):
+        if format == "json":
+            self.__scan = self.__scan_json
+        elif format == "xml":
+            self.__scan = self.__scan_xml
+        else:
+            raise ValueError("Unsupported format: %s" % format)
+        self.__buf = bytearray()
+        self.__pos = 0
+        self.__start = -1
+        self.__depth = 0
+        self.__instr = False
+        self.__maxdocsize = maxdocsize
+
+    def feed(self, data):
+        buf = self.__buf
+        buf += data
+        docs = []
+        while True:
+            end = self.__scan()
+            if end < 0:
+                break
+            docs.append(bytes(buf[self.__start:end]))
+            del buf[:end]
+            self.__pos = 0
+            self.__start = -1
+            self.__depth = 0
+        if self.__start < 0:
+            del buf[:]
+            self.__pos = 0
+        elif self.__maxdocsize and len(buf) - self.__start > self.__maxdocsize:
+            raise ValueError("Document exceeds maximum size of %d bytes" % self.__maxdocsize)
+        return docs
+
+    def __scan_json(self):
+        buf = self.__buf
+        pos = self.__pos
+        if self.__start < 0:
+            m = _JSON_START.search(buf, pos)
+            if not m:
+                return -1
+            self.__start = pos = m.start()
+        depth = self.__depth
+        try:
+            while True:
+                if self.__instr:
+                    m = _JSON_STRING.search(buf, pos)
+                    if not m:
+                        pos = len(buf)
+                        return -1
+                    if buf[m.start()] == 0x5c: # Backslash escape
+                        if m.end() >= len(buf):
+                            pos = m.start() # Need the escaped character
+                            return -1
+                        pos = m.end() + 1
+                    else:
+                        self.__instr = False
+                        pos = m.end()
+                    continue
+                m = _JSON_TOKEN.search(buf, pos)
+                if not m:
+                    pos = len(buf)
+                    return -1
+                c = buf[m.start()]
+                pos = m.end()
+                if c == 0x22:
+                    self.__instr = True
+                elif c == 0x7b or c == 0x5b:
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return pos
+        finally:
+            self.__pos = pos
+            self.__depth = depth
+
+    def __scan_xml(self):
+        buf = self.__buf
+        pos = self.__pos
+        if self.__start < 0:
+            m = _XML_START.search(buf, pos)
+            if not m:
+                return -1
+            self.__start = pos = m.start()
+        depth = self.__depth
+        try:
+            while True:
+                i = buf.find(b'<', pos)
+                if i < 0:
+                    pos = len(buf)
+                    return -1
+                pos = i # Restart here if the markup is incomplete
+                if buf.startswith(b'<!', i) and len(buf) - i < 9:
+                    return -1
+                if buf.startswith(b'<?', i):
+                    j = buf.find(b'?>', i + 2)
+                    if j < 0: return -1
+                    pos = j + 2
+                elif buf.startswith(b'<!--', i):
+                    j = buf.find(b'-->', i + 4)
+                    if j < 0: return -1
+                    pos = j + 3
+                elif buf.startswith(b'<![CDATA[', i):
+                    j = buf.find(b']]>', i + 9)
+                    if j < 0: return -1
+                    pos = j + 3
+                else:
+                    j = buf.find(b'>', i + 1)
+                    if j < 0: return -1
+                    pos = j + 1
+                    if buf.startswith(b'<!', i):
+                        continue
+                    if buf[i + 1] == 0x2f: # End tag
+                        depth -= 1
+                    elif buf[j - 1] != 0x2f: # Start tag (not empty-element)
+                        depth += 1
+                    if depth == 0:
+                        return pos
+        finally:
+            self.__pos = pos
+            self.__depth = depth
+
+def splitfile(f, splitter, preamble=b"", bufsize=BUFSIZE):
+    """Generates the documents that splitter (e.g. a Splitter) splits from what
+    is read from f. preamble is fed first, for use when the start of the stream
+    has already been read. f.read() must return as soon as any data is
+    available, like the readers of streamrpc.reader and streamrpc.net."""
+    if preamble:
+        for doc in splitter.feed(preamble):
+            yield doc
+    while True:
+        data = f.read(bufsize)
+        if not data:
+            return
+        for doc in splitter.feed(data):
+            yield doc
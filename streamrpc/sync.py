@@ -19,9 +19,22 @@
 #
 
 import sys, os, io
-import traceback
+import threading
+import itertools
+import collections
 import splitstream
 from . import protocol
+from . import splitter
+from .framing import FRAME_MARKER, COMPRESS_HELLO, read_frames, compress_threshold as _compress_threshold, FramedWriter
+from .reader import StreamReader
+from .cache import DEFAULT_MAXSIZE
+from . import metrics as _metrics
+from .lazy import LazyModule
+
+# Only needed for some options, or on errors (see streamrpc.lazy)
+futures = LazyModule("concurrent.futures")
+traceback = LazyModule("traceback")
+_net = LazyModule(".net", __package__)
 
 EAGAIN = 35
 EPIPE = 32
@@ -32,7 +45,9 @@ try:
 except (ImportError, AttributeError): # Platform does not define error code?
     pass
 
-__ALL__ = ["Server", "XmlClient", "XmlServer", "JsonClient", "JsonServer"]
+STREAM_BUFFER = 100 * protocol.CHUNK_ITEMS # Items of a call_stream kept waiting for the caller
+
+__ALL__ = ["Server", "XmlClient", "XmlServer", "JsonClient", "JsonServer", "MsgPackClient", "MsgPackServer", "Batch", "Peer", "XmlPeer", "JsonPeer"]
         
 def _ios(input, output, process, socket):
     if process:
@@ -42,20 +57,13 @@ def _ios(input, output, process, socket):
     elif socket:
         if input or output:
             raise ValueError("Parameters input, output are mutually exclusive with socket")
-        class SocketReader:
-            def read(n):
-                return socket.recv(n)
-        class SocketWriter:
-            def write(n):
-                socket.send(n)
-            close = socket.close
-        return (SocketReader(), SocketWriter())
+        return (_net.SocketReader(socket), _net.SocketWriter(socket))
     else:
         return (_wrapinput(input), _wrapoutput(output))
         
 def _wrapoutput(f):
     if isinstance(f, io.TextIOWrapper):
-        f = f.buffer.raw
+        f = getattr(f.buffer, "raw", f.buffer) # Already raw if unbuffered (python -u)
     return f
     
         
@@ -71,38 +79,55 @@ def _wrapinput(f):
     
     try:
         # Set file descriptor to nonblocking. Does not work on Windows
-        import fcntl, select, stat
+        import fcntl, stat
         fmode = os.fstat(fd).st_mode
         if stat.S_ISFIFO(fmode) or stat.S_ISCHR(fmode) or stat.S_ISSOCK(fmode):
             fl = fcntl.fcntl(fd, fcntl.F_GETFL)
             fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-            rd = f.read
-            def my_read(n):
-                while True:
-                    try:
-                        d = rd(n)
-                        if d is None:
-                            select.select([fd], [], [], 1)
-                            continue
-                    except IOError as e:
-                        if e.errno == EAGAIN:
-                            select.select([fd], [], [], 1)
-                            continue
-                        raise
-                    break
-                return d
-            
-            class InputWrapper(object):
-                def __init__(self, read_func):
-                    self.read = read_func
-            f = InputWrapper(my_read)
+            prefix = b""
+            if hasattr(f, "peek"):
+                # Take over anything already buffered by the file object
+                prefix = f.read(len(f.peek(0)))
+            f = StreamReader(fd, prefix=prefix, owner=f)
     except ImportError:
         pass
             
         
     return f
+
+def _borrowed_fd(f):
+    # The descriptor of a file object that does not close it (such as stdout)
+    if isinstance(f, io.FileIO) and not f.closefd:
+        return f.fileno()
+    return None
+
+def _release_fd(fd):
+    """Makes the other end of a borrowed descriptor see EOF, which closing its
+    file object does not. /dev/null takes its place, so that the descriptor
+    number is not reused while the file object refers to it."""
+    if fd is None:
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, fd)
+    finally:
+        os.close(devnull)
+
+def _close_reader(f):
+    # Releases the selector of a StreamReader, once nothing reads from it
+    if isinstance(f, StreamReader):
+        f.close()
     
         
+def _splitfile(f, proto, maxdocsize=None, preamble=b"", decode=True):
+    """Splits the messages read from f. XML-RPC messages are decoded while
+    they are split (see streamrpc.xmlstream), unless decode is false."""
+    if decode and proto.splitfmt() == "xml":
+        return splitter.splitfile(f, proto.splitter(maxdocsize), preamble)
+    kw = {"maxdocsize": maxdocsize} if maxdocsize else {}
+    return splitstream.splitfile(f, format=proto.splitfmt(), preamble=preamble, **kw)
+
+        
 class Method(object):
     def __init__(self, request, name):
         self.__request = request
@@ -112,13 +137,117 @@ class Method(object):
     def __call__(self, *args, **kw):
         return self.__request(self.__name, args, kw)
         
+class Notify(object):
+    """Sends notifications: calls that are not answered, so the caller does not
+    wait and never learns whether they succeeded"""
+    def __init__(self, send):
+        self.__send = send
+    def __getattr__(self, name):
+        return Method(self.__send, name)
+        
+class Timed(object):
+    """Makes calls with a timeout, as rpc.timeout(seconds).method(...)"""
+    def __init__(self, request, timeout):
+        self.__request = request
+        self.__timeout = timeout
+    def __call(self, method, args, kwargs):
+        return self.__request(method, args, kwargs, self.__timeout)
+    def __getattr__(self, name):
+        return Method(self.__call, name)
+        
+class Batch(object):
+    """Collects calls and sends them as one batch request when the context
+    exits (or when send() is called). Each call returns a Future."""
+    def __init__(self, send):
+        self.__send = send
+        self.__requests = []
+        self.__futures = []
+        
+    def __add(self, method, args, kwargs):
+        future = futures.Future()
+        
+        def on_response(response, err):
+            if future.done(): return
+            if err: future.set_exception(err)
+            else: future.set_result(response)
+            
+        self.__requests.append((method, args, kwargs, on_response))
+        self.__futures.append(future)
+        return future
+        
+    def __add_notification(self, method, args, kwargs):
+        self.__requests.append((method, args, kwargs, None))
+        
+    @property
+    def notify(self):
+        """Adds notifications to the batch, as batch.notify.method(...)"""
+        return Notify(self.__add_notification)
+        
+    def send(self):
+        requests, self.__requests = self.__requests, []
+        if requests:
+            self.__send(requests)
+            
+    def results(self):
+        """Returns the results of all calls, in call order"""
+        return [f.result() for f in self.__futures]
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.send()
+        
+    def __getattr__(self, name):
+        return Method(self.__add, name)
+        
 class Client(object):
-    def __init__(self, protocol, input=None, output=None, process=None, socket=None):
+    """Client base class. If framed is set, messages are sent and received as
+    length-prefixed frames (see streamrpc.framing) instead of being split by
+    scanning the stream. The server detects this automatically.
+    
+    If compress is set (True, or the size in bytes from which messages are
+    compressed), messages are sent as zlib-compressed frames, and the server is
+    told that it may compress its responses too.
+    
+    If metrics is set (True or a streamrpc.metrics.Metrics), calls are measured
+    and recorded in self.metrics.
+    
+    JSON-RPC notifications are sent as rpc.notify.method(...), which returns as
+    soon as the request is written. To call a remote method named "notify", use
+    call_async("notify", ...).
+    
+    If timeout is set (seconds), calls wait at most that long for their result
+    and then raise TimeoutError (from concurrent.futures). The timeout is sent
+    with the request, and the server does not run requests that have waited for
+    longer than that (they fail with a Fault with code DEADLINE_EXCEEDED).
+    rpc.timeout(seconds).method(...) sets the timeout of a single call (so a
+    remote method named "timeout" must also be called with call_async). The
+    futures of call_async do not time out, use result(timeout)."""
+    def __init__(self, protocol, input=None, output=None, process=None, socket=None, framed=False, compress=False, metrics=None, timeout=None):
         self.__input, self.__output = _ios(input, output, process, socket)
         self.__protocol = protocol
-        self.__split = splitstream.splitfile(self.__input, format=protocol.splitfmt())
+        self.__process = process
+        self.metrics = _metrics.metrics(metrics)
+        threshold = _compress_threshold(compress)
+        if framed or threshold is not None or not protocol.splitfmt():
+            self.__output = FramedWriter(self.__output, threshold)
+            self.__split = read_frames(self.__input)
+        else:
+            self.__split = _splitfile(self.__input, protocol)
+        self.__lock = threading.Lock()
+        self.__receiver = None
+        self.__error = None
+        self.__timeout = timeout
         
-    def __request(self, method, args, kwargs):
+    def __request(self, method, args, kwargs, timeout=None):
+        if timeout is None:
+            timeout = self.__timeout
+        if self.__receiver is not None or timeout is not None:
+            # Responses are being read by the receiver thread (which is needed
+            # to stop waiting after the timeout)
+            return self.__call_async(method, args, kwargs, timeout).result(timeout)
         
         r = []
         
@@ -126,43 +255,385 @@ class Client(object):
             if err: raise err
             r.append(response)
             
-        req = self.__protocol.initiate_request(method, args, kwargs, on_response)
-        self.__output.write(req)
-        self.__output.flush()
+        self.__send(method, args, kwargs, on_response)
             
         for s in self.__split:
-            self.__protocol.handle_response(s)
-            break
+            self.__handle(s)
+            if r: # Otherwise a chunk of a stream being read
+                break
             
         if not r:
             raise ValueError("Did not receive a response")
         
         return r[0]
 
+    def call_async(self, method, *args, **kwargs):
+        """Sends a request without waiting for the response and returns a Future
+        for the result. Any number of requests may be in flight at the same time.
+        The first call starts a thread that reads all subsequent responses."""
+        return self.__call_async(method, args, kwargs, self.__timeout)
+        
+    def __call_async(self, method, args, kwargs, timeout):
+        future = futures.Future()
+        
+        def on_response(response, err):
+            if err: future.set_exception(err)
+            else: future.set_result(response)
+            
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            self.__send(method, args, kwargs, on_response, timeout=timeout)
+            if self.__receiver is None:
+                self.__receiver = threading.Thread(target=self.__receive, name="streamrpc-receiver")
+                self.__receiver.daemon = True
+                self.__receiver.start()
+        return future
+        
+    def call_stream(self, method, *args, **kwargs):
+        """Calls a method that returns an iterator (e.g. a generator function) and
+        returns an iterator over its items, which are sent in chunks as the
+        method produces them. A method that returns a list works too (its
+        items arrive all at once).
+
+        At most STREAM_BUFFER items are kept waiting for the caller: beyond
+        that, the thread that reads responses waits until the caller has taken
+        some, which in turn holds back the server."""
+        cond = threading.Condition()
+        items = collections.deque()
+        done = []
+        consumer = [threading.current_thread()] # Until the stream is read
+        
+        def on_chunk(chunk):
+            with cond:
+                # Only wait for a consumer in another thread (not when the
+                # consumer reads the messages itself), and not for one that is gone
+                while len(items) >= STREAM_BUFFER and consumer[0] not in (threading.current_thread(), None):
+                    cond.wait()
+                if consumer[0] is not None:
+                    items.extend(chunk)
+                cond.notify_all()
+                
+        def on_response(response, err):
+            with cond:
+                done.append(err)
+                cond.notify_all()
+                
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            self.__send(method, args, kwargs, on_response, on_chunk)
+        return self.__stream(cond, items, done, consumer)
+
+    @property
+    def notify(self):
+        return Notify(self.__notify)
+
+    def timeout(self, seconds):
+        """Makes a call with a timeout, as rpc.timeout(seconds).method(...)"""
+        return Timed(self.__request, seconds)
+
+    def __notify(self, method, args, kwargs):
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            req = self.__protocol.initiate_notification(method, args, kwargs)
+            self.__output.write(req)
+            self.__output.flush()
+            if self.metrics is not None:
+                self.metrics.record_bytes(bytes_out=len(req))
+
+    def __send(self, method, args, kwargs, completion, on_chunk=None, timeout=None):
+        metrics = self.metrics
+        if metrics is None:
+            req = self.__protocol.initiate_request(method, args, kwargs, completion, on_chunk, timeout)
+            self.__output.write(req)
+            self.__output.flush()
+            return
+        start = _metrics._now()
+        size = []
+        def on_response(response, err):
+            metrics.record_call(method, _metrics._now() - start, err is not None, bytes_out=size[0])
+            completion(response, err)
+        req = self.__protocol.initiate_request(method, args, kwargs, on_response, on_chunk, timeout)
+        size.append(len(req))
+        t = _metrics._now()
+        self.__output.write(req)
+        self.__output.flush()
+        metrics.record_phase("encode", t - start)
+        metrics.record_phase("write", _metrics._now() - t)
+
+    def __handle(self, s):
+        metrics = self.metrics
+        if metrics is None:
+            self.__protocol.handle_response(s)
+            return
+        t = _metrics._now()
+        self.__protocol.handle_response(s)
+        metrics.record_phase("decode", _metrics._now() - t)
+        metrics.record_bytes(bytes_in=len(s))
+        
+    def __stream(self, cond, items, done, consumer):
+        with cond:
+            consumer[:] = [threading.current_thread()]
+        try:
+            while True:
+                with cond:
+                    while not (items or done) and self.__receiver is not None:
+                        cond.wait()
+                    chunk = list(items)
+                    items.clear()
+                    end = list(done)
+                    cond.notify_all() # Room for more
+                for item in chunk:
+                    yield item
+                if end:
+                    if end[0] is not None:
+                        raise end[0]
+                    return
+                if not chunk and self.__receiver is None:
+                    # No receiver thread, so read the next message here
+                    s = next(self.__split, None)
+                    if s is None:
+                        raise ValueError("Did not receive a response")
+                    self.__handle(s)
+        finally:
+            # Abandoned (or done): the rest of the stream is dropped
+            with cond:
+                consumer[:] = [None]
+                items.clear()
+                cond.notify_all()
+        
+    def batch(self):
+        """Returns a Batch context for sending several calls as one request"""
+        return Batch(self.__send_batch)
+        
+    def __send_batch(self, requests):
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            req = self.__protocol.initiate_batch(requests)
+            self.__output.write(req)
+            self.__output.flush()
+            if self.metrics is not None:
+                self.metrics.record_bytes(bytes_out=len(req))
+            if self.__receiver is not None or all(r[3] is None for r in requests):
+                return # No response to wait for here
+            
+        for s in self.__split:
+            self.__handle(s)
+            break
+        
+        err = ValueError("Did not receive a response")
+        for r in requests:
+            if r[3] is not None:
+                r[3](None, err) # No-op for calls that were completed
+        
+    def __receive(self):
+        try:
+            for s in self.__split:
+                self.__handle(s)
+            raise EOFError("Connection closed")
+        except Exception:
+            with self.__lock:
+                self.__error = sys.exc_info()[1]
+                self.__protocol.abort_requests(self.__error)
+        finally:
+            _close_reader(self.__input)
+
+    def close(self):
+        """Closes the output stream, which makes a server reading it exit. If the
+        client was created for a process, waits for the process to exit. The
+        input is released once responses are no longer read from it."""
+        if self.__receiver is None: # Otherwise the receiver thread does it when done
+            _close_reader(self.__input)
+        try:
+            if hasattr(self.__output, "close"):
+                self.__output.close()
+        except (IOError, OSError): # Other end already gone
+            pass
+        if self.__process:
+            self.__process.wait()
+            self.__process.stdout.close()
+
     def __getattr__(self, name):
         return Method(self.__request, name)
         
 class XmlClient(Client):
-    def __init__(self, input=None, output=None, process=None, socket=None, encoding=None, allow_none=True, use_datetime=0):
-        Client.__init__(self, protocol.XmlRpc(encoding, allow_none, use_datetime), input, output, process, socket)
+    def __init__(self, input=None, output=None, process=None, socket=None, encoding=None, allow_none=True, use_datetime=0, framed=False, shm=None, ndarray=False, compress=False, metrics=None, timeout=None):
+        Client.__init__(self, protocol.XmlRpc(encoding, allow_none, use_datetime, shm, ndarray), input, output, process, socket, framed, compress, metrics, timeout)
         
 class JsonClient(Client):
-    def __init__(self, input=None, output=None, process=None, socket=None, version=2):
-        Client.__init__(self, protocol.JsonRpc(version), input, output, process, socket)
+    def __init__(self, input=None, output=None, process=None, socket=None, version=2, framed=False, codec=None, shm=None, ndarray=False, compress=False, metrics=None, timeout=None):
+        Client.__init__(self, protocol.JsonRpc(version, codec, shm, ndarray), input, output, process, socket, framed, compress, metrics, timeout)
+        
+class MsgPackClient(Client):
+    """Client for JSON-RPC 2.0 encoded as MessagePack (always framed)"""
+    def __init__(self, input=None, output=None, process=None, socket=None, shm=None, ndarray=False, compress=False, metrics=None, timeout=None):
+        Client.__init__(self, protocol.MsgPackRpc(shm, ndarray), input, output, process, socket, True, compress, metrics, timeout)
+        
+def _write_message(output, message):
+    """Writes and flushes one message, returning its size. The parts of a
+    chunked message (protocol.Parts) are written as they are encoded, unless
+    the output sends frames, which need the whole message. If encoding fails
+    partway, the output is closed (see streamrpc.chunked) and EOFError raised."""
+    if isinstance(message, protocol.Parts):
+        try:
+            if not isinstance(output, FramedWriter):
+                for part in message:
+                    output.write(part)
+                output.flush()
+                return message.size
+            message = message.join()
+        except (IOError, OSError):
+            raise
+        except Exception:
+            traceback.print_exc()
+            try:
+                output.close()
+            except (IOError, OSError):
+                pass
+            raise EOFError("Output closed, as a response could not be encoded")
+    output.write(message)
+    output.flush()
+    return len(message)
+
+class _ResponseWriter(object):
+    """Serializes writes to an output shared by several threads. Sequenced
+    responses of an ordered protocol are written in sequence order, no matter
+    in which order they complete. A response may consist of several messages
+    (see protocol.messages), which are flushed one at a time."""
+    def __init__(self, output, ordered):
+        self.__output = output
+        self.__ordered = ordered
+        self.__lock = threading.Lock()
+        self.__ready = {}
+        self.__seq = 0
+        self.__next = 0
+        self.__draining = False
+        self.__closed = False # After an encoding error
+        
+    def sequence(self):
+        seq = self.__seq
+        self.__seq += 1
+        return seq
         
+    def write(self, data, seq=None):
+        if seq is None or not self.__ordered:
+            self.__write(data)
+            return
+        with self.__lock:
+            self.__ready[seq] = data
+            if self.__draining:
+                return
+            # Whoever completes the next response in order writes all that are ready
+            self.__draining = True
+        try:
+            while True:
+                with self.__lock:
+                    if self.__next not in self.__ready:
+                        self.__draining = False
+                        return
+                    data = self.__ready.pop(self.__next)
+                    self.__next += 1
+                self.__write(data)
+        except:
+            with self.__lock:
+                self.__draining = False
+            raise
+
+    def __write(self, data):
+        # The messages of a streamed result are produced (by the function's
+        # iterator) outside the lock, which is only held to write each one
+        if data is None:
+            return
+        for message in protocol.messages(data):
+            with self.__lock:
+                if self.__closed:
+                    return # The rest is dropped
+                try:
+                    _write_message(self.__output, message)
+                except EOFError:
+                    self.__closed = True
+                    raise
+
+_worker_protocol = None
+
+def _init_worker(proto):
+    global _worker_protocol
+    _worker_protocol = proto
+    
+def _worker_dispatch(reqstr, received=None):
+    # Chunked messages are joined, to be sent back to the parent. received
+    # (from the parent) counts the time queued for a worker against the
+    # deadline, as time.monotonic is shared by the processes of a host
+    response = _worker_protocol.decode_request(reqstr, received).run()
+    return [m.join() if isinstance(m, protocol.Parts) else m for m in protocol.messages(response)]
+
+class _Measured(object):
+    """A response, with the function that records it in the metrics"""
+    __slots__ = ("response", "done")
+    def __init__(self, response, done):
+        self.response = response
+        self.done = done
+
 class Server(object):
     """Server that can respond to both JSON-RPC and XML-RPC requests and will respond
-    with the protocol of the request."""
-    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, protocol=None):
+    with the protocol of the request.
+    
+    If max_workers is set, requests are dispatched on a thread pool of that size and
+    each response is written as soon as it is ready. XML-RPC responses are still
+    written in request order, as XML-RPC has no request ids.
+    
+    If processes is set, all requests are dispatched on a pool of that many worker
+    processes. Alternatively, single functions can be registered with process=True,
+    in which case only those run in a pool with one worker per CPU. The raw request
+    and response documents are what is passed to and from the workers, and the
+    registered functions must be picklable (i.e. defined at module level). All
+    functions must be registered before the first request arrives.
+    
+    If shm is set (True or a streamrpc.shm.ShmChannel), large binary values are
+    passed through shared memory instead of the stream. This only works when both
+    ends run on the same host, and the client must set it too. Likewise, if ndarray
+    is set, NumPy arrays are sent in binary form (see streamrpc.ext).
+    
+    Responses to clients that send compressed frames are compressed too, from the
+    size given by compress (True for the default), unless compress is False.
+    
+    If metrics is set (True or a streamrpc.metrics.Metrics), requests are measured
+    and recorded in self.metrics. With worker processes, only the bytes and the
+    read and write phases are recorded.
+    
+    Requests that have waited for longer than the timeout sent by the client are
+    not run, but answered with a Fault with code DEADLINE_EXCEEDED. The wait
+    counts from when the server read the request, so with worker processes the
+    time queued for a worker counts too. If max_queue is set (with max_workers or processes), at most that many requests
+    are queued or running at a time, and further requests are answered at once
+    with a Fault with code SERVER_BUSY."""
+    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, protocol=None, max_workers=None, processes=None, shm=None, ndarray=False, compress=True, metrics=None, max_queue=None):
         self.input, self.output = _ios(input, output, process, socket)
         if not self.input:
             raise ValueError("Input was not set")
         if not self.output:
             raise ValueError("Output was not set")
+        self.__borrowed = _borrowed_fd(self.output)
         self.__regs = []
         self.__shouldclose = close
         self.__protocol = protocol
+        self.__shm = shm
+        self.__ndarray = ndarray
+        self.__compress = _compress_threshold(compress)
+        self.metrics = _metrics.metrics(metrics)
         self.__split = None
+        self.__max_workers = max_workers
+        self.__processes = processes
+        self.__process_methods = set()
+        self.__pool = None
+        self.__process_pool = None
+        self.__writer = None
+        self.__max_queue = max_queue
+        self.__queued = 0
+        self.__queue_lock = threading.Lock()
         
     def serve_forever(self):
         try:
@@ -186,54 +657,379 @@ class Server(object):
             f.close()
     
     def close(self):
+        if self.__pool:
+            self.__pool.shutdown()
+            self.__pool = None
+        if self.__process_pool:
+            self.__process_pool.shutdown()
+            self.__process_pool = None
         self.__close_file(self.input)
         self.__close_file(self.output)
                     
     def process_one(self):
-        got_protocol = False
-        
-        s = b""
-        while not self.__protocol:
-            got_protocol = True
-            s = self.input.read(1)
-            if s == b'<':
-                self.__protocol = protocol.XmlRpc()
-            elif s in b'{[':
-                self.__protocol = protocol.JsonRpc()
-        
         if not self.__split:
-            self.__split = splitstream.splitfile(self.input, format=self.__protocol.splitfmt(), maxdocsize=1024*1024*120, preamble=s)
-        
-        if got_protocol:
-            for a,kw in self.__regs:
-                self.__protocol.register_function(*a, **kw)
-            self.__regs = []
+            s = b""
+            while not s in (b'<', b'{', b'[', FRAME_MARKER, COMPRESS_HELLO):
+                s = self.input.read(1)
+                if not s:
+                    raise EOFError()
+            
+            framed = s in (FRAME_MARKER, COMPRESS_HELLO)
+            if framed:
+                # Length-prefixed frames, respond likewise (compressed if the client can read that)
+                self.__split = read_frames(self.input, preamble=s)
+                self.output = FramedWriter(self.output, self.__compress if s == COMPRESS_HELLO else None)
+                if not self.__protocol:
+                    first = next(self.__split, None)
+                    if first is None:
+                        raise EOFError()
+                    s = first
+                    self.__split = itertools.chain([first], self.__split)
+            elif self.__protocol and not self.__protocol.splitfmt():
+                raise ValueError("Protocol requires length-prefixed frames")
+            
+            if not self.__protocol:
+                proto = protocol.detect(s)
+                if not proto:
+                    raise ValueError("Unknown protocol")
+                self.__protocol = proto(shm=self.__shm, ndarray=self.__ndarray)
+                for method,a,kw in self.__regs:
+                    getattr(self.__protocol, method)(*a, **kw)
+                self.__regs = []
+                
+            if not framed:
+                # Worker processes are passed the raw documents, not decoded ones
+                self.__split = _splitfile(self.input, self.__protocol, 1024*1024*120, s,
+                    decode=not (self.__processes or self.__process_methods))
         
         try:
+            start = _metrics._now() if self.metrics is not None else None
             for rsps in self.__split:
-                response = self.__protocol.dispatch_request(rsps)
-                self.output.write(response)
-                self.output.flush()
+                self.__dispatch(rsps, None if start is None else _metrics._now() - start)
                 return
             raise EOFError()
         except Exception: # Internal error
             self.close()
             raise
+            
+    def __dispatch(self, reqstr, read=None):
+        if not (self.__max_workers or self.__processes or self.__process_methods):
+            if self.metrics is not None:
+                self.__dispatch_measured(reqstr, read)
+                return
+            response = self.__protocol.dispatch_request(reqstr)
+            for data in protocol.messages(response):
+                _write_message(self.output, data)
+            return
+        if self.metrics is not None:
+            self.metrics.record_phase("read", read)
+            if self.__processes:
+                self.metrics.record_bytes(bytes_in=len(reqstr))
+            
+        received = protocol._now()
+        call = None
+        if self.__process_methods and not self.__processes:
+            call = self.__protocol.decode_request(reqstr, received)
+        if not self.__writer:
+            self.__writer = _ResponseWriter(self.output, self.__protocol.ordered_responses)
+        seq = self.__writer.sequence()
+        if self.__max_queue is not None:
+            with self.__queue_lock:
+                busy = self.__queued >= self.__max_queue
+                if not busy:
+                    self.__queued += 1
+            if busy:
+                future = futures.Future()
+                future.set_result(self.__busy(reqstr, call))
+                self.__write(seq, future, False)
+                return
+        if self.__processes or getattr(call, "method", None) in self.__process_methods:
+            if not self.__process_pool:
+                self.__process_pool = futures.ProcessPoolExecutor(self.__processes or None, initializer=_init_worker, initargs=(self.__protocol,))
+            future = self.__process_pool.submit(_worker_dispatch, reqstr, received)
+        elif self.__max_workers:
+            if not self.__pool:
+                self.__pool = futures.ThreadPoolExecutor(self.__max_workers)
+            # The worker also writes the response, as a streamed result is
+            # produced while it is written
+            self.__pool.submit(self.__serve, seq, reqstr, call, received)
+            return
+        else:
+            future = futures.Future()
+            future.set_result(self.__run(reqstr, call, received))
+        future.add_done_callback(lambda f: self.__write(seq, f, self.__max_queue is not None))
+        
+    def __busy(self, reqstr, call):
+        # The request is only decoded, for its id
+        if call is None:
+            call = self.__protocol.decode_request(reqstr)
+        return call.respond(exc=protocol.Fault(protocol.SERVER_BUSY, "Server busy"))
+        
+    def __dispatch_measured(self, reqstr, read):
+        response, done = self.metrics.run(self.__protocol, reqstr, read)
+        t = _metrics._now()
+        n = 0
+        for data in protocol.messages(response):
+            n += _write_message(self.output, data)
+        done(n, _metrics._now() - t)
+        
+    def __run(self, reqstr, call, received):
+        if self.metrics is not None:
+            response, done = self.metrics.run(self.__protocol, reqstr, call=call, received=received)
+            return _Measured(response, done)
+        if call is None:
+            call = self.__protocol.decode_request(reqstr, received)
+        return call.run()
+            
+    def __serve(self, seq, reqstr, call, received):
+        future = futures.Future()
+        try:
+            future.set_result(self.__run(reqstr, call, received))
+        except Exception as e:
+            future.set_exception(e)
+        self.__write(seq, future, self.__max_queue is not None)
+
+    def __write(self, seq, future, queued):
+        if queued:
+            # Done before writing, so that the client can send the next request
+            with self.__queue_lock:
+                self.__queued -= 1
+        response = None
+        try:
+            response = future.result()
+        except Exception:
+            traceback.print_exc()
+        done = None
+        if isinstance(response, _Measured):
+            response, done = response.response, response.done
+        t = _metrics._now() if self.metrics is not None else None
+        if t is not None and not isinstance(response, protocol.Parts):
+            # Recorded before the client sees the response, which may be written
+            # by another thread, so writing is not part of the call
+            self.__record(response, done)
+        try:
+            self.__writer.write(response, seq)
+        except EOFError: # Closed after an encoding error, while requests are still read
+            _release_fd(self.__borrowed)
+        except IOError as e:
+            if e.errno != EPIPE: # Broken pipe is detected by the reader
+                traceback.print_exc()
+        if t is not None:
+            self.metrics.record_phase("write", _metrics._now() - t)
+            if isinstance(response, protocol.Parts): # The size is known once written
+                self.__record(response, done)
+
+    def __record(self, response, done):
+        n = sum(len(m) for m in response) if isinstance(response, list) else 0 # From a worker process
+        if isinstance(response, (bytes, bytearray)):
+            n = len(response)
+        elif isinstance(response, protocol.Parts):
+            n = response.size
+        if done is not None:
+            done(n)
+        else:
+            self.metrics.record_bytes(bytes_out=n)
         
-    def register_function(self, *a, **kw):
+    def register_function(self, func, name=None, process=False, cacheable=False, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        """Registers func under name (by default its own name). If cacheable is
+        set, the responses of func are cached, at most maxsize of them and for
+        at most ttl seconds (see streamrpc.cache). Worker processes keep their
+        own caches, which invalidate() does not reach."""
+        if process:
+            self.__process_methods.add(name or func.__name__)
+        kw = {"cacheable": cacheable, "maxsize": maxsize, "ttl": ttl}
+        if self.__protocol:
+            self.__protocol.register_function(func, name, **kw)
+        else:
+            self.__regs.append(("register_function", (func, name), kw))
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        """Registers the public methods of instance, as name.method if name is
+        given, and those of the attributes listed in namespaces (see
+        streamrpc.dispatch)"""
         if self.__protocol:
-            self.__protocol.register_function(*a, **kw)
+            self.__protocol.register_instance(instance, name, namespaces)
         else:
-            self.__regs.append((a, kw))
+            self.__regs.append(("register_instance", (instance, name, namespaces), {}))
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes cached responses: for the given parameters, for all calls of
+        a function if no parameters are given, or all if no name is given"""
+        if self.__protocol:
+            self.__protocol.invalidate(name, *args, **kwargs)
+
+    def cache_info(self, name):
+        """Returns the hits, misses and size of the cache of a function as a
+        dict, or None if it is not cached (or no request has arrived yet)"""
+        cache = self.__protocol.cache(name) if self.__protocol else None
+        return cache.info() if cache is not None else None
 
 class XmlServer(Server):
     """XML-RPC server"""
-    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, encoding=None, allow_none=True, use_datetime=0):
+    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, encoding=None, allow_none=True, use_datetime=0, max_workers=None, processes=None, shm=None, ndarray=False, compress=True, metrics=None, max_queue=None):
         Server.__init__(self, input, output, process, socket, close, 
-            protocol=protocol.XmlRpc(encoding, allow_none, use_datetime))
+            protocol=protocol.XmlRpc(encoding, allow_none, use_datetime, shm, ndarray), max_workers=max_workers, processes=processes, compress=compress, metrics=metrics, max_queue=max_queue)
 
 class JsonServer(Server):
     """JSON-RPC server"""
-    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, version=2):
+    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, version=2, max_workers=None, processes=None, codec=None, shm=None, ndarray=False, compress=True, metrics=None, max_queue=None):
         Server.__init__(self, input, output, process, socket, close, 
-            protocol=protocol.JsonRpc(version))
+            protocol=protocol.JsonRpc(version, codec, shm, ndarray), max_workers=max_workers, processes=processes, compress=compress, metrics=metrics, max_queue=max_queue)
+
+class MsgPackServer(Server):
+    """JSON-RPC 2.0 over MessagePack server"""
+    def __init__(self, input=sys.stdin, output=sys.stdout, process=None, socket=None, close=True, max_workers=None, processes=None, shm=None, ndarray=False, compress=True, metrics=None, max_queue=None):
+        Server.__init__(self, input, output, process, socket, close, 
+            protocol=protocol.MsgPackRpc(shm, ndarray), max_workers=max_workers, processes=processes, compress=compress, metrics=metrics, max_queue=max_queue)
+
+class Peer(object):
+    """Endpoint for full duplex RPC, where both ends can make calls to each other
+    over the same stream pair. Incoming requests are told apart from responses by
+    their shape and are handled on a thread pool, so that a handler may itself
+    make calls to the other end.
+    
+    Call serve_forever() to read incoming messages in the current thread until the
+    stream is closed, or start() to read them in a background thread. The latter
+    is done automatically on the first call if no thread is reading. Without any
+    streams given, stdin and stdout are used.
+    
+    Note that XML-RPC responses must be sent in request order, so with XML-RPC a
+    handler cannot wait for a call to the other end that in turn calls back into
+    this end again (that inner call would never be answered).
+    
+    Both ends must agree on whether length-prefixed frames are used (framed). With
+    compress set, messages are sent as compressed frames (see Client)."""
+    def __init__(self, protocol, input=None, output=None, process=None, socket=None, close=True, max_workers=None, framed=False, compress=False):
+        if not (input or output or process or socket):
+            input, output = sys.stdin, sys.stdout
+        self.__input, self.__output = _ios(input, output, process, socket)
+        if not self.__input:
+            raise ValueError("Input was not set")
+        if not self.__output:
+            raise ValueError("Output was not set")
+        self.__borrowed = _borrowed_fd(self.__output)
+        self.__protocol = protocol
+        threshold = _compress_threshold(compress)
+        if framed or threshold is not None or not protocol.splitfmt():
+            self.__output = FramedWriter(self.__output, threshold)
+            self.__split = read_frames(self.__input)
+        else:
+            self.__split = _splitfile(self.__input, protocol, 1024*1024*120)
+        self.__writer = _ResponseWriter(self.__output, protocol.ordered_responses)
+        self.__pool = futures.ThreadPoolExecutor(max_workers)
+        self.__lock = threading.Lock()
+        self.__receiving = False
+        self.__error = None
+        self.__shouldclose = close
+        
+    def __request(self, method, args, kwargs):
+        return self.call_async(method, *args, **kwargs).result()
+        
+    def call_async(self, method, *args, **kwargs):
+        """Sends a request without waiting for the response and returns a Future
+        for the result"""
+        future = futures.Future()
+        
+        def on_response(response, err):
+            if err: future.set_exception(err)
+            else: future.set_result(response)
+            
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            req = self.__protocol.initiate_request(method, args, kwargs, on_response)
+            self.__writer.write(req)
+            self.__start()
+        return future
+        
+    @property
+    def notify(self):
+        """Sends notifications, as peer.notify.method(...) (see Client)"""
+        return Notify(self.__notify)
+        
+    def __notify(self, method, args, kwargs):
+        with self.__lock:
+            if self.__error is not None:
+                raise self.__error
+            self.__writer.write(self.__protocol.initiate_notification(method, args, kwargs))
+        
+    def start(self):
+        """Starts reading incoming messages in a background thread"""
+        with self.__lock:
+            self.__start()
+            
+    def __start(self):
+        if not self.__receiving:
+            self.__receiving = True
+            receiver = threading.Thread(target=self.__receive, name="streamrpc-peer")
+            receiver.daemon = True
+            receiver.start()
+            
+    def serve_forever(self):
+        """Reads and handles incoming messages until the stream is closed"""
+        with self.__lock:
+            if self.__receiving:
+                raise ValueError("Messages are already being read by another thread")
+            self.__receiving = True
+        self.__receive()
+        
+    def __receive(self):
+        try:
+            for s in self.__split:
+                call = self.__protocol.handle_message(s)
+                if call is not None:
+                    self.__pool.submit(self.__handle, call, self.__writer.sequence())
+            err = EOFError("Connection closed")
+        except Exception:
+            err = sys.exc_info()[1]
+        with self.__lock:
+            self.__error = err
+            self.__protocol.abort_requests(err)
+        _close_reader(self.__input)
+        self.__pool.shutdown()
+        self.close()
+        
+    def __handle(self, call, seq):
+        response = None
+        try:
+            response = call.run()
+        except Exception:
+            traceback.print_exc()
+        try:
+            self.__writer.write(response, seq)
+        except EOFError: # Closed after an encoding error, while messages are still read
+            _release_fd(self.__borrowed)
+        except IOError as e:
+            if e.errno != EPIPE: # Broken pipe is detected by the reader
+                traceback.print_exc()
+                
+    def close(self):
+        if not self.__receiving: # Otherwise the reading thread does it when done
+            _close_reader(self.__input)
+        # Never close stdin or stderr, but close stdout to signify EOF if necessary
+        f = self.__output
+        if self.__shouldclose and f and (sys is None or not f in (sys.stdin, sys.stderr)) and hasattr(f, 'close'):
+            f.close()
+        
+    def register_function(self, func, name=None, cacheable=False, maxsize=DEFAULT_MAXSIZE, ttl=None):
+        self.__protocol.register_function(func, name, cacheable, maxsize, ttl)
+
+    def register_instance(self, instance, name=None, namespaces=()):
+        self.__protocol.register_instance(instance, name, namespaces)
+
+    def invalidate(self, name=None, *args, **kwargs):
+        """Removes cached responses (see Server.invalidate)"""
+        self.__protocol.invalidate(name, *args, **kwargs)
+        
+    def __getattr__(self, name):
+        return Method(self.__request, name)
+
+class XmlPeer(Peer):
+    """XML-RPC full duplex endpoint"""
+    def __init__(self, input=None, output=None, process=None, socket=None, close=True, encoding=None, allow_none=True, use_datetime=0, max_workers=None, framed=False, shm=None, ndarray=False, compress=False):
+        Peer.__init__(self, protocol.XmlRpc(encoding, allow_none, use_datetime, shm, ndarray), input, output, process, socket, close, max_workers, framed, compress)
+
+class JsonPeer(Peer):
+    """JSON-RPC full duplex endpoint"""
+    def __init__(self, input=None, output=None, process=None, socket=None, close=True, version=2, max_workers=None, framed=False, codec=None, shm=None, ndarray=False, compress=False):
+        Peer.__init__(self, protocol.JsonRpc(version, codec, shm, ndarray), input, output, process, socket, close, max_workers, framed, compress)
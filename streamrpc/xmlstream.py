@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*
+#
+#   xmlstream.py - Incremental XML-RPC decoding
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Incremental XML-RPC decoding
+
+XmlDecoder splits a stream into XML-RPC messages and decodes them in the same
+pass: the data is fed to expat as it arrives, with the xmlrpc Unmarshaller as
+its target, and a message is complete when its root element ends. Messages are
+never copied into one buffer (or into a str) before they are parsed, so a
+large message is mostly decoded by the time its last byte arrives.
+
+XmlDecoder has the feed() interface of splitter.Splitter, but returns
+XmlMessage objects instead of the raw documents.
+"""
+
+from xml.parsers import expat
+from xmlrpc.client import Unmarshaller
+
+__ALL__ = ["XmlDecoder", "XmlMessage", "loads"]
+
+class XmlMessage(object):
+    """A decoded XML-RPC message. root is the name of the root element (e.g.
+    methodCall or params), method the method name of a call, params the tuple of
+    parameters and pis the (target, data) of the processing instructions in
+    the message. If the message could not be unmarshalled, or is a fault
+    response, error is the exception. len() is the size in bytes."""
+    __slots__ = ("root", "method", "params", "error", "pis", "size")
+
+    def __init__(self, root, method=None, params=None, error=None, pis=(), size=0):
+        self.root = root
+        self.method = method
+        self.params = params
+        self.error = error
+        self.pis = pis
+        self.size = size
+
+    def loads(self):
+        """Returns (params, method) like xmlrpc.client.loads, or raises the
+        Fault of a fault response"""
+        if self.error is not None:
+            raise self.error
+        return self.params, self.method
+
+    def __len__(self):
+        return self.size
+
+# The root elements of XML-RPC messages. XML-RPC elements never contain
+# elements of the same name, so a message ends with the first end tag of the
+# name of its root element.
+_ROOTS = ("methodCall", "methodResponse", "params", "fault", "streamChunk")
+
+class _MessageEnd(Exception):
+    """Stops the parser at the end of a message"""
+
+class _Unmarshaller(Unmarshaller):
+    """Unmarshaller that also notes where the root element ends"""
+    dispatch = dict(Unmarshaller.dispatch)
+    parser = None
+    root = None
+    end_index = -1 # Where the end tag of the root element starts
+
+    def end_root(self, tag):
+        if tag == self.root:
+            self.end_index = self.parser.CurrentByteIndex
+            raise _MessageEnd()
+
+    def end_any(self, tag):
+        # End handler for messages with an unknown root element
+        self.end(tag)
+        self.end_root(tag)
+
+def _end_root(tag, end):
+    def end_root(self, data):
+        if end is not None:
+            end(self, data)
+        self.end_root(tag)
+    return end_root
+
+for _tag in _ROOTS:
+    _Unmarshaller.dispatch[_tag] = _end_root(_tag, Unmarshaller.dispatch.get(_tag))
+
+class XmlDecoder(object):
+    """Push-style splitter that decodes XML-RPC messages as they arrive. Every
+    call to feed() returns the messages completed so far."""
+    def __init__(self, use_datetime=False, use_builtin_types=False, maxdocsize=None):
+        self.__use_datetime = use_datetime
+        self.__use_builtin_types = use_builtin_types
+        self.__maxdocsize = maxdocsize
+        self.__parser = None
+
+    def __start(self):
+        u = self.__unmarshaller = _Unmarshaller(self.__use_datetime, self.__use_builtin_types)
+        p = self.__parser = u.parser = expat.ParserCreate(None, None)
+        pis = self.__pis = []
+
+        def start_root(tag, attrs):
+            u.root = tag
+            p.StartElementHandler = u.start
+            if tag not in _ROOTS:
+                p.EndElementHandler = u.end_any
+            u.start(tag, attrs)
+
+        p.buffer_text = True
+        p.StartElementHandler = start_root
+        p.EndElementHandler = u.end
+        p.CharacterDataHandler = u.data
+        p.ProcessingInstructionHandler = lambda target, data: pis.append((target, data))
+        u.xml(None, None)
+        self.__size = 0 # Bytes fed to the parser
+
+    def feed(self, data):
+        if not isinstance(data, (bytes, bytearray)):
+            data = bytes(data) # E.g. a memoryview of a receive buffer
+        view = memoryview(data)
+        msgs = []
+        pos = 0
+        while pos < len(data):
+            if self.__parser is None:
+                pos = data.find(b"<", pos) # Skip anything between messages
+                if pos < 0:
+                    break
+                self.__start()
+            base = self.__size - pos # data[i] is at base + i in the parser's input
+            self.__size += len(data) - pos
+            u = self.__unmarshaller
+            try:
+                self.__parser.Parse(view[pos:], False)
+            except _MessageEnd:
+                pass # Anything after the root element is the next message
+            if u.end_index < 0:
+                if self.__maxdocsize and self.__size > self.__maxdocsize:
+                    raise ValueError("Document exceeds maximum size of %d bytes" % self.__maxdocsize)
+                break
+            pos = data.find(b">", max(u.end_index - base, pos)) + 1
+            msgs.append(self.__message(base + pos))
+        return msgs
+
+    def __message(self, size):
+        u = self.__unmarshaller
+        msg = XmlMessage(u.root, u.getmethodname(), pis=self.__pis, size=size)
+        try:
+            msg.params = u.close()
+        except Exception as e: # A Fault, or not a valid XML-RPC message
+            msg.error = e
+        u.parser = self.__parser = self.__unmarshaller = None
+        return msg
+
+def loads(data, use_datetime=False, use_builtin_types=False):
+    """Decodes data holding exactly one XML-RPC message. Returns an XmlMessage."""
+    msgs = XmlDecoder(use_datetime, use_builtin_types).feed(data)
+    if len(msgs) != 1:
+        raise ValueError("Expected one XML-RPC message, got %s" % ("an incomplete one" if not msgs else len(msgs)))
+    return msgs[0]
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*
+#
+#   zygote.py - Pre-warmed servers, forked for every job
+#   streamrpc - XML-RPC/JSON-RPC over raw streams (pipes, SSH tunnels,
+#               raw TCP sockets, etc)
+#
+#   Copyright © 2015 Rickard Lyrenius
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""Pre-warmed servers, forked for every job
+
+A server started for every job (like "ssh myhost python server.py") spends
+much of a short job starting Python and importing the server's modules. A
+zygote is a process that does this once, and then forks a server that is
+ready to serve for every job:
+
+    # zygote.py, started once on myhost
+    import streamrpc.zygote
+    import mymodule                     # Slow imports are done once
+
+    def setup(rpc):
+        rpc.register_function(mymodule.crunch)
+
+    streamrpc.zygote.serve("/tmp/mymodule.sock", setup)
+
+Jobs then start the relay instead of the server, which speaks for the
+forked server on its stdin/stdout:
+
+    process = subprocess.Popen(["ssh", "myhost", "python", "-m", "streamrpc.zygote", "/tmp/mymodule.sock"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    rpc = streamrpc.JsonClient(process=process)
+
+The relay connects to the Unix socket of the zygote and passes its stdin,
+stdout and stderr along, so the data does not go through the relay. The
+forked server serves on them as if it had been started directly, and the
+relay exits with its exit status when it is done.
+
+POSIX only (fork and passing file descriptors over Unix sockets).
+"""
+
+import os, sys
+import stat
+import array
+import signal
+import socket
+
+__ALL__ = ["serve", "relay", "main"]
+
+_HELLO = b"streamrpc"
+_FDS = 3 # stdin, stdout, stderr
+
+def _send_fds(sock, fds):
+    sock.sendmsg([_HELLO], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+
+def _recv_fds(sock):
+    fds = array.array("i")
+    msg, ancdata, flags, addr = sock.recvmsg(len(_HELLO), socket.CMSG_LEN(_FDS * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % fds.itemsize])
+    if msg != _HELLO or len(fds) != _FDS:
+        for fd in fds:
+            os.close(fd)
+        return None
+    return list(fds)
+
+def _listen(address):
+    try:
+        if stat.S_ISSOCK(os.stat(address).st_mode):
+            os.unlink(address) # Left behind by an earlier zygote
+    except OSError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(address)
+    sock.listen(64)
+    return sock
+
+def _worker(conn, fds, setup, server):
+    """Runs in the forked process: serves on the passed stdin/stdout/stderr
+    and reports the exit status to the relay"""
+    status = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        rpc = server()
+        if setup:
+            setup(rpc)
+        rpc.serve_forever()
+        status = 0
+    except SystemExit as e:
+        status = 0 if e.code is None else e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        for f in (sys.stdout, sys.stderr):
+            try:
+                f.flush()
+            except Exception: # Closed by the server
+                pass
+        try:
+            conn.sendall(bytes([status & 0xff]))
+        except Exception:
+            pass
+        os._exit(status)
+
+def serve(address, setup=None, server=None, preload=True, ready=None):
+    """Listens on the Unix socket address and forks a server for every relay
+    that connects, until killed. The server is created by calling server (by
+    default streamrpc.Server) in the forked process, with stdin/stdout of
+    the relay as its own, and passed to setup to register its functions.
+    Unless preload is false, all modules that streamrpc would import on first
+    use are imported before forking (see streamrpc.lazy). ready, if given, is
+    called once relays can connect."""
+    if server is None:
+        from .sync import Server as server
+    if preload:
+        from . import lazy
+        lazy.preload()
+    listener = _listen(address)
+    # Forked servers are reaped automatically, and SIGTERM removes the socket
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if ready:
+            ready()
+        while True:
+            conn, _ = listener.accept()
+            try:
+                fds = _recv_fds(conn)
+                if fds is None:
+                    continue
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if os.fork() == 0:
+                    listener.close()
+                    _worker(conn, fds, setup, server)
+                for fd in fds:
+                    os.close(fd)
+            finally:
+                conn.close()
+    finally:
+        listener.close()
+        try:
+            os.unlink(address)
+        except OSError:
+            pass
+
+def relay(address):
+    """Has a server forked by the zygote at address serve on the stdin,
+    stdout and stderr of this process. Returns the exit status of the
+    server when it is done."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        _send_fds(sock, list(range(_FDS)))
+        data = b""
+        while True:
+            chunk = sock.recv(64)
+            if not chunk:
+                break
+            data += chunk
+        return data[-1] if data else 1
+    finally:
+        sock.close()
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        sys.stderr.write("Usage: python -m streamrpc.zygote ADDRESS\n")
+        return 2
+    try:
+        return relay(argv[0])
+    except (OSError, IOError) as e:
+        sys.stderr.write("streamrpc.zygote: %s: %s\n" % (argv[0], e))
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
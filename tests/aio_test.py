@@ -0,0 +1,122 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import asyncio
+import subprocess
+import streamrpc
+import streamrpc.aio
+
+def test_parameters(a, b):
+    return "Value: %s, %s" % (a, b)
+
+async def test_sleep(delay, value):
+    await asyncio.sleep(delay)
+    return value
+
+def test_big(n):
+    return list(range(n))
+
+async def test_async_fault():
+    raise streamrpc.Fault(42, "A Fault")
+
+class AsyncXmlTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.aio.AsyncXmlServer"
+
+    def _clienttype(self, process):
+        return streamrpc.aio.AsyncXmlClient(process=process)
+
+    async def _server(self, module="aio_test", servertype=None):
+        proc = await asyncio.create_subprocess_exec(sys.executable, "-mtests." + module, "serve",
+            json.dumps(sys.path), servertype or self._servertype(), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return proc, self._clienttype(proc)
+
+    def _run(self, coro):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
+
+    def test_parameters(self):
+        async def run():
+            proc, rpc = await self._server()
+            value = await rpc.test_parameters("Hello", True)
+            await rpc.close()
+            await proc.wait()
+            return value
+        assert self._run(run()) == "Value: Hello, True"
+
+    def test_concurrent(self):
+        async def run():
+            proc, rpc = await self._server()
+            values = await asyncio.gather(*[rpc.test_sleep(0.2, i) for i in range(50)])
+            await rpc.close()
+            await proc.wait()
+            return values
+        assert self._run(run()) == list(range(50))
+
+    def test_order(self):
+        async def run():
+            proc, rpc = await self._server()
+            values = await asyncio.gather(rpc.test_sleep(0.3, "slow"), rpc.test_sleep(0, "fast"))
+            await rpc.close()
+            await proc.wait()
+            return values
+        assert self._run(run()) == ["slow", "fast"]
+
+    def test_fault(self):
+        async def run():
+            proc, rpc = await self._server()
+            try:
+                await rpc.test_async_fault()
+            except streamrpc.Fault:
+                f = sys.exc_info()[1]
+                assert f.faultCode == 42
+                assert f.faultString == "A Fault"
+            else:
+                assert False, "Expected a Fault"
+            await rpc.close()
+            await proc.wait()
+        self._run(run())
+
+    def test_big(self):
+        async def run():
+            proc, rpc = await self._server()
+            value = await rpc.test_big(300000)
+            await rpc.close()
+            await proc.wait()
+            return value
+        assert self._run(run()) == list(range(300000))
+
+    def test_sync_server(self):
+        async def run():
+            proc, rpc = await self._server("xmlrpc_test", "streamrpc.Server")
+            values = await asyncio.gather(*[rpc.test_passthrough(i) for i in range(20)])
+            await rpc.close()
+            await proc.wait()
+            return values
+        assert self._run(run()) == list(range(20))
+
+class AsyncJsonTests(AsyncXmlTests):
+    def _servertype(self):
+        return "streamrpc.aio.AsyncJsonServer"
+
+    def _clienttype(self, process):
+        return streamrpc.aio.AsyncJsonClient(process=process)
+
+class AsyncAutoDetectTests(AsyncJsonTests):
+    def _servertype(self):
+        return "streamrpc.aio.AsyncServer"
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])()
+        rpc.register_function(test_parameters)
+        rpc.register_function(test_sleep)
+        rpc.register_function(test_async_fault)
+        rpc.register_function(test_big)
+        asyncio.get_event_loop().run_until_complete(rpc.serve_forever())
+    else:
+        unittest.main(verbosity=2)
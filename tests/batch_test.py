@@ -0,0 +1,64 @@
+import unittest
+import sys, json
+import subprocess
+import streamrpc
+from streamrpc import protocol
+from . import xmlrpc_test
+
+class BatchTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _server(self):
+        proc = subprocess.Popen([sys.executable, "-mtests.xmlrpc_test", "serve",json.dumps(sys.path),self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return streamrpc.JsonClient(process=proc)
+
+    def test_batch(self):
+        rpc = self._server()
+        with rpc.batch() as b:
+            for i in range(100):
+                b.test_passthrough(i)
+        assert b.results() == list(range(100))
+
+    def test_batch_fault(self):
+        rpc = self._server()
+        with rpc.batch() as b:
+            ok = b.test_parameters("Hello", True)
+            fault = b.test_fault()
+            missing = b.unsupported_method()
+        assert ok.result() == "Value: Hello, True"
+        assert fault.exception().faultCode == 42
+        assert missing.exception().faultCode == -32601
+        self.assertRaises(streamrpc.Fault, b.results)
+
+    def test_batch_pipelined(self):
+        rpc = self._server()
+        f = rpc.call_async("test_parameterless")
+        with rpc.batch() as b:
+            b.test_passthrough(1)
+            b.test_passthrough(2)
+        assert b.results() == [1, 2]
+        assert f.result() == "Value"
+        assert rpc.test_passthrough(3) == 3
+
+class AutoDetectBatchTests(BatchTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+class DispatchBatchTests(unittest.TestCase):
+    def _dispatch(self, obj):
+        rpc = protocol.JsonRpc()
+        rpc.register_function(xmlrpc_test.test_passthrough)
+        return json.loads(rpc.dispatch_request(json.dumps(obj).encode("utf8")).decode("utf8"))
+
+    def test_empty(self):
+        rsp = self._dispatch([])
+        assert rsp["error"]["code"] == -32600
+
+    def test_invalid_element(self):
+        rsp = self._dispatch([1, {"jsonrpc": "2.0", "method": "test_passthrough", "params": [5], "id": 7}])
+        assert rsp[0]["error"]["code"] == -32600
+        assert rsp[1] == {"jsonrpc": "2.0", "result": 5, "id": 7}
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
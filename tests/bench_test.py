@@ -0,0 +1,67 @@
+import os, io, json, tempfile, shutil, contextlib
+import unittest
+from streamrpc import bench
+
+class BenchTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_run(self):
+        results = bench.run(["json", "xml"], ["pipe", "socket"], [8, 100000], calls=20, startup_runs=1)
+        assert len(results) == 1 + 2 * 2 * 5
+        kinds = set((r["client"], r["transport"], r["benchmark"], r.get("payload")) for r in results)
+        assert ("xml", "socket", "payload", 100000) in kinds
+        assert ("json", "pipe", "startup", None) in kinds
+        assert ("-", "-", "import", None) in kinds
+        for r in results:
+            assert r["calls_per_sec"] > 0
+            if r["benchmark"] == "payload":
+                assert r["mb_per_sec"] > 0 and r["p99_ms"] >= r["p50_ms"]
+
+    def test_main(self):
+        output = os.path.join(self.tempdir, "results.json")
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert bench.main(["--clients", "msgpack", "--transports", "pipe", "--sizes", "8", "--calls", "10", "--startup-runs", "1", "--output", output]) == 0
+        with open(output) as f:
+            doc = json.load(f)
+        assert doc["python"] and len(doc["results"]) == 5
+        # Compare with a much faster baseline
+        for r in doc["results"]:
+            r["calls_per_sec"] *= 10
+            if "mb_per_sec" in r:
+                r["mb_per_sec"] *= 10
+        baseline = os.path.join(self.tempdir, "baseline.json")
+        with open(baseline, "w") as f:
+            json.dump(doc, f)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert bench.main(["--clients", "msgpack", "--transports", "pipe", "--sizes", "8", "--calls", "10", "--startup-runs", "1", "--output", output, "--compare", baseline]) == 1
+        assert "Slower:" in out.getvalue()
+
+    def test_codec(self):
+        results = bench.bench_codec(out=io.StringIO(), min_time=0.01)
+        names = set((r["message"], r["codec"]) for r in results)
+        assert ("small", "legacy") in names and ("large", "json") in names and ("medium", "msgpack") in names
+        assert all(r["encode"] > 0 and r["decode"] > 0 for r in results)
+        # Nothing is saved without --output
+        cwd = os.getcwd()
+        os.chdir(self.tempdir)
+        try:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                assert bench.main(["codec", "--quick"]) == 0
+        finally:
+            os.chdir(cwd)
+        assert "legacy" in out.getvalue()
+        assert os.listdir(self.tempdir) == []
+
+    def test_compare(self):
+        base = [{"client": "json", "transport": "pipe", "benchmark": "latency", "calls_per_sec": 1000.0}]
+        assert bench.compare([dict(base[0], calls_per_sec=900.0)], base) == []
+        slower = bench.compare([dict(base[0], calls_per_sec=500.0)], base)
+        assert len(slower) == 1 and slower[0][2] == 0.5
+        base = [{"benchmark": "codec", "codec": "json", "message": "small", "encode": 1e-6, "decode": 1e-6}]
+        assert bench.compare([dict(base[0], decode=3e-6)], base)[0][2] == 0.5
@@ -0,0 +1,173 @@
+import json, time, threading
+import unittest
+import streamrpc
+from streamrpc import protocol
+from streamrpc.cache import ResultCache, make_key
+
+class Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return [self.calls, list(args), kwargs]
+
+def json_request(method, params, reqid, **extra):
+    req = {"jsonrpc": "2.0", "method": method, "params": params, "id": reqid}
+    req.update(extra)
+    return json.dumps(req).encode()
+
+class ResultCacheTests(unittest.TestCase):
+    def test_lru(self):
+        c = ResultCache(maxsize=2)
+        c.put(1, "a")
+        c.put(2, "b")
+        assert c.get(1) == "a"
+        c.put(3, "c")
+        assert c.get(2) is None
+        assert c.get(1) == "a" and c.get(3) == "c"
+        assert c.info() == {"hits": 3, "misses": 1, "size": 2, "maxsize": 2}
+
+    def test_ttl(self):
+        c = ResultCache(ttl=0.05)
+        c.put(1, "a")
+        assert c.get(1) == "a"
+        time.sleep(0.1)
+        assert c.get(1) is None
+        assert len(c) == 0
+
+    def test_keys(self):
+        assert make_key([1, {"a": 1, "b": [2]}], {}) == make_key((1, {"b": [2], "a": 1}), None)
+        assert make_key([1], {}) != make_key([True], {})
+        assert make_key([1], {}) != make_key([1.0], {})
+        assert make_key([bytearray(b"x")], {}) is None
+
+class JsonCacheTests(unittest.TestCase):
+    def _protocol(self):
+        return protocol.JsonRpc()
+
+    def _result(self, p, data):
+        return json.loads(data.decode())
+
+    def setUp(self):
+        self.p = self._protocol()
+        self.f = Counter()
+        self.p.register_function(self.f, "f", cacheable=True)
+
+    def _call(self, params, reqid, **extra):
+        return self._result(self.p, self.p.dispatch_request(self.p._dumps({"jsonrpc": "2.0", "method": "f", "params": params, "id": reqid, **extra})))
+
+    def test_hit(self):
+        r1 = self._call([1, "a"], 1)
+        r2 = self._call([1, "a"], 2)
+        assert r1 == {"jsonrpc": "2.0", "result": [1, [1, "a"], {}], "id": 1}
+        assert r2 == {"jsonrpc": "2.0", "result": [1, [1, "a"], {}], "id": 2}
+        assert self._call([2], "x")["result"][0] == 2
+        assert self._call([2], None)["id"] is None
+        assert self.f.calls == 2
+        assert self.p.cache("f").info() == {"hits": 2, "misses": 2, "size": 2, "maxsize": 128}
+
+    def test_kwargs(self):
+        self._call({"a": 1, "b": 2}, 1)
+        assert self._call({"b": 2, "a": 1}, 2)["result"] == [1, [], {"a": 1, "b": 2}]
+        assert self.f.calls == 1
+
+    def test_invalidate(self):
+        self._call([1], 1)
+        self._call([2], 2)
+        self.p.invalidate("f", 1)
+        assert self._call([1], 3)["result"][0] == 3
+        assert self._call([2], 4)["result"][0] == 2
+        self.p.invalidate("f")
+        assert self._call([2], 5)["result"][0] == 4
+        self.p.invalidate()
+        assert self._call([2], 6)["result"][0] == 5
+
+    def test_errors_not_cached(self):
+        def fail(x):
+            self.f.calls += 1
+            raise ValueError("Failed")
+        self.p.register_function(fail, "f", cacheable=True)
+        assert "error" in self._call([1], 1)
+        assert "error" in self._call([1], 2)
+        assert self.f.calls == 2
+
+    def test_not_cacheable(self):
+        self.p.register_function(self.f, "f")
+        self._call([1], 1)
+        self._call([1], 2)
+        assert self.f.calls == 2
+        assert self.p.cache("f") is None
+
+class MsgPackCacheTests(JsonCacheTests):
+    def _protocol(self):
+        return protocol.MsgPackRpc()
+
+    def _result(self, p, data):
+        return p._loads(data)
+
+class JsonOnlyCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.p = protocol.JsonRpc()
+        self.f = Counter()
+        self.p.register_function(self.f, "f", cacheable=True)
+
+    def test_batch_bypasses_cache(self):
+        self.p.dispatch_request(json_request("f", [1], 1))
+        batch = json.dumps([json.loads(json_request("f", [1], 2)), json.loads(json_request("f", [1], 3))]).encode()
+        results = json.loads(self.p.dispatch_request(batch).decode())
+        assert [r["result"][0] for r in results] == [2, 3]
+
+    def test_versions(self):
+        # The envelope of a cached response follows the request
+        def dbl(x):
+            self.f.calls += 1
+            return x * 2
+        self.p.register_function(dbl, cacheable=True)
+        assert json.loads(self.p.dispatch_request(json_request("dbl", [2], 1)).decode()) == {"jsonrpc": "2.0", "result": 4, "id": 1}
+        v1 = json.loads(self.p.dispatch_request(b'{"method": "dbl", "params": [2], "id": 7}').decode())
+        assert v1 == {"result": 4, "id": 7} # As without the cache
+        assert json.loads(self.p.dispatch_request(json_request("dbl", [2], 8)).decode()) == {"jsonrpc": "2.0", "result": 4, "id": 8}
+        assert self.f.calls == 1
+
+    def test_stream_bypasses_cache(self):
+        self.p.dispatch_request(json_request("f", [1], 1))
+        response = json.loads(self.p.dispatch_request(json_request("f", [1], 2, stream=True)).decode())
+        assert response["result"][0] == 2
+
+class XmlCacheTests(unittest.TestCase):
+    def test_hit(self):
+        p = protocol.XmlRpc()
+        f = Counter()
+        p.register_function(f, "f", cacheable=True, maxsize=1)
+        req = protocol.xmlrpc_dumps((1, "a"), "f")
+        r1 = p.dispatch_request(req)
+        assert p.dispatch_request(req) == r1
+        assert protocol.xmlrpc_loads(r1)[0][0] == [1, [1, "a"], {}]
+        p.dispatch_request(protocol.xmlrpc_dumps((2,), "f"))
+        assert protocol.xmlrpc_loads(p.dispatch_request(req))[0][0][0] == 3
+        assert p.cache("f").info() == {"hits": 1, "misses": 3, "size": 1, "maxsize": 1}
+
+def test_lookup(key):
+    test_lookup.calls += 1
+    return "Value %d of %s" % (test_lookup.calls, key)
+test_lookup.calls = 0
+
+class SocketCacheTests(unittest.TestCase):
+    def test_socket(self):
+        server = streamrpc.SocketServer(("127.0.0.1", 0))
+        server.register_function(test_lookup, cacheable=True, ttl=60)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            rpc = streamrpc.JsonClient(socket=streamrpc.connect(server.address))
+            first = rpc.test_lookup("a")
+            assert [rpc.test_lookup("a") for i in range(10)] == [first] * 10
+            xrpc = streamrpc.XmlClient(socket=streamrpc.connect(server.address))
+            assert xrpc.test_lookup("a") == xrpc.test_lookup("a")
+            assert server.cache_info("test_lookup") == {"hits": 11, "misses": 2, "size": 2, "maxsize": 128}
+            server.invalidate("test_lookup", "a")
+            assert rpc.test_lookup("a") != first
+        finally:
+            server.shutdown()
+            thread.join()
@@ -0,0 +1,162 @@
+import unittest
+import sys, os, json, threading
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+from streamrpc import protocol, chunked
+from xmlrpc.client import Marshaller, loads as xmlrpc_loads
+
+def big_string(n):
+    return u"å<\"x" * (n // 4)
+
+def big_list(n):
+    return list(range(n))
+
+def records(n):
+    return {"count": n, "records": [{"id": i, "name": "r%d" % i, "tags": ["a", "b"]} for i in range(n)], "blob": "z" * 200000}
+
+def unencodable_first(n):
+    return [object()] + big_list(n)
+
+def unencodable_last(n):
+    return big_list(n) + [object()]
+
+_VALUES = [big_string(300000), big_list(100000), records(5000), ["y" * 100000, 1, [big_list(20000)] * 5, {}],
+    {str(i): [i] for i in range(20000)}, (1, "x" * 70000)]
+
+class ChunkedEncodingTests(unittest.TestCase):
+    def test_json(self):
+        dumps = protocol.JsonRpc()._dumps
+        for value in _VALUES:
+            assert chunked.is_large(value)
+            data = b"".join(chunked.coalesce(chunked.iterencode_json(value, dumps)))
+            assert json.loads(data.decode("utf8")) == json.loads(dumps(value).decode("utf8"))
+
+    def test_xml(self):
+        for value in _VALUES:
+            data = "".join(chunked.iterencode_xml(value, Marshaller(None, False)))
+            assert data == Marshaller(None, False).dumps((value,))[len("<params>\n<param>\n"):-len("</param>\n</params>\n")]
+
+    def test_small(self):
+        assert not chunked.is_large([1, 2, "x" * 1000])
+        assert list(chunked.iterencode_json({"a": 1}, protocol.JsonRpc()._dumps)) == [b'{"a":1}']
+
+    def test_parts(self):
+        parts = protocol.JsonRpc().encode_response(protocol.Call(None, "m", None, reqid=1, version=2), big_list(2000000))
+        assert isinstance(parts, protocol.Parts)
+        sizes = [len(p) for p in parts]
+        assert len(sizes) > 100 and max(sizes) < 4 * chunked.CHUNK_SIZE
+        assert parts.size == sum(sizes)
+
+    def test_circular(self):
+        a = [big_list(100000)]
+        a.append(a)
+        self.assertRaises(ValueError, b"".join, chunked.iterencode_json(a, protocol.JsonRpc()._dumps))
+        self.assertRaises(ValueError, "".join, chunked.iterencode_xml(a, Marshaller(None, False)))
+
+    def test_responses(self):
+        p = protocol.JsonRpc()
+        p.register_function(big_list)
+        rsp = p.dispatch_request(b'{"jsonrpc": "2.0", "method": "big_list", "params": [100000], "id": "__streamrpc_result__"}')
+        msg, = protocol.messages(rsp)
+        assert json.loads(msg.join().decode("utf8")) == {"jsonrpc": "2.0", "result": big_list(100000), "id": "__streamrpc_result__"}
+        assert isinstance(p.dispatch_request(b'{"jsonrpc": "2.0", "method": "big_list", "params": [10], "id": 1}'), bytes)
+        assert isinstance(protocol.MsgPackRpc().encode_response(protocol.Call(None, "m", None, reqid=1, version=2), big_list(100000)), bytes)
+        p = protocol.XmlRpc()
+        p.register_function(big_list)
+        rsp = p.dispatch_request(protocol.xmlrpc_dumps((100000,), "big_list"))
+        assert xmlrpc_loads(rsp.join().decode("utf8"))[0] == (big_list(100000),)
+
+class ChunkedTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+    def test_results(self):
+        rpc = self._clienttype(subprocess.Popen([sys.executable, "-mtests.chunked_test", "serve", json.dumps(sys.path), self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+        assert rpc.big_string(4000000) == big_string(4000000)
+        assert rpc.big_list(500000) == big_list(500000)
+        assert rpc.records(20000) == records(20000)
+        assert rpc.big_list(3) == [0, 1, 2]
+        rpc.close()
+
+class XmlChunkedTests(ChunkedTests):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+
+class CompressedChunkedTests(ChunkedTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, compress=True)
+
+class SocketChunkedTests(unittest.TestCase):
+    def test_socket(self):
+        server = streamrpc.SocketServer(("127.0.0.1", 0))
+        server.register_function(big_list)
+        server.register_function(big_string)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            for client in (streamrpc.JsonClient, streamrpc.XmlClient):
+                rpc = client(socket=streamrpc.connect(server.address))
+                futures = [rpc.call_async("big_list", 300000), rpc.call_async("big_string", 1000000), rpc.call_async("big_list", 2)]
+                assert [f.result() for f in futures] == [big_list(300000), big_string(1000000), [0, 1]]
+                rpc.close()
+        finally:
+            server.shutdown()
+            thread.join()
+
+class ChunkedErrorTests(unittest.TestCase):
+    # An error in the first part is answered like that of any other response,
+    # a later one closes the connection
+    def _server(self, client, servertype, **kwargs):
+        self.proc = subprocess.Popen([sys.executable, "-mtests.chunked_test", "serve", json.dumps(sys.path), servertype, json.dumps(kwargs)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return client(process=self.proc, timeout=30)
+
+    def _stop(self, rpc):
+        rpc.close()
+        assert self.proc.wait() == 0
+        stderr = self.proc.stderr.read()
+        self.proc.stderr.close()
+        return stderr
+
+    def test_first_part(self):
+        for kwargs in ({}, {"max_workers": 2}):
+            rpc = self._server(streamrpc.XmlClient, "streamrpc.XmlServer", **kwargs)
+            try:
+                rpc.unencodable_first(100000)
+            except streamrpc.Fault:
+                f = sys.exc_info()[1]
+                assert f.faultCode == 1 and "cannot marshal" in f.faultString
+            else:
+                assert False, "Expected a Fault"
+            assert rpc.big_list(3) == [0, 1, 2]
+            self._stop(rpc)
+
+    def test_written(self):
+        for client, servertype in ((streamrpc.XmlClient, "streamrpc.XmlServer"), (streamrpc.JsonClient, "streamrpc.JsonServer")):
+            for kwargs in ({}, {"max_workers": 2}):
+                rpc = self._server(client, servertype, **kwargs)
+                self.assertRaises(EOFError, rpc.unencodable_last, 100000)
+                assert b"TypeError" in self._stop(rpc)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(**(json.loads(sys.argv[4]) if len(sys.argv) > 4 else {}))
+        rpc.register_function(big_string)
+        rpc.register_function(big_list)
+        rpc.register_function(records)
+        rpc.register_function(unencodable_first)
+        rpc.register_function(unencodable_last)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
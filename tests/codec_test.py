@@ -0,0 +1,65 @@
+import unittest
+import math, datetime
+import streamrpc
+from streamrpc import codec
+from . import jsonrpc_test
+
+class StdlibCodecTests(jsonrpc_test.JsonTests):
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, codec=codec.JsonCodec())
+
+    def test_non_finite(self):
+        # The default server agrees with the standard library on NaN and infinities
+        rpc = self._server()
+        value = rpc.test_passthrough([float("nan"), float("inf"), -float("inf")])
+        assert math.isnan(value[0]) and value[1:] == [float("inf"), -float("inf")]
+
+    def test_datetime(self):
+        rpc = self._server()
+        self.assertRaises(TypeError, rpc.test_passthrough, datetime.datetime(2020, 1, 2))
+        assert rpc.test_passthrough("2020-01-02T00:00:00") == "2020-01-02T00:00:00"
+
+class CodecTests(unittest.TestCase):
+    def _codecs(self):
+        codecs = [codec.JsonCodec(), codec.json_codec()]
+        try:
+            codecs.append(codec.OrjsonCodec())
+        except ImportError:
+            pass
+        return codecs
+
+    def test_roundtrip(self):
+        obj = {"jsonrpc": "2.0", "params": [1, 2.5, u"åäö", None, True, {"a": []}], "id": 1}
+        for c in self._codecs():
+            data = c.dumps(obj)
+            assert isinstance(data, bytes)
+            assert c.loads(data) == obj
+            assert c.loads(bytearray(data)) == obj
+
+    def test_big_int(self):
+        for c in self._codecs():
+            assert c.loads(c.dumps([2**70])) == [2**70]
+
+    def test_invalid(self):
+        for c in self._codecs():
+            self.assertRaises(ValueError, c.loads, b"{")
+            self.assertRaises(TypeError, c.dumps, object())
+
+    def test_default(self):
+        assert isinstance(codec.json_codec(), codec.JsonCodec)
+        values = [float("nan"), float("inf"), -float("inf")]
+        assert codec.json_codec().dumps(values) == b"[NaN,Infinity,-Infinity]"
+
+    def test_orjson_fallback(self):
+        try:
+            c = codec.json_codec("orjson")
+        except ImportError:
+            raise unittest.SkipTest("orjson is not installed")
+        # Decoded and rejected like the standard library does
+        value = c.loads(b"[NaN,Infinity,-Infinity]")
+        assert math.isnan(value[0]) and value[1:] == [float("inf"), -float("inf")]
+        self.assertRaises(TypeError, c.dumps, datetime.datetime(2020, 1, 2))
+        self.assertRaises(TypeError, c.dumps, {"a": [datetime.date(2020, 1, 2)]})
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import sys, json, struct, subprocess, threading
+import unittest
+import streamrpc
+from streamrpc import framing
+from . import xmlrpc_test, jsonrpc_test, msgpack_test
+
+class CompressedXmlTests(xmlrpc_test.XmlTests):
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process, compress=True)
+
+    def test_large_compressed(self):
+        rpc = self._server()
+        input = ["Some text"] * 100000
+        assert rpc.test_passthrough(input) == input
+
+class CompressedXmlAutoDetectTests(CompressedXmlTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+class CompressedJsonTests(jsonrpc_test.JsonTests):
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, compress=True)
+
+    def test_pipelined(self):
+        rpc = self._server()
+        futures = [rpc.call_async("test_passthrough", "x" * (i * 100)) for i in range(100)]
+        assert [f.result() for f in futures] == ["x" * (i * 100) for i in range(100)]
+
+class UncompressedResponseTests(CompressedJsonTests):
+    def _servertype(self):
+        return "lambda: streamrpc.Server(compress=False)"
+
+class CompressedMsgPackTests(msgpack_test.MsgPackTests):
+    def _clienttype(self, process):
+        return streamrpc.MsgPackClient(process=process, compress=True)
+
+class FrameTests(unittest.TestCase):
+    def test_threshold(self):
+        small = b'{"jsonrpc":"2.0","result":1,"id":1}'
+        assert framing.frame(small, 1024) == framing.frame(small)
+        assert framing.frame(small, 1024)[:1] == framing.FRAME_MARKER
+        large = b"[" + b"1," * 10000 + b"1]"
+        data = framing.frame(large, 1024)
+        assert data[:1] == framing.COMPRESSED_MARKER
+        assert len(data) < len(large)
+        assert framing.FrameSplitter().feed(framing.COMPRESS_HELLO + data) == [large]
+
+    def test_incompressible(self):
+        import os
+        data = os.urandom(10000)
+        assert framing.frame(data, 1024)[:1] == framing.FRAME_MARKER
+
+    def test_too_large(self):
+        import zlib
+        bomb = zlib.compress(b"\x00" * (framing.MAX_PAYLOAD + 1))
+        with self.assertRaises(ValueError):
+            framing.FrameSplitter().feed(framing.frame(b"") + struct.pack(">cI", framing.COMPRESSED_MARKER, len(bomb)) + bomb)
+
+    def test_response_compressed(self):
+        proc = subprocess.Popen([sys.executable, "-mtests.xmlrpc_test", "serve", json.dumps(sys.path), "streamrpc.JsonServer"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        request = json.dumps({"jsonrpc": "2.0", "method": "test_passthrough", "params": ["x" * 100000], "id": 1}).encode()
+        proc.stdin.write(framing.COMPRESS_HELLO + framing.frame(request))
+        proc.stdin.flush()
+        assert proc.stdout.read(1) == framing.COMPRESS_HELLO
+        marker, length = struct.unpack(">cI", proc.stdout.read(5))
+        assert marker == framing.COMPRESSED_MARKER
+        assert length < 10000
+        payload = framing._decompress(proc.stdout.read(length))
+        assert json.loads(payload.decode())["result"] == "x" * 100000
+        proc.stdin.close()
+        proc.wait()
+        proc.stdout.close()
+
+class CompressedSocketTests(unittest.TestCase):
+    def test_socket(self):
+        server = streamrpc.SocketServer(("127.0.0.1", 0))
+        server.register_function(xmlrpc_test.test_passthrough)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            rpc = streamrpc.JsonClient(socket=streamrpc.connect(server.address), compress=True)
+            assert rpc.test_passthrough("x" * 100000) == "x" * 100000
+            assert rpc.test_passthrough(1) == 1
+            rpc = streamrpc.XmlClient(socket=streamrpc.connect(server.address), compress=100)
+            assert rpc.test_passthrough(["y"] * 10000) == ["y"] * 10000
+        finally:
+            server.shutdown()
+            thread.join()
@@ -0,0 +1,166 @@
+import unittest
+import sys, os, json, time
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import asyncio
+import subprocess
+from concurrent.futures import TimeoutError
+import streamrpc
+import streamrpc.aio
+from streamrpc import protocol
+
+_runs = []
+
+def work(delay, value):
+    _runs.append(value)
+    time.sleep(delay)
+    return value
+
+def runs():
+    return list(_runs)
+
+async def async_work(delay, value):
+    _runs.append(value)
+    await asyncio.sleep(delay)
+    return value
+
+class DeadlineTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+
+    def _clienttype(self, process, **kw):
+        return streamrpc.JsonClient(process=process, **kw)
+
+    def _options(self):
+        return {"max_workers": 1}
+
+    def _client(self, server=None, **kw):
+        proc = subprocess.Popen([sys.executable, "-mtests.deadline_test", "serve", json.dumps(sys.path), server or self._servertype(), json.dumps(self._options())], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc, **kw)
+
+    def test_timeout(self):
+        rpc = self._client(timeout=0.3)
+        self.assertRaises(TimeoutError, rpc.work, 1, "slow")
+        assert rpc.timeout(5).work(0, "fast") == "fast" # The late response is skipped
+        assert rpc.timeout(5).work(0.5, "slower") == "slower"
+        self.assertRaises(TimeoutError, rpc.timeout(0.1).work, 0.5, "slow")
+        rpc.close()
+
+    def test_expired(self):
+        # Requests queued behind a slow one expire before they run
+        rpc = self._client()
+        slow = rpc.call_async("work", 0.5, "slow")
+        with self.assertRaises(TimeoutError):
+            rpc.timeout(0.1).work(0, "expired")
+        assert slow.result() == "slow"
+        assert rpc.runs() == ["slow"]
+        try:
+            rpc.timeout(10).work(0, "fast")
+        except TimeoutError:
+            assert False, "Should not time out"
+        assert rpc.runs() == ["slow", "fast"]
+        rpc.close()
+
+    def test_expired_fault(self):
+        # The futures of call_async do not time out, but get the Fault of the server
+        rpc = self._client(timeout=0.2)
+        first = rpc.call_async("work", 0.5, "first")
+        late = rpc.call_async("work", 0, "late")
+        try:
+            late.result()
+        except streamrpc.Fault as f:
+            assert f.faultCode == streamrpc.DEADLINE_EXCEEDED
+        else:
+            assert False, "Expected a Fault"
+        assert first.result() == "first"
+        assert rpc.runs() == ["first"]
+        rpc.close()
+
+class XmlDeadlineTests(DeadlineTests):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+
+    def _clienttype(self, process, **kw):
+        return streamrpc.XmlClient(process=process, **kw)
+
+class ProcessDeadlineTests(DeadlineTests):
+    # Time spent queued for a worker process counts too
+    def _options(self):
+        return {"processes": 1}
+
+class BusyTests(unittest.TestCase):
+    def _process(self, servertype, **kw):
+        return subprocess.Popen([sys.executable, "-mtests.deadline_test", "serve", json.dumps(sys.path), servertype, json.dumps(kw)], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _check(self, futures):
+        results = []
+        for f in futures:
+            try:
+                results.append(f.result())
+            except streamrpc.Fault as e:
+                assert e.faultCode == streamrpc.SERVER_BUSY
+                results.append("busy")
+        return results
+
+    def test_busy(self):
+        for servertype in ("streamrpc.JsonServer", "streamrpc.XmlServer"):
+            rpc = (streamrpc.JsonClient if "Json" in servertype else streamrpc.XmlClient)(process=self._process(servertype, max_workers=1, max_queue=2))
+            futures = [rpc.call_async("work", 0.3, i) for i in range(5)]
+            assert self._check(futures) == [0, 1, "busy", "busy", "busy"]
+            assert rpc.work(0, 5) == 5 # Room again
+            assert rpc.runs() == [0, 1, 5]
+            rpc.close()
+
+    def test_async_busy(self):
+        async def run():
+            proc = await asyncio.create_subprocess_exec(sys.executable, "-mtests.deadline_test", "serve",
+                json.dumps(sys.path), "streamrpc.aio.AsyncJsonServer", json.dumps({"max_queue": 2}), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            rpc = streamrpc.aio.AsyncJsonClient(process=proc)
+            results = await asyncio.gather(*[rpc.async_work(0.3, i) for i in range(4)], return_exceptions=True)
+            assert results[:2] == [0, 1]
+            assert [r.faultCode for r in results[2:]] == [streamrpc.SERVER_BUSY] * 2
+            try:
+                await rpc.timeout(0.1).async_work(1, "slow")
+            except asyncio.TimeoutError:
+                pass
+            else:
+                assert False, "Expected a timeout"
+            await rpc.close()
+            await proc.wait()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+class ProtocolDeadlineTests(unittest.TestCase):
+    def test_envelope(self):
+        for p in (protocol.JsonRpc(), protocol.XmlRpc(), protocol.MsgPackRpc()):
+            p.register_function(work)
+            req = p.initiate_request("work", (0, 1), {}, lambda r, e: None, timeout=1.5)
+            call = p.decode_request(req, received=100)
+            assert call.deadline == 101.5
+            assert p.decode_request(p.initiate_request("work", (0, 1), {}, lambda r, e: None)).deadline is None
+            call = p.decode_request(req, received=protocol._now() - 2)
+            self.assertRaises(streamrpc.Fault, call.invoke)
+
+    def test_invalid(self):
+        p = protocol.JsonRpc()
+        p.register_function(work)
+        call = p.decode_request(b'{"jsonrpc": "2.0", "method": "work", "params": [0, 1], "id": 1, "timeout": "soon"}')
+        assert call.deadline is None
+        call = protocol.XmlRpc().decode_request(protocol.xmlrpc_dumps((1,), "work").replace(b"<methodCall>", b"<methodCall><?streamrpc timeout soon?>"))
+        assert call.deadline is None
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(**json.loads(sys.argv[4]))
+        rpc.register_function(work)
+        rpc.register_function(runs)
+        rpc.register_function(async_work)
+        if isinstance(rpc, streamrpc.aio.AsyncServer):
+            asyncio.get_event_loop().run_until_complete(rpc.serve_forever())
+        else:
+            rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
@@ -0,0 +1,136 @@
+import sys, json, threading
+import logging
+import unittest
+import streamrpc
+from streamrpc import protocol
+from streamrpc.dispatch import Dispatcher, Handler
+
+def f_fixed(a, b):
+    return [a, b]
+
+def f_defaults(a, b=2, *, c, d=4):
+    return [a, b, c, d]
+
+def f_var(a, *args, **kwargs):
+    return [a, list(args), kwargs]
+
+class Strings(object):
+    def upper(self, s):
+        return s.upper()
+
+class Math(object):
+    def __init__(self):
+        self.strings = Strings()
+        self.value = 1
+        self.log = logging.getLogger("dispatch_test")
+
+    def add(self, a, b):
+        return a + b
+
+    def _private(self):
+        return "Private"
+
+class HandlerTests(unittest.TestCase):
+    def test_fixed(self):
+        h = Handler(f_fixed)
+        assert h.check([1, 2], None) is None
+        assert h.check([1, 2], {}) is None
+        assert h.check([], {"a": 1, "b": 2}) is None
+        assert h.check([1], {"b": 2}) is None
+        assert h.check([1], None) == "missing required argument 'b'"
+        assert h.check([1, 2, 3], None) == "expected at most 2 arguments, got 3"
+        assert h.check([], {"a": 1}) == "missing required argument 'b'"
+        assert h.check([], {"a": 1, "b": 2, "c": 3}) == "unexpected argument 'c'"
+        assert h.check([1], {"a": 1}) == "got multiple values for argument 'a'"
+
+    def test_keyword_only(self):
+        h = Handler(f_defaults)
+        assert h.check([1], None) == "missing required argument 'c'"
+        assert h.check([1], {"c": 3}) is None
+        assert h.check([], {"a": 1, "c": 3, "d": 5}) is None
+        assert h.check([1, 2, 3], {"c": 3}) == "expected at most 2 arguments, got 3"
+
+    def test_var(self):
+        h = Handler(f_var)
+        assert h.check([1, 2, 3], None) is None
+        assert h.check([1], {"x": 1}) is None
+        assert h.check([], None) == "missing required argument 'a'"
+
+class DispatcherTests(unittest.TestCase):
+    def test_instance(self):
+        d = Dispatcher()
+        d.register_instance(Math(), "math", ["strings"])
+        assert d.methods() == ["math.add", "math.strings.upper"]
+        assert d.get("math.add").func(1, 2) == 3
+        assert d.get("math.strings.upper").func("a") == "A"
+        d = Dispatcher()
+        d.register_instance(Math(), namespaces=["strings"])
+        assert d.methods() == ["add", "strings.upper"]
+
+    def test_attributes(self):
+        # Attributes are only followed when listed, so helpers are not reachable
+        d = Dispatcher()
+        d.register_instance(Math())
+        assert d.methods() == ["add"]
+        self.assertRaises(ValueError, d.register_instance, Math(), None, ["log._cache"])
+        self.assertRaises(ValueError, d.register_instance, Math(), None, ["value"])
+        self.assertRaises(AttributeError, d.register_instance, Math(), None, ["missing"])
+
+class JsonDispatchTests(unittest.TestCase):
+    def _protocol(self):
+        p = protocol.JsonRpc()
+        p.register_function(f_fixed)
+        p.register_instance(Math(), "math", ["strings"])
+        return p
+
+    def _call(self, p, method, params):
+        return json.loads(p.dispatch_request(json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 1}).encode()).decode())
+
+    def test_dotted(self):
+        p = self._protocol()
+        assert self._call(p, "math.add", [1, 2])["result"] == 3
+        assert self._call(p, "math.strings.upper", {"s": "x"})["result"] == "X"
+        assert self._call(p, "math._private", [])["error"]["code"] == -32601
+        assert self._call(p, "math.log.setLevel", [0])["error"]["code"] == -32601
+        assert self._call(p, "math.log.manager.root.setLevel", [0])["error"]["code"] == -32601
+
+    def test_invalid_params(self):
+        called = []
+        p = protocol.JsonRpc()
+        p.register_function(lambda a: called.append(a), "f")
+        error = self._call(p, "f", [1, 2])["error"]
+        assert error["code"] == -32602
+        assert "at most 1" in error["message"]
+        assert self._call(p, "f", {"b": 1})["error"]["code"] == -32602
+        assert not called
+
+class XmlDispatchTests(unittest.TestCase):
+    def test_dotted(self):
+        p = protocol.XmlRpc()
+        p.register_instance(Math(), "math")
+        assert protocol.xmlrpc_loads(p.dispatch_request(protocol.xmlrpc_dumps((1, 2), "math.add")))[0][0] == 3
+
+    def test_invalid_params(self):
+        p = protocol.XmlRpc()
+        p.register_function(f_fixed)
+        try:
+            protocol.xmlrpc_loads(p.dispatch_request(protocol.xmlrpc_dumps((1,), "f_fixed")))
+        except streamrpc.Fault:
+            assert "missing required argument 'b'" in sys.exc_info()[1].faultString
+        else:
+            assert False, "Expected a Fault"
+
+class SocketDispatchTests(unittest.TestCase):
+    def test_socket(self):
+        server = streamrpc.SocketServer(("127.0.0.1", 0))
+        server.register_instance(Math(), "math", ["strings"])
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            for client in (streamrpc.JsonClient, streamrpc.XmlClient):
+                rpc = client(socket=streamrpc.connect(server.address))
+                assert rpc.math.add(1, 2) == 3
+                assert rpc.math.strings.upper("abc") == "ABC"
+        finally:
+            server.shutdown()
+            thread.join()
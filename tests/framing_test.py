@@ -0,0 +1,30 @@
+import streamrpc
+from . import xmlrpc_test, jsonrpc_test
+
+class FramedXmlTests(xmlrpc_test.XmlTests):
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process, framed=True)
+
+class FramedXmlAutoDetectTests(FramedXmlTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+class FramedJsonTests(jsonrpc_test.JsonTests):
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, framed=True)
+
+    def test_pipelined(self):
+        rpc = self._server()
+        futures = [rpc.call_async("test_passthrough", [i] * i) for i in range(100)]
+        assert [f.result() for f in futures] == [[i] * i for i in range(100)]
+
+    def test_batch(self):
+        rpc = self._server()
+        with rpc.batch() as b:
+            b.test_passthrough(1)
+            b.test_passthrough("2")
+        assert b.results() == [1, "2"]
+
+class FramedJsonAutoDetectTests(FramedJsonTests):
+    def _servertype(self):
+        return "streamrpc.Server"
@@ -0,0 +1,65 @@
+import unittest
+import sys, json
+import subprocess
+import streamrpc
+from streamrpc import lazy
+from xmlrpc.client import Fault
+
+# Runs in a new process, as the tests import everything
+_CHECK = """
+import io, sys, json
+sys.path += json.loads(sys.argv[1])
+import streamrpc
+loaded = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+rpc = streamrpc.Server(input=io.BytesIO(), output=io.BytesIO())
+from streamrpc import protocol
+p = protocol.JsonRpc()
+p.register_function(len)
+assert p.dispatch_request(b'{"jsonrpc": "2.0", "method": "len", "params": ["abc"], "id": 1}') == b'{"jsonrpc":"2.0","result":3,"id":1}'
+print(json.dumps([loaded, [m for m in json.loads(sys.argv[2]) if m in sys.modules]]))
+"""
+
+_SUBMODULES = """
+import sys, json
+sys.path += json.loads(sys.argv[1])
+import streamrpc
+print(json.dumps([streamrpc.pool.spawn.__name__, streamrpc.sync.Server.__name__, streamrpc.net.SocketServer.__name__,
+    streamrpc.protocol.JsonRpc.__name__, streamrpc.aio.AsyncServer.__name__]))
+"""
+
+class LazyTests(unittest.TestCase):
+    def test_module(self):
+        m = lazy.LazyModule(".splitter", "streamrpc")
+        assert repr(m) == "<lazy module '.splitter'>"
+        from streamrpc import splitter
+        assert m.Splitter is splitter.Splitter
+        assert "Splitter" in vars(m) # Kept after the first lookup
+        self.assertRaises(AttributeError, getattr, m, "missing")
+        self.assertRaises(ImportError, getattr, lazy.LazyModule("streamrpc.missing"), "x")
+
+    def test_preload(self):
+        assert lazy.preload(["json", "streamrpc.missing"]) == ["streamrpc.missing"]
+
+    def test_exports(self):
+        assert streamrpc.Fault is Fault
+        assert "JsonClient" in dir(streamrpc)
+        self.assertRaises(AttributeError, getattr, streamrpc, "Missing")
+        names = {}
+        exec("from streamrpc import *", names)
+        assert names["Server"] is streamrpc.Server
+
+    def test_submodules(self):
+        # Submodules are reachable after a plain "import streamrpc"
+        out = subprocess.check_output([sys.executable, "-c", _SUBMODULES, json.dumps(sys.path)])
+        assert json.loads(out) == ["spawn", "Server", "SocketServer", "JsonRpc", "AsyncServer"]
+        self.assertRaises(AttributeError, getattr, streamrpc, "missing")
+
+    def test_startup(self):
+        heavy = ["xmlrpc.client", "streamrpc.xmlstream", "concurrent.futures", "traceback", "socket", "streamrpc.net", "streamrpc.packer"]
+        out = subprocess.check_output([sys.executable, "-c", _CHECK, json.dumps(sys.path), json.dumps(heavy + ["streamrpc.sync"])])
+        on_import, after_call = json.loads(out)
+        assert on_import == []
+        assert after_call == ["streamrpc.sync"]
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,112 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+from streamrpc.metrics import Metrics
+
+def test_passthrough(a):
+    return a
+
+def test_fault():
+    raise streamrpc.Fault(42, "A Fault")
+
+class MetricsTests(unittest.TestCase):
+    def test_record(self):
+        events = []
+        m = Metrics(buckets=(0.001, 0.01), sink=events.append)
+        m.record_call("f", 0.0005, bytes_in=10, bytes_out=20, phases={"call": 0.0004})
+        m.record_call("f", 0.005, error=True)
+        m.record_call("f", 1.0)
+        m.record_bytes(bytes_in=5)
+        m.record_phase("read", 0.5)
+        s = m.snapshot()
+        f = s["methods"]["f"]
+        assert f["calls"] == 3 and f["errors"] == 1
+        assert f["bytes_in"] == 10 and f["bytes_out"] == 20
+        assert f["latency"]["counts"] == [1, 1, 1]
+        assert s["bytes_in"] == 15 and s["bytes_out"] == 20
+        assert s["phases"]["read"] == {"seconds": 0.5, "count": 1}
+        assert s["phases"]["call"]["count"] == 1
+        assert len(events) == 3 and events[1]["error"] and events[0]["phases"] == {"call": 0.0004}
+        m.reset()
+        assert m.snapshot()["methods"] == {}
+
+    def test_prometheus(self):
+        m = Metrics(buckets=(0.001, 0.01))
+        m.record_call('a"b', 0.005, bytes_in=3)
+        m.record_call('a"b', 0.5)
+        text = m.prometheus()
+        lines = text.splitlines()
+        assert "# TYPE streamrpc_call_duration_seconds histogram" in lines
+        assert 'streamrpc_calls_total{method="a\\"b"} 2' in lines
+        assert 'streamrpc_call_duration_seconds_bucket{method="a\\"b",le="0.001"} 0' in lines
+        assert 'streamrpc_call_duration_seconds_bucket{method="a\\"b",le="0.01"} 1' in lines
+        assert 'streamrpc_call_duration_seconds_bucket{method="a\\"b",le="+Inf"} 2' in lines
+        assert 'streamrpc_call_duration_seconds_count{method="a\\"b"} 2' in lines
+        assert "streamrpc_stream_received_bytes_total 3" in lines
+        assert text.endswith("\n")
+
+    def test_client(self):
+        proc = subprocess.Popen([sys.executable, "-mtests.metrics_test", "serve", json.dumps(sys.path), "streamrpc.JsonServer", "inline"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        rpc = streamrpc.JsonClient(process=proc, metrics=True)
+        assert rpc.test_passthrough("x" * 1000) == "x" * 1000
+        self.assertRaises(streamrpc.Fault, rpc.test_fault)
+        assert rpc.call_async("test_passthrough", 1).result() == 1
+        s = rpc.metrics.snapshot()
+        assert s["methods"]["test_passthrough"]["calls"] == 2
+        assert s["methods"]["test_passthrough"]["bytes_out"] > 1000
+        assert s["methods"]["test_fault"]["errors"] == 1
+        assert s["bytes_in"] > 1000
+        assert s["phases"]["decode"]["count"] >= 2 # The last one may still be in progress
+        rpc.close()
+
+class XmlServerMetricsTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+
+    def _server(self, mode="inline"):
+        proc = subprocess.Popen([sys.executable, "-mtests.metrics_test", "serve", json.dumps(sys.path), self._servertype(), mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc)
+
+    def _check(self, rpc):
+        for i in range(10):
+            assert rpc.test_passthrough(i) == i
+        self.assertRaises(streamrpc.Fault, rpc.test_fault)
+        self.assertRaises(streamrpc.Fault, rpc.no_such_method)
+        s = rpc.system.stats()
+        passthrough = s["methods"]["test_passthrough"]
+        assert passthrough["calls"] == 10 and passthrough["errors"] == 0
+        assert passthrough["bytes_in"] > 0 and passthrough["bytes_out"] > 0
+        assert sum(passthrough["latency"]["counts"]) == 10
+        assert s["methods"]["test_fault"]["errors"] == 1
+        assert s["methods"]["(invalid)"]["calls"] == 1
+        for phase in ("read", "decode", "call", "encode", "write"):
+            assert s["phases"][phase]["count"] >= 12, phase
+
+    def test_inline(self):
+        self._check(self._server())
+
+    def test_threads(self):
+        self._check(self._server("threads"))
+
+class JsonServerMetricsTests(XmlServerMetricsTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(max_workers=4 if sys.argv[4] == "threads" else None, metrics=True)
+        rpc.register_function(test_passthrough)
+        rpc.register_function(test_fault)
+        rpc.register_function(rpc.metrics.snapshot, "system.stats")
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
@@ -0,0 +1,61 @@
+import unittest
+import streamrpc
+from streamrpc import packer
+from . import jsonrpc_test
+
+class MsgPackTests(jsonrpc_test.JsonTests):
+    def _servertype(self):
+        return "streamrpc.MsgPackServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.MsgPackClient(process=process)
+
+    def test_bytes(self):
+        rpc = self._server()
+        input = bytes(bytearray(range(256))) * 100
+        value = rpc.test_passthrough(input)
+        assert value == input
+
+    def test_numbers(self):
+        rpc = self._server()
+        input = [0, 1, -1, 127, 128, -32, -33, 255, 256, 65535, 65536, -2**31, 2**32, -2**63, 2**64 - 1, 0.5, -1e300]
+        value = rpc.test_passthrough(input)
+        assert value == input
+
+    def test_batch(self):
+        rpc = self._server()
+        with rpc.batch() as b:
+            b.test_passthrough(1)
+            b.test_passthrough(b"2")
+        assert b.results() == [1, b"2"]
+
+class MsgPackAutoDetectTests(MsgPackTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+class PackerTests(unittest.TestCase):
+    def _roundtrip(self, obj):
+        data = packer._packb(obj)
+        assert packer._unpackb(data) == obj
+        return data
+
+    def test_types(self):
+        self._roundtrip([None, True, False, u"åäö", u"x" * 40, u"x" * 300, u"x" * 70000])
+        self._roundtrip({u"a": [1, 2.5, {u"b": b"\x00\xff"}], 1: b"x" * 300})
+        self._roundtrip([list(range(20)), dict((i, i) for i in range(20)), b"x" * 70000])
+        for i in (0, 1, 127, 128, 255, 256, 65535, 65536, 2**32 - 1, 2**32, 2**64 - 1,
+                -1, -32, -33, -128, -129, -32768, -32769, -2**31, -2**31 - 1, -2**63):
+            self._roundtrip(i)
+
+    def test_encoding(self):
+        assert self._roundtrip({u"a": 1}) == b"\x81\xa1a\x01"
+        assert self._roundtrip([-1, 200]) == b"\x92\xff\xcc\xc8"
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, packer._unpackb, b"\x92\x01")
+        self.assertRaises(ValueError, packer._unpackb, b"\x01\x02")
+        self.assertRaises(OverflowError, packer._packb, 2**64)
+        self.assertRaises(TypeError, packer._packb, object())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
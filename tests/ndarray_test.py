@@ -0,0 +1,131 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+from unittest import mock
+import streamrpc
+from streamrpc import ext
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def test_passthrough(a):
+    return a
+
+def test_sum(a):
+    return a.sum()
+
+def test_make(n):
+    return numpy.arange(n, dtype=numpy.float64).reshape(2, -1)
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class ExtensionTests(unittest.TestCase):
+    def _roundtrip(self, a, binary=True):
+        e = ext.Extensions(ndarray=True, binary=binary)
+        return e.load(e.export(a))
+
+    def test_dtypes(self):
+        for dtype in ["<f8", ">f8", "<i4", ">u2", "bool", "complex128", "S5", "<M8[s]"]:
+            a = numpy.arange(12).reshape(3, 4).astype(dtype)
+            b = self._roundtrip(a)
+            assert b.shape == (3, 4)
+            assert (a == b).all(), dtype
+            assert b.dtype.byteorder in "<|=", dtype
+
+    def test_structured(self):
+        a = numpy.zeros(3, dtype=[("x", "<f4"), ("y", ">i2")])
+        a["x"] = [1.5, 2.5, 3.5]
+        b = self._roundtrip(a, binary=False)
+        assert list(b["x"]) == [1.5, 2.5, 3.5]
+
+    def test_noncontiguous(self):
+        a = numpy.arange(100).reshape(10, 10)[::2, 1::3]
+        assert (self._roundtrip(a) == a).all()
+
+    def test_scalars(self):
+        e = ext.Extensions(ndarray=True)
+        assert e.export([numpy.float32(1.5), numpy.int64(3)]) == [1.5, 3]
+
+    def test_objects(self):
+        e = ext.Extensions(ndarray=True)
+        self.assertRaises(TypeError, e.export, numpy.array([None, 1]))
+
+    def test_without_numpy(self):
+        e = ext.Extensions(ndarray=True, binary=False)
+        wire = e.export(numpy.array([1, 2], dtype="<i2"))
+        with mock.patch("streamrpc.ext._numpy", return_value=None):
+            e = ext.Extensions(ndarray=True, binary=False)
+        assert e.load(wire) == {"__ndarray__": ["<i2", [2], b"\x01\x00\x02\x00"]}
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class XmlNdarrayTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process, ndarray=True)
+
+    def _shm(self):
+        return ""
+        
+    def _server(self):
+        proc = subprocess.Popen([sys.executable, "-mtests.ndarray_test", "serve", json.dumps(sys.path), self._servertype(), self._shm()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc)
+
+    def test_passthrough(self):
+        rpc = self._server()
+        a = numpy.random.random((1000, 100))
+        b = rpc.test_passthrough(a)
+        assert b.dtype == a.dtype and b.shape == a.shape
+        assert (a == b).all()
+
+    def test_nested(self):
+        rpc = self._server()
+        a = numpy.arange(10, dtype=numpy.int32)
+        b = rpc.test_passthrough({"key": [a, "text"]})
+        assert (b["key"][0] == a).all()
+        assert b["key"][1] == "text"
+
+    def test_scalar_result(self):
+        rpc = self._server()
+        assert rpc.test_sum(numpy.arange(10)) == 45
+
+    def test_result(self):
+        rpc = self._server()
+        assert (rpc.test_make(1000000) == numpy.arange(1000000).reshape(2, -1)).all()
+
+class JsonNdarrayTests(XmlNdarrayTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, ndarray=True)
+
+class MsgPackNdarrayTests(XmlNdarrayTests):
+    def _servertype(self):
+        return "streamrpc.MsgPackServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.MsgPackClient(process=process, ndarray=True)
+
+class ShmNdarrayTests(XmlNdarrayTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, ndarray=True, shm=True)
+
+    def _shm(self):
+        return "shm"
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(ndarray=True, shm=sys.argv[4] == "shm")
+        rpc.register_function(test_passthrough)
+        rpc.register_function(test_sum)
+        rpc.register_function(test_make)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
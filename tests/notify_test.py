@@ -0,0 +1,143 @@
+import unittest
+import sys, os, json, threading
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+from streamrpc import protocol
+
+_notes = []
+
+def note(value):
+    _notes.append(value)
+
+def notes():
+    return list(_notes)
+
+def note_each(n):
+    for i in range(n):
+        _notes.append(i)
+        yield i
+
+class NotifyTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+    def _process(self):
+        return subprocess.Popen([sys.executable, "-mtests.notify_test", "serve", json.dumps(sys.path), self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def test_notify(self):
+        rpc = self._clienttype(self._process())
+        assert rpc.notify.note(1) is None
+        rpc.notify.note("x" * 100000)
+        rpc.notify.no_such_method()
+        rpc.notify.note(1, 2) # Invalid params are not answered either
+        rpc.notify.note_each(3)
+        assert rpc.notes() == [1, "x" * 100000, 0, 1, 2]
+        rpc.close()
+
+    def test_batch(self):
+        rpc = self._clienttype(self._process())
+        with rpc.batch() as b:
+            b.notify.note(1)
+            f = b.notes()
+            b.notify.note(2)
+        assert f.result() == [1]
+        with rpc.batch() as b: # Only notifications, so nothing to wait for
+            b.notify.note(3)
+            b.notify.note(4)
+        assert rpc.notes() == [1, 2, 3, 4]
+        rpc.close()
+
+    def test_no_response(self):
+        proc = self._process()
+        rpc = self._clienttype(proc)
+        rpc.notify.note(1)
+        with rpc.batch() as b:
+            b.notify.note(2)
+        proc.stdin.close()
+        proc.wait()
+        assert proc.stdout.read() == b""
+        proc.stdout.close()
+
+class AutoDetectNotifyTests(NotifyTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+class MsgPackNotifyTests(NotifyTests):
+    def _servertype(self):
+        return "streamrpc.MsgPackServer"
+
+    def _clienttype(self, process):
+        return streamrpc.MsgPackClient(process=process)
+
+class ProtocolNotifyTests(unittest.TestCase):
+    def setUp(self):
+        self.p = protocol.JsonRpc()
+        self.p.register_function(note)
+        del _notes[:]
+
+    def _dispatch(self, obj):
+        return self.p.dispatch_request(json.dumps(obj).encode())
+
+    def test_notification(self):
+        assert self._dispatch({"jsonrpc": "2.0", "method": "note", "params": [1]}) is None
+        assert self._dispatch({"jsonrpc": "2.0", "method": "missing", "params": []}) is None
+        assert self._dispatch({"method": "note", "params": [2], "id": None}) is None # JSON-RPC 1.0
+        assert _notes == [1, 2]
+        assert list(protocol.messages(None)) == []
+
+    def test_null_id(self):
+        # A JSON-RPC 2.0 request with a null id is not a notification
+        rsp = json.loads(self._dispatch({"jsonrpc": "2.0", "method": "note", "params": [1], "id": None}).decode())
+        assert rsp == {"jsonrpc": "2.0", "result": None, "id": None}
+
+    def test_invalid_request(self):
+        rsp = json.loads(self._dispatch({"jsonrpc": "2.0", "params": []}).decode())
+        assert rsp["error"]["code"] == -32600
+
+    def test_batch(self):
+        rsp = json.loads(self._dispatch([
+            {"jsonrpc": "2.0", "method": "note", "params": [1]},
+            {"jsonrpc": "2.0", "method": "note", "params": [2], "id": 7},
+            {"jsonrpc": "2.0", "method": "missing", "params": []}]).decode())
+        assert rsp == [{"jsonrpc": "2.0", "result": None, "id": 7}]
+        assert self._dispatch([{"jsonrpc": "2.0", "method": "note", "params": [3]}]) is None
+        assert _notes == [1, 2, 3]
+
+    def test_encode(self):
+        req = json.loads(self.p.initiate_notification("note", [1], {}).decode())
+        assert req == {"jsonrpc": "2.0", "method": "note", "params": [1]}
+        req = json.loads(protocol.JsonRpc(version=1).initiate_notification("note", [1], {}).decode())
+        assert req == {"method": "note", "params": [1], "id": None}
+        self.assertRaises(NotImplementedError, protocol.XmlRpc().initiate_notification, "note", [1], {})
+
+class SocketNotifyTests(unittest.TestCase):
+    def test_socket(self):
+        del _notes[:]
+        server = streamrpc.SocketServer(("127.0.0.1", 0))
+        server.register_function(note)
+        server.register_function(notes)
+        thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+        thread.start()
+        try:
+            rpc = streamrpc.JsonClient(socket=streamrpc.connect(server.address))
+            rpc.notify.note(1)
+            rpc.notify.note(2)
+            assert rpc.notes() == [1, 2]
+        finally:
+            server.shutdown()
+            thread.join()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])()
+        rpc.register_function(note)
+        rpc.register_function(notes)
+        rpc.register_function(note_each)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
@@ -0,0 +1,78 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+
+peer = None
+
+def test_passthrough(a):
+    return a
+
+def test_callback(n):
+    # Calls back to the process that spawned this one
+    return sum(peer.progress(i) for i in range(n))
+
+def test_nested(n):
+    if n == 0:
+        return 0
+    return peer.test_nested(n - 1) + 1
+
+def test_fault():
+    raise streamrpc.Fault(42, "A Fault")
+
+class XmlPeerTests(unittest.TestCase):
+    def _peertype(self):
+        return "streamrpc.XmlPeer"
+        
+    def _peer(self):
+        global peer
+        proc = subprocess.Popen([sys.executable, "-mtests.peer_test", "serve",json.dumps(sys.path),self._peertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        peer = eval(self._peertype())(process=proc)
+        peer.register_function(lambda i: i * 2, "progress")
+        peer.register_function(test_nested)
+        return peer
+
+    def test_call(self):
+        rpc = self._peer()
+        assert rpc.test_passthrough([1, 2, 3]) == [1, 2, 3]
+
+    def test_callback(self):
+        rpc = self._peer()
+        assert rpc.test_callback(10) == sum(i * 2 for i in range(10))
+
+    def test_concurrent(self):
+        rpc = self._peer()
+        futures = [rpc.call_async("test_callback", n) for n in range(20)]
+        assert [f.result() for f in futures] == [sum(i * 2 for i in range(n)) for n in range(20)]
+
+    def test_fault(self):
+        rpc = self._peer()
+        try:
+            rpc.test_fault()
+        except streamrpc.Fault:
+            f = sys.exc_info()[1]
+            assert f.faultCode == 42
+        else:
+            assert False, "Expected a Fault"
+
+class JsonPeerTests(XmlPeerTests):
+    def _peertype(self):
+        return "streamrpc.JsonPeer"
+
+    def test_nested(self):
+        # Not possible with XML-RPC, where responses must be sent in request order
+        rpc = self._peer()
+        assert rpc.test_nested(6) == 6
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        peer = eval(sys.argv[3])()
+        peer.register_function(test_passthrough)
+        peer.register_function(test_callback)
+        peer.register_function(test_nested)
+        peer.register_function(test_fault)
+        peer.serve_forever()
+    else:
+        unittest.main(verbosity=2)
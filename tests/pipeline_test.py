@@ -0,0 +1,60 @@
+import unittest
+import sys, json
+import subprocess
+import streamrpc
+
+class XmlPipelineTests(unittest.TestCase):
+    def _server(self):
+        self.proc = subprocess.Popen([sys.executable, "-mtests." + self._testmodule(), "serve",json.dumps(sys.path),self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(self.proc)
+    
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+        
+    def _testmodule(self):
+        return "xmlrpc_test"
+
+    def test_many_in_flight(self):
+        rpc = self._server()
+        futures = [rpc.call_async("test_passthrough", i) for i in range(500)]
+        assert [f.result() for f in futures] == list(range(500))
+
+    def test_fault(self):
+        rpc = self._server()
+        f = rpc.call_async("test_fault")
+        ok = rpc.call_async("test_parameterless")
+        assert isinstance(f.exception(), streamrpc.Fault)
+        assert f.exception().faultCode == 42
+        assert ok.result() == "Value"
+
+    def test_mixed(self):
+        rpc = self._server()
+        f = rpc.call_async("test_parameters", "Hello", True)
+        value = rpc.test_passthrough([1, 2])
+        assert value == [1, 2]
+        assert f.result() == "Value: Hello, True"
+
+    def test_closed(self):
+        rpc = self._server()
+        assert rpc.call_async("test_parameterless").result() == "Value"
+        self.proc.kill()
+        self.proc.wait()
+        try:
+            rpc.call_async("test_parameterless").result(timeout=10)
+        except (EOFError, IOError):
+            pass
+        else:
+            assert False, "Expected an error"
+
+class JsonPipelineTests(XmlPipelineTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,108 @@
+import unittest
+import sys, os, json, time
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import streamrpc
+import streamrpc.pool
+
+def test_pid():
+    return os.getpid()
+
+def test_sleep(t):
+    time.sleep(t)
+    return os.getpid()
+
+def _exit_server():
+    os._exit(1)
+
+def test_fault():
+    raise streamrpc.Fault(42, "A Fault")
+
+class XmlPoolTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+
+    def _client(self):
+        return streamrpc.XmlClient
+
+    def _pool(self, **kwargs):
+        args = [sys.executable, "-mtests.pool_test", "serve", json.dumps(sys.path), self._servertype()]
+        self.pool = streamrpc.ClientPool(streamrpc.pool.spawn(args, self._client()), **kwargs)
+        return self.pool
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_spread(self):
+        rpc = self._pool(size=4)
+        assert len(rpc) == 4
+        pids = set(f.result() for f in [rpc.call_async("test_sleep", 0.2) for i in range(4)])
+        assert len(pids) == 4
+        assert os.getpid() not in pids
+
+    def test_least_loaded(self):
+        rpc = self._pool(size=2)
+        busy = rpc.call_async("test_sleep", 1)
+        pids = set(rpc.test_pid() for i in range(5))
+        assert len(pids) == 1
+        assert busy.result() not in pids
+
+    def test_fault(self):
+        rpc = self._pool(size=2)
+        try:
+            rpc.test_fault()
+        except streamrpc.Fault:
+            assert sys.exc_info()[1].faultCode == 42
+        else:
+            assert False, "Expected a Fault"
+        assert len(rpc) == 2
+
+    def test_replace_dead(self):
+        rpc = self._pool(size=2)
+        before = set(f.result() for f in [rpc.call_async("test_sleep", 0.2) for i in range(2)])
+        self.assertRaises(EOFError, rpc.test_exit)
+        for i in range(50):
+            pids = set(f.result() for f in [rpc.call_async("test_sleep", 0.2) for i in range(2)])
+            if len(pids) == 2:
+                break
+        assert len(rpc) == 2
+        assert len(pids & before) == 1
+
+    def test_spares(self):
+        rpc = self._pool(size=1, spares=1)
+        pid = rpc.test_pid()
+        self.assertRaises(EOFError, rpc.test_exit)
+        assert len(rpc) == 1
+        assert rpc.test_pid() != pid
+
+    def test_retries(self):
+        rpc = self._pool(size=2, retries=1)
+        busy = rpc.call_async("test_sleep", 0.5)
+        self.assertRaises(EOFError, rpc.test_exit) # The retry kills the other server too, after its current call
+        assert busy.result()
+
+    def test_clients(self):
+        factory = streamrpc.pool.spawn([sys.executable, "-mtests.pool_test", "serve", json.dumps(sys.path), self._servertype()], self._client())
+        self.pool = streamrpc.ClientPool(clients=[factory(), factory()])
+        self.assertRaises(EOFError, self.pool.test_exit)
+        assert len(self.pool) == 1
+        self.assertRaises(EOFError, self.pool.test_exit)
+        self.assertRaises(EOFError, self.pool.test_pid)
+
+class JsonPoolTests(XmlPoolTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+
+    def _client(self):
+        return streamrpc.JsonClient
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])()
+        rpc.register_function(test_pid)
+        rpc.register_function(test_sleep)
+        rpc.register_function(_exit_server, "test_exit")
+        rpc.register_function(test_fault)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
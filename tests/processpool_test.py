@@ -0,0 +1,100 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+import streamrpc.sync
+
+_dispatch = streamrpc.sync._worker_dispatch
+_request_type = None
+
+def test_pid():
+    return os.getpid()
+
+def test_server_pid():
+    return os.getpid()
+
+def test_sum_squares(n):
+    return sum(i * i for i in range(n))
+
+def test_exception():
+    raise Exception("A regular Python exception")
+
+def test_request_type():
+    return _request_type
+
+def _worker_dispatch(reqstr, received=None):
+    # Records what the server passes to the worker for the current request
+    global _request_type
+    _request_type = type(reqstr).__name__
+    return _dispatch(reqstr, received)
+
+class XmlProcessPoolTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+        
+    def _server(self, mode):
+        self.proc = subprocess.Popen([sys.executable, "-mtests.processpool_test", "serve",json.dumps(sys.path),self._servertype(), mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(self.proc)
+
+    def test_server_in_pool(self):
+        rpc = self._server("server")
+        pids = set(f.result() for f in [rpc.call_async("test_pid") for i in range(20)])
+        assert self.proc.pid not in pids
+        assert rpc.test_server_pid() != self.proc.pid
+
+    def test_function_in_pool(self):
+        rpc = self._server("function")
+        assert rpc.test_server_pid() == self.proc.pid
+        assert rpc.test_pid() != self.proc.pid
+
+    def test_raw_requests(self):
+        # Workers are passed the raw request documents
+        for mode in ("server", "function"):
+            rpc = self._server(mode)
+            assert rpc.test_request_type() == "bytes"
+            rpc.close()
+
+    def test_results(self):
+        rpc = self._server("function")
+        futures = [rpc.call_async("test_sum_squares", n) for n in range(50)]
+        assert [f.result() for f in futures] == [sum(i * i for i in range(n)) for n in range(50)]
+
+    def test_exception(self):
+        rpc = self._server("server")
+        try:
+            rpc.test_exception()
+        except streamrpc.Fault:
+            f = sys.exc_info()[1]
+            assert "A regular Python exception" in f.faultString
+        else:
+            assert False, "Expected a Fault"
+
+class JsonProcessPoolTests(XmlProcessPoolTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == "serve":
+        streamrpc.sync._worker_dispatch = _worker_dispatch
+        if sys.argv[4] == "server":
+            rpc = eval(sys.argv[3])(processes=2)
+            rpc.register_function(test_pid)
+            rpc.register_function(test_exception)
+            rpc.register_function(test_request_type)
+        else:
+            rpc = eval(sys.argv[3])()
+            rpc.register_function(test_pid, process=True)
+            rpc.register_function(test_sum_squares, process=True)
+            rpc.register_function(test_request_type, process=True)
+        rpc.register_function(test_server_pid)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
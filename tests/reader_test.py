@@ -0,0 +1,161 @@
+import unittest
+import os, fcntl, threading, time, gc
+import streamrpc
+from streamrpc.reader import StreamReader, StreamSelector
+
+def _pipe():
+    r, w = os.pipe()
+    fcntl.fcntl(r, fcntl.F_SETFL, fcntl.fcntl(r, fcntl.F_GETFL) | os.O_NONBLOCK)
+    return r, w
+
+class ReaderTests(unittest.TestCase):
+    def setUp(self):
+        self.fds = []
+
+    def tearDown(self):
+        for fd in self.fds:
+            os.close(fd)
+
+    def _pipe(self):
+        r, w = _pipe()
+        self.fds += [r, w]
+        return r, w
+
+    def test_read(self):
+        r, w = self._pipe()
+        reader = StreamReader(r, bufsize=16)
+        os.write(w, b"Hello, world")
+        assert reader.read(5) == b"Hello"
+        assert reader.pending() == 7
+        assert reader.read(100) == b", world"
+
+    def test_large_read(self):
+        r, w = self._pipe()
+        reader = StreamReader(r, bufsize=16)
+        os.write(w, b"x" * 1000)
+        assert reader.read(1000) == b"x" * 1000
+        os.write(w, b"y" * 1000)
+        buf = bytearray(1000)
+        assert reader.readinto(buf) == 1000
+        assert buf == b"y" * 1000
+
+    def test_prefix(self):
+        r, w = self._pipe()
+        reader = StreamReader(r, prefix=b"abc")
+        os.write(w, b"def")
+        assert reader.read(10) == b"abc"
+        assert reader.read(10) == b"def"
+
+    def test_wait(self):
+        r, w = self._pipe()
+        reader = StreamReader(r)
+        t = threading.Timer(0.2, os.write, (w, b"late"))
+        t.start()
+        assert reader.read(10) == b"late"
+        t.join()
+
+    def test_timeout(self):
+        r, w = self._pipe()
+        reader = StreamReader(r, timeout=0.1)
+        start = time.monotonic()
+        self.assertRaises(TimeoutError, reader.read, 10)
+        assert time.monotonic() - start >= 0.1
+        self.assertRaises(TimeoutError, reader.readinto, bytearray(10), 0.05)
+        os.write(w, b"data")
+        assert reader.read(10, timeout=0) == b"data"
+
+    def test_eof(self):
+        r, w = _pipe()
+        self.fds.append(r)
+        reader = StreamReader(r)
+        os.write(w, b"end")
+        os.close(w)
+        assert reader.read(10) == b"end"
+        assert reader.read(10) == b""
+
+    def test_selector(self):
+        sel = StreamSelector()
+        pipes = [self._pipe() for i in range(100)]
+        readers = [StreamReader(r) for r, w in pipes]
+        for i, reader in enumerate(readers):
+            sel.register(reader, i)
+        assert sel.select(0) == []
+        os.write(pipes[3][1], b"three")
+        os.write(pipes[42][1], b"forty-two")
+        ready = sorted(sel.select(1), key=lambda r: r[1])
+        assert [i for reader, i in ready] == [3, 42]
+        assert ready[0][0].read(1) == b"t"
+        assert ready[1][0].read(100) == b"forty-two"
+        # Buffered data is reported even though the pipe is empty
+        assert [i for reader, i in sel.select(1)] == [3]
+        assert readers[3].read(10) == b"hree"
+        sel.unregister(readers[3])
+        os.write(pipes[3][1], b"more")
+        assert sel.select(0) == []
+        sel.close()
+
+class OwnerTests(unittest.TestCase):
+    def test_dropped_file(self):
+        # Only the server and client refer to the file objects, whose
+        # descriptors must stay open
+        r1, w1 = os.pipe()
+        r2, w2 = os.pipe()
+        server = streamrpc.JsonServer(input=os.fdopen(r1, "rb"), output=os.fdopen(w2, "wb"))
+        server.register_function(len)
+        client = streamrpc.JsonClient(input=os.fdopen(r2, "rb"), output=os.fdopen(w1, "wb"))
+        gc.collect()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        assert client.len("abc") == 3
+        client.close()
+        thread.join()
+
+def _epoll_fds():
+    gc.collect() # Only count those that are kept
+    fds = []
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            if os.readlink("/proc/self/fd/" + fd) == "anon_inode:[eventpoll]":
+                fds.append(fd)
+        except OSError: # Closed meanwhile
+            pass
+    return len(fds)
+
+@unittest.skipUnless(os.path.isdir("/proc/self/fd"), "Needs /proc")
+class CloseTests(unittest.TestCase):
+    def test_client(self):
+        before = _epoll_fds()
+        for i in range(5):
+            r, w = os.pipe()
+            client = streamrpc.JsonClient(input=os.fdopen(r, "rb"), output=os.fdopen(w, "wb"))
+            client.close()
+        assert _epoll_fds() == before
+
+    def test_receiver(self):
+        # Released by the receiver thread, once the server has gone
+        before = _epoll_fds()
+        r1, w1 = os.pipe()
+        r2, w2 = os.pipe()
+        server = streamrpc.JsonServer(input=os.fdopen(r1, "rb"), output=os.fdopen(w2, "wb"))
+        server.register_function(len)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = streamrpc.JsonClient(input=os.fdopen(r2, "rb"), output=os.fdopen(w1, "wb"))
+        assert client.call_async("len", "abc").result() == 3
+        client.close()
+        thread.join()
+        for i in range(100):
+            if _epoll_fds() == before:
+                break
+            time.sleep(0.01)
+        assert _epoll_fds() == before
+
+    def test_peer(self):
+        before = _epoll_fds()
+        r, w = os.pipe()
+        peer = streamrpc.JsonPeer(input=os.fdopen(r, "rb"), output=os.fdopen(w, "wb"))
+        peer.close()
+        assert _epoll_fds() == before
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
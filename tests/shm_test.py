@@ -0,0 +1,112 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+from streamrpc.shm import ShmChannel
+
+def test_length(data):
+    return len(data)
+
+def test_passthrough(data):
+    return data
+
+def test_make(n):
+    return b"\x01" * n
+
+def _repeat(data, n):
+    for i in range(n):
+        yield data
+
+def test_type(data):
+    return type(data).__name__
+
+def _segments(channel):
+    return [n for n in os.listdir(channel.directory) if n.startswith("streamrpc-%d-" % os.getpid())]
+
+class ChannelTests(unittest.TestCase):
+    def test_roundtrip(self):
+        channel = ShmChannel(threshold=10)
+        names = []
+        obj = channel.export([b"small", {"big": b"x" * 100}, bytearray(b"y" * 10)], names)
+        assert obj[0] == b"small"
+        assert list(obj[1]["big"]) == ["__shm__"]
+        assert len(names) == 2
+        assert len(_segments(channel)) == 2
+        loaded = channel.load(obj)
+        assert loaded[1]["big"] == b"x" * 100
+        assert loaded[2] == b"y" * 10
+        assert _segments(channel) == [] # Removed by the receiver
+
+    def test_remove(self):
+        channel = ShmChannel(threshold=10)
+        names = []
+        channel.export(b"x" * 100, names)
+        channel.remove(names)
+        assert _segments(channel) == []
+        channel.remove(names)
+
+    def test_invalid_handle(self):
+        channel = ShmChannel()
+        self.assertRaises(ValueError, channel.load, {"__shm__": "../etc/passwd"})
+        self.assertRaises(OSError, channel.load, {"__shm__": "streamrpc-1-0123"})
+
+class XmlShmTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process, shm):
+        return streamrpc.XmlClient(process=process, shm=shm)
+        
+    def _server(self):
+        self.channel = ShmChannel(threshold=1024)
+        proc = subprocess.Popen([sys.executable, "-mtests.shm_test", "serve", json.dumps(sys.path), self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc, self.channel)
+
+    def test_argument(self):
+        rpc = self._server()
+        assert rpc.test_length(b"\x00" * 10000000) == 10000000
+        assert rpc.test_type(b"\x00" * 10000) == "memoryview"
+        assert _segments(self.channel) == []
+
+    def test_result(self):
+        rpc = self._server()
+        data = rpc.test_make(5000000)
+        assert isinstance(data, memoryview)
+        assert data == b"\x01" * 5000000
+
+    def test_passthrough(self):
+        rpc = self._server()
+        data = bytes(range(256)) * 1000
+        assert rpc.test_passthrough([data, {"key": data}]) == [data, {"key": data}]
+
+    def test_stream(self):
+        rpc = self._server()
+        assert list(rpc.call_stream("repeat", b"z" * 2000, 250)) == [b"z" * 2000] * 250
+
+class JsonShmTests(XmlShmTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process, shm):
+        return streamrpc.JsonClient(process=process, shm=shm)
+
+class MsgPackShmTests(XmlShmTests):
+    def _servertype(self):
+        return "streamrpc.MsgPackServer"
+        
+    def _clienttype(self, process, shm):
+        return streamrpc.MsgPackClient(process=process, shm=shm)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(shm=ShmChannel(threshold=1024))
+        rpc.register_function(test_length)
+        rpc.register_function(test_passthrough)
+        rpc.register_function(test_make)
+        rpc.register_function(test_type)
+        rpc.register_function(_repeat, "repeat")
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
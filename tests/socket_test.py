@@ -1,2 +1,84 @@
-from . import xmlrpc_test
+from . import xmlrpc_test, stream_test
+import unittest
+import os, sys, tempfile, shutil, threading
 import streamrpc
+
+class SocketTests(unittest.TestCase):
+    def _address(self):
+        return ("127.0.0.1", 0)
+
+    def setUp(self):
+        self.server = streamrpc.SocketServer(self._address())
+        self.server.register_function(xmlrpc_test.test_parameters)
+        self.server.register_function(xmlrpc_test.test_passthrough)
+        self.server.register_function(xmlrpc_test.test_fault)
+        self.server.register_function(stream_test._generate, "test_generate")
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def _connect(self):
+        return streamrpc.connect(self.server.address)
+
+    def test_xml(self):
+        rpc = streamrpc.XmlClient(socket=self._connect())
+        assert rpc.test_parameters("Hello", True) == "Value: Hello, True"
+        assert rpc.test_passthrough([1, 2, 3]) == [1, 2, 3]
+
+    def test_json(self):
+        rpc = streamrpc.JsonClient(socket=self._connect())
+        assert rpc.test_parameters("Hello", True) == "Value: Hello, True"
+        try:
+            rpc.test_fault()
+        except streamrpc.Fault:
+            assert sys.exc_info()[1].faultCode == 42
+        else:
+            assert False, "Expected a Fault"
+
+    def test_framed(self):
+        rpc = streamrpc.JsonClient(socket=self._connect(), framed=True)
+        assert rpc.test_passthrough("x" * 100000) == "x" * 100000
+        rpc = streamrpc.MsgPackClient(socket=self._connect())
+        assert rpc.test_passthrough(b"\x00" * 100000) == b"\x00" * 100000
+
+    def test_large(self):
+        rpc = streamrpc.XmlClient(socket=self._connect())
+        input = list(range(100000))
+        assert rpc.test_passthrough(input) == input
+
+    def test_stream(self):
+        rpc = streamrpc.JsonClient(socket=self._connect())
+        items = rpc.call_stream("test_generate", 200000)
+        assert rpc.test_passthrough(1) == 1
+        assert list(items) == list(range(200000))
+        rpc = streamrpc.XmlClient(socket=self._connect())
+        assert list(rpc.call_stream("test_generate", 200000)) == list(range(200000))
+
+    def test_many_connections(self):
+        clients = []
+        for i in range(50):
+            if i % 2:
+                clients.append(streamrpc.JsonClient(socket=self._connect()))
+            else:
+                clients.append(streamrpc.XmlClient(socket=self._connect()))
+        futures = [c.call_async("test_passthrough", i) for i, c in enumerate(clients) for j in range(10)]
+        assert [f.result() for f in futures] == [i for i in range(50) for j in range(10)]
+
+class UnixSocketTests(SocketTests):
+    def _address(self):
+        self.tempdir = tempfile.mkdtemp()
+        return os.path.join(self.tempdir, "rpc.sock")
+
+    def tearDown(self):
+        SocketTests.tearDown(self)
+        assert os.listdir(self.tempdir) == [] # The socket is removed on close
+        shutil.rmtree(self.tempdir)
+
+if not hasattr(__import__("socket"), "AF_UNIX"):
+    del UnixSocketTests
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
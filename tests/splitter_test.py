@@ -0,0 +1,31 @@
+import unittest
+import json
+from streamrpc.splitter import Splitter
+
+class SplitterTests(unittest.TestCase):
+    def _split(self, format, docs, sep, chunk):
+        data = sep.join(docs)
+        s = Splitter(format)
+        out = []
+        for i in range(0, len(data), chunk):
+            out += s.feed(data[i:i+chunk])
+        return out
+
+    def test_json(self):
+        docs = [json.dumps({"a": "x\\\"}{[", "b": [1, {}]}).encode("utf8"), b'[1,2]', b'{}']
+        for chunk in (1, 2, 5, 1000):
+            assert self._split("json", docs, b" \n", chunk) == docs
+
+    def test_xml(self):
+        docs = [b'<?xml version="1.0"?>\n<methodCall><methodName>m</methodName><params></params></methodCall>',
+            b'<params><param><value><string>a&lt;&gt;</string></value></param></params>',
+            b'<!-- a > b --><a><b/><![CDATA[<x>]]></a>']
+        for chunk in (1, 3, 7, 1000):
+            assert self._split("xml", docs, b"\n", chunk) == docs
+
+    def test_maxdocsize(self):
+        s = Splitter("json", maxdocsize=10)
+        self.assertRaises(ValueError, s.feed, b'{"a": "0123456789"')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,180 @@
+import unittest
+import sys, os, json
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import time, threading
+import subprocess
+import streamrpc
+
+def _generate(n):
+    for i in range(n):
+        yield i
+
+def _generate_fault(n):
+    for i in range(n):
+        yield i
+    raise streamrpc.Fault(42, "A Fault")
+
+def _slow(n):
+    for i in range(n):
+        time.sleep(0.2)
+        yield i
+
+_produced = [0]
+
+def _blocks(n):
+    for i in range(n):
+        _produced[0] = i + 1
+        yield "x" * 1000
+
+def test_list(n):
+    return list(range(n))
+
+def test_scalar():
+    return "Value"
+
+def test_passthrough(a):
+    return a
+
+class XmlStreamTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+        
+    def _server(self, mode="inline"):
+        proc = subprocess.Popen([sys.executable, "-mtests.stream_test", "serve", json.dumps(sys.path), self._servertype(), mode], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc)
+
+    def test_stream(self):
+        rpc = self._server()
+        assert list(rpc.call_stream("test_generate", 100000)) == list(range(100000))
+
+    def test_lazy(self):
+        rpc = self._server()
+        items = rpc.call_stream("test_generate", 1000)
+        assert next(items) == 0
+        assert next(items) == 1
+        assert list(items) == list(range(2, 1000))
+
+    def test_empty(self):
+        rpc = self._server()
+        assert list(rpc.call_stream("test_generate", 0)) == []
+
+    def test_fault(self):
+        rpc = self._server()
+        items = []
+        try:
+            for i in rpc.call_stream("test_generate_fault", 250):
+                items.append(i)
+        except streamrpc.Fault:
+            assert items == list(range(250))
+        else:
+            assert False, "Expected a Fault"
+        assert rpc.test_passthrough(1) == 1
+
+    def test_list(self):
+        rpc = self._server()
+        assert list(rpc.call_stream("test_list", 10)) == list(range(10))
+
+    def test_scalar(self):
+        rpc = self._server()
+        self.assertRaises(TypeError, list, rpc.call_stream("test_scalar"))
+
+    def test_not_streamed(self):
+        rpc = self._server()
+        assert rpc.test_generate(10) == list(range(10))
+
+    def test_interleaved(self):
+        rpc = self._server()
+        items = rpc.call_stream("test_generate", 1000)
+        assert next(items) == 0
+        assert rpc.test_passthrough("x") == "x"
+        assert list(items) == list(range(1, 1000))
+
+    def test_async(self):
+        rpc = self._server()
+        future = rpc.call_async("test_passthrough", 1)
+        items = rpc.call_stream("test_generate", 1000)
+        assert future.result() == 1
+        assert list(items) == list(range(1000))
+
+    def test_thread_pool(self):
+        rpc = self._server("threads")
+        streams = [rpc.call_stream("test_generate", 500) for i in range(10)]
+        assert [list(s) for s in streams] == [list(range(500))] * 10
+
+class JsonStreamTests(XmlStreamTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+
+    def test_slow_stream(self):
+        # Other responses are written while a stream is being produced
+        rpc = self._server("threads")
+        assert rpc.call_async("test_passthrough", 0).result() == 0
+        items = rpc.call_stream("test_slow", 5)
+        start = time.time()
+        assert rpc.test_passthrough(1) == 1
+        assert time.time() - start < 0.5
+        assert list(items) == list(range(5))
+
+class FramedJsonStreamTests(JsonStreamTests):
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process, framed=True)
+
+class MsgPackStreamTests(JsonStreamTests):
+    def _servertype(self):
+        return "streamrpc.MsgPackServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.MsgPackClient(process=process)
+
+class StreamBufferTests(unittest.TestCase):
+    def setUp(self):
+        self.server = streamrpc.SocketServer(("127.0.0.1", 0))
+        self.server.register_function(_blocks, "blocks")
+        self.server.register_function(test_passthrough)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.start()
+        self.rpc = streamrpc.JsonClient(socket=streamrpc.connect(self.server.address))
+        assert self.rpc.call_async("test_passthrough", 0).result() == 0 # Starts the receiver
+
+    def tearDown(self):
+        self.rpc.close()
+        self.server.shutdown()
+        self.thread.join()
+
+    def test_bounded(self):
+        # A slow reader holds back the server, instead of buffering the stream
+        _produced[0] = 0
+        items = self.rpc.call_stream("blocks", 50000)
+        assert next(items) == "x" * 1000
+        time.sleep(0.5)
+        stalled = _produced[0]
+        time.sleep(0.3)
+        assert _produced[0] == stalled < 50000
+        assert len(list(items)) == 49999
+
+    def test_abandoned(self):
+        items = self.rpc.call_stream("blocks", 50000)
+        next(items)
+        time.sleep(0.2)
+        items.close()
+        assert self.rpc.test_passthrough(1) == 1
+
+if __name__ == '__main__':
+    if len(sys.argv) > 4 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(max_workers=4 if sys.argv[4] == "threads" else None)
+        rpc.register_function(_generate, "test_generate")
+        rpc.register_function(_generate_fault, "test_generate_fault")
+        rpc.register_function(_slow, "test_slow")
+        rpc.register_function(test_list)
+        rpc.register_function(test_scalar)
+        rpc.register_function(test_passthrough)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
@@ -0,0 +1,74 @@
+import unittest
+import sys, os, json, time
+if len(sys.argv) > 2 and sys.argv[1] == "serve":
+    sys.path += json.loads(sys.argv[2])
+import subprocess
+import streamrpc
+
+def test_sleep(delay, value):
+    time.sleep(delay)
+    return value
+
+def test_fault():
+    raise streamrpc.Fault(42, "A Fault")
+
+class XmlThreadPoolTests(unittest.TestCase):
+    def _servertype(self):
+        return "streamrpc.XmlServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.XmlClient(process=process)
+        
+    def _server(self):
+        proc = subprocess.Popen([sys.executable, "-mtests.threadpool_test", "serve",json.dumps(sys.path),self._servertype()], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        return self._clienttype(proc)
+
+    def test_concurrent(self):
+        rpc = self._server()
+        assert rpc.test_sleep(0, "warmup") == "warmup"
+        start = time.time()
+        futures = [rpc.call_async("test_sleep", 0.5, i) for i in range(8)]
+        assert [f.result() for f in futures] == list(range(8))
+        assert time.time() - start < 2
+
+    def test_fault(self):
+        rpc = self._server()
+        f = rpc.call_async("test_fault")
+        assert f.exception().faultCode == 42
+        
+    def test_order(self):
+        rpc = self._server()
+        done = []
+        slow = rpc.call_async("test_sleep", 0.5, "slow")
+        fast = rpc.call_async("test_sleep", 0, "fast")
+        slow.add_done_callback(lambda f: done.append(f.result()))
+        fast.add_done_callback(lambda f: done.append(f.result()))
+        assert slow.result() == "slow"
+        assert fast.result() == "fast"
+        assert done == self._expected_order()
+
+    def _expected_order(self):
+        return ["slow", "fast"]
+
+class JsonThreadPoolTests(XmlThreadPoolTests):
+    def _servertype(self):
+        return "streamrpc.JsonServer"
+        
+    def _clienttype(self, process):
+        return streamrpc.JsonClient(process=process)
+        
+    def _expected_order(self):
+        return ["fast", "slow"]
+
+class AutoDetectThreadPoolTests(JsonThreadPoolTests):
+    def _servertype(self):
+        return "streamrpc.Server"
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "serve":
+        rpc = eval(sys.argv[3])(max_workers=8)
+        rpc.register_function(test_sleep)
+        rpc.register_function(test_fault)
+        rpc.serve_forever()
+    else:
+        unittest.main(verbosity=2)
@@ -0,0 +1,73 @@
+import unittest
+import io
+import datetime
+import streamrpc
+from streamrpc import protocol, splitter
+from streamrpc.xmlstream import XmlDecoder, XmlMessage, loads
+
+class XmlDecoderTests(unittest.TestCase):
+    def _decode(self, data, chunk, **kw):
+        d = XmlDecoder(**kw)
+        out = []
+        for i in range(0, len(data), chunk):
+            out += d.feed(data[i:i+chunk])
+        return out
+
+    def test_messages(self):
+        docs = [protocol.xmlrpc_dumps((1, u"a<åäö>", [1.5, {"b": None}]), "m", allow_none=True),
+            b'<!-- a > b --><params><param><value><string>x</string></value></param></params>',
+            b"<streamChunk>" + protocol.xmlrpc_dumps(([1, 2],)) + b"</streamChunk>",
+            protocol.xmlrpc_dumps(streamrpc.Fault(42, "A Fault"), methodresponse=True)]
+        data = b"\n".join(docs)
+        for chunk in (1, 3, 7, len(data)):
+            msgs = self._decode(data, chunk)
+            assert [m.root for m in msgs] == ["methodCall", "params", "streamChunk", "methodResponse"]
+            assert msgs[0].loads() == ((1, u"a<åäö>", [1.5, {"b": None}]), "m")
+            assert msgs[1].loads() == (("x",), None)
+            assert msgs[2].loads() == (([1, 2],), None)
+            self.assertRaises(streamrpc.Fault, msgs[3].loads)
+            assert [len(m) for m in msgs] == [len(d.rstrip()) for d in docs]
+
+    def test_pis(self):
+        data = protocol.xmlrpc_dumps((1,), "m").replace(b"<methodCall>", b"<methodCall><?streamrpc stream?>")
+        msg, = self._decode(data + b"<?after?>", 5)
+        assert msg.pis == [("streamrpc", "stream")]
+
+    def test_datetime(self):
+        data = protocol.xmlrpc_dumps((datetime.datetime(2015, 1, 2, 3, 4, 5),), "m")
+        assert self._decode(data, 10, use_datetime=True)[0].params == (datetime.datetime(2015, 1, 2, 3, 4, 5),)
+
+    def test_memoryview(self):
+        data = protocol.xmlrpc_dumps((1,), "m") * 2
+        assert [m.params for m in XmlDecoder().feed(memoryview(data))] == [(1,), (1,)]
+
+    def test_maxdocsize(self):
+        data = protocol.xmlrpc_dumps(("x" * 200,), "m")
+        self.assertRaises(ValueError, self._decode, data, 50, maxdocsize=100)
+
+    def test_malformed(self):
+        self.assertRaises(Exception, XmlDecoder().feed, b"<methodCall></params>")
+        self.assertRaises(ValueError, loads, b"<params>")
+        self.assertRaises(ValueError, loads, protocol.xmlrpc_dumps((1,), "m") * 2)
+
+    def test_splitfile(self):
+        data = b"".join(protocol.xmlrpc_dumps((i,), "m") for i in range(100))
+        msgs = list(splitter.splitfile(io.BytesIO(data[5:]), XmlDecoder(), preamble=data[:5], bufsize=100))
+        assert [m.params[0] for m in msgs] == list(range(100))
+
+class XmlProtocolTests(unittest.TestCase):
+    def test_decoded(self):
+        # Decoded messages are accepted wherever the raw message is
+        p = protocol.XmlRpc()
+        p.register_function(lambda a: a * 2, "double")
+        req = protocol.xmlrpc_dumps((21,), "double")
+        msg, = p.splitter().feed(req)
+        assert isinstance(msg, XmlMessage)
+        assert p.dispatch_request(msg) == p.dispatch_request(req)
+        results = []
+        p.initiate_request("double", (1,), None, lambda r, e: results.append(r))
+        p.handle_response(loads(p.dispatch_request(req)))
+        assert results == [42]
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
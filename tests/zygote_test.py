@@ -0,0 +1,103 @@
+import unittest
+import sys, os, json, time
+if len(sys.argv) > 2 and sys.argv[1] in ("serve", "zygote"):
+    sys.path += json.loads(sys.argv[2])
+import socket
+import shutil
+import tempfile
+import subprocess
+import streamrpc
+import streamrpc.zygote
+
+_state = []
+
+def test_pid():
+    return os.getpid()
+
+def test_append(value):
+    _state.append(value)
+    return _state
+
+def test_log(message):
+    sys.stderr.write(message + "\n")
+    return True
+
+def _setup(rpc):
+    rpc.register_function(test_pid)
+    rpc.register_function(test_append)
+    rpc.register_function(test_log)
+
+def _ready():
+    sys.stdout.write("%d\n" % os.getpid())
+    sys.stdout.flush()
+
+class ZygoteTests(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tempdir, "zygote.sock")
+        self.zygote = subprocess.Popen([sys.executable, "-mtests.zygote_test", "zygote", json.dumps(sys.path), self.address], stdout=subprocess.PIPE)
+        self.pid = int(self.zygote.stdout.readline())
+
+    def tearDown(self):
+        self.zygote.terminate()
+        self.zygote.wait()
+        self.zygote.stdout.close()
+        assert not os.path.exists(self.address)
+        shutil.rmtree(self.tempdir)
+
+    def _relay(self, **kw):
+        return subprocess.Popen([sys.executable, "-mstreamrpc.zygote", self.address], stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kw)
+
+    def test_forked(self):
+        pids = set()
+        for client in (streamrpc.JsonClient, streamrpc.XmlClient, streamrpc.MsgPackClient):
+            relay = self._relay()
+            rpc = client(process=relay)
+            pid = rpc.test_pid()
+            assert pid not in (self.pid, relay.pid) and pid not in pids
+            pids.add(pid)
+            # Every job gets a fresh fork, with nothing left from earlier jobs
+            assert rpc.test_append(client.__name__) == [client.__name__]
+            rpc.close()
+            assert relay.wait() == 0
+
+    def test_concurrent(self):
+        relays = [self._relay() for i in range(4)]
+        clients = [streamrpc.JsonClient(process=r) for r in relays]
+        futures = [rpc.call_async("test_pid") for rpc in clients]
+        assert len(set(f.result() for f in futures)) == 4
+        for rpc, relay in zip(clients, relays):
+            rpc.close()
+            assert relay.wait() == 0
+
+    def test_stderr(self):
+        relay = self._relay(stderr=subprocess.PIPE)
+        rpc = streamrpc.JsonClient(process=relay)
+        assert rpc.test_log("Hello")
+        rpc.close()
+        assert relay.wait() == 0
+        assert relay.stderr.read() == b"Hello\n"
+        relay.stderr.close()
+
+    def test_invalid(self):
+        # A connection that is not a relay is dropped, and the zygote goes on
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.address)
+        sock.sendall(b"hello")
+        assert sock.recv(1) == b""
+        sock.close()
+        rpc = streamrpc.JsonClient(process=self._relay())
+        assert rpc.test_pid() != self.pid
+        rpc.close()
+
+    def test_missing(self):
+        relay = subprocess.Popen([sys.executable, "-mstreamrpc.zygote", os.path.join(self.tempdir, "missing.sock")], stderr=subprocess.PIPE)
+        assert relay.wait() == 1
+        assert b"missing.sock" in relay.stderr.read()
+        relay.stderr.close()
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "zygote":
+        streamrpc.zygote.serve(sys.argv[3], _setup, ready=_ready)
+    else:
+        unittest.main(verbosity=2)